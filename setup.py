@@ -3,7 +3,6 @@
 
 from setuptools import setup, find_packages
 
-
 # The information here can also be placed in setup.cfg - better separation of
 # logic and declaration, and simpler if you include description/version in a file.
 setup(
@@ -18,9 +17,17 @@ setup(
     # declare your packages
     packages=find_packages(where="src", exclude=("tests",)),
     package_dir={"": "src"},
+    # reduced openSMILE config of the jitter evaluator
+    package_data={"speech_gen_eval": ["*.conf"]},
+    # optional onnxruntime execution backend, see `--backend`,
+    # and inotify for `speech-gen-eval watch` (polls the directory without it)
+    extras_require={
+        "onnx": ["onnx", "onnxruntime"],
+        "watch": ["inotify_simple"],
+    },
     # declare your scripts
     entry_points="""\
      [console_scripts]
      speech-gen-eval = speech_gen_eval.main:main
-    """
+    """,
 )
@@ -6,16 +6,14 @@ https://ai.meta.com/research/publications/meta-audiobox-aesthetics-unified-autom
 """
 
 import json
-import os
+import logging
 
-import numpy as np
 import torch
-import tqdm
-from audiobox_aesthetics.cli import DEFAULT_CKPT_URL, download_file
 from audiobox_aesthetics.infer import AesWavlmPredictorMultiOutput
 
-from speech_gen_eval import evaluator
-from speech_gen_eval.audio_dir import get_audio_paths
+from speech_gen_eval import evaluator, model_store, monitoring, precision, profiling
+from speech_gen_eval.audio_dir import converted_durations, get_audio_items
+from speech_gen_eval.batching import duration_batches
 
 
 class AestheticsEvaluator(evaluator.Evaluator):
@@ -28,10 +26,17 @@ class AestheticsEvaluator(evaluator.Evaluator):
     - PQ: Production Quality
     """
 
-    _gpu_batch_size = 8
-    _local_ckpt_path = os.path.expanduser(
-        "~/.cache/audiobox_aesthetics/audiobox_aesthetics.pth"
-    )
+    # batches of similar duration, more short utterances fit the padded audio budget
+    _gpu_batch_size = 32
+    _batch_seconds = 160.0
+    rtf = 0.15
+    supported_precisions = ("fp32", "bf16", "int8")
+    _axes = [
+        ("CE", "enjoyment"),
+        ("CU", "usefullness"),
+        ("PC", "complexity"),
+        ("PQ", "quality"),
+    ]
 
     def __init__(
         self,
@@ -44,9 +49,7 @@ class AestheticsEvaluator(evaluator.Evaluator):
         self._audio_dir = generated_audio
         self._ignore_errors = ignore_errors
 
-        if not os.path.isfile(self._local_ckpt_path):
-            os.makedirs(os.path.dirname(self._local_ckpt_path), exist_ok=True)
-            download_file(DEFAULT_CKPT_URL, self._local_ckpt_path)
+        self._local_ckpt_path = model_store.get_model_path("aesthetics")
 
     def get_info(self):
         """
@@ -56,29 +59,66 @@ class AestheticsEvaluator(evaluator.Evaluator):
         """
         return "Aesthetic evaluation"
 
-    def get_metric(self):
+    def _load_model(self):
+        model = AesWavlmPredictorMultiOutput(self._local_ckpt_path)
+        model.setup_model()
+        if self.precision == "int8":
+            model.model = precision.quantize_int8(model.model)
+        elif self.precision == "bf16":
+            # WavLM encoder has its own autocast, which is off in the released config
+            model.model.precision = torch.bfloat16
+            model.model.enable_autocast = True
+        return model
+
+    def get_utterance_stats(self):
         """
-        Get the metric
+        Get sums of the aesthetics scores for each of the utterances
+        Returns:
+            dict[str, dict[str, float]]: utterance id -> statistics name -> value
         """
-        self._model = AesWavlmPredictorMultiOutput(self._local_ckpt_path)
-        self._model.setup_model()
+        with profiling.stage("model_load"):
+            if self.precision != "fp32" and torch.cuda.is_available():
+                logging.warning(f"{self.precision} is a CPU mode, running in fp32")
+                self.precision = "fp32"
+            self._model = self._get_model(
+                f"aesthetics:{self.precision}", self._load_model
+            )
 
-        audio_paths = get_audio_paths(self._audio_dir, self._ids)
-        metadata = [{"path": path} for path in audio_paths]
-        outputs = []
+        items = get_audio_items(self._audio_dir, self._ids)
+        utterance_stats = {}
         batch_size = self._gpu_batch_size if torch.cuda.is_available() else 1
-        for ii in tqdm.tqdm(range(0, len(metadata), batch_size)):
-            results_str = self._model.forward(metadata[ii : ii + batch_size])
-            results = [json.loads(x) for x in results_str]
-            outputs.extend(results)
+        batches = duration_batches(
+            items,
+            batch_size,
+            self._batch_seconds,
+            durations=converted_durations(self._audio_dir),
+        )
+        for batch in monitoring.progress(batches, items=len):
+            batch_names, batch_items = zip(*batch)
+            metadata = [
+                (
+                    {"path": item}
+                    if isinstance(item, str)
+                    else {"path": torch.from_numpy(item)[None], "sample_rate": 16000}
+                )
+                for item in batch_items
+            ]
+            # decoding happens inside of the predictor
+            with profiling.stage("inference", items=len(metadata)):
+                results_str = self._model.forward(metadata)
+            for name, result_str in zip(batch_names, results_str):
+                result = json.loads(result_str)
+                stats = {f"{key}_sum": result[key] for key, _ in self._axes}
+                stats["count"] = 1
+                utterance_stats[name] = stats
+        return utterance_stats
 
-        metrics = []
-        for key, name in [
-            ("CE", "enjoyment"),
-            ("CU", "usefullness"),
-            ("PC", "complexity"),
-            ("PQ", "quality"),
-        ]:
-            values = [x[key] for x in outputs]
-            metrics.append((f"aesthetics_{name}", float(np.mean(values))))
-        return metrics
+    @classmethod
+    def metrics_from_stats(cls, stats):
+        """
+        Get the mean aesthetics scores from the summed statistics
+        """
+        return [
+            (f"aesthetics_{name}", stats[f"{key}_sum"] / stats["count"])
+            for key, name in cls._axes
+        ]
@@ -1,25 +1,41 @@
 """
 Copyright 2025 Balacoon
 
-Audio directory - utilities for converting audio files
+Audio directory - utilities for converting audio files,
+read from a directory or from tar/zip shards
 """
 
 import concurrent.futures
+import glob
+import hashlib
+import io
 import logging
+import mmap
 import os
 import shutil
 import subprocess
+import tarfile
 import tempfile
+import time
+import zipfile
+from collections.abc import Mapping
 from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
 
 import numpy as np
-import resampy
-import torch
-import torchaudio
 import soundfile as sf
 
+from speech_gen_eval import monitoring, profiling, threads
+
+audio_extensions = [".wav", ".mp3", ".flac", ".ogg"]
+_archive_extensions = [".tar", ".zip"]
+# directory of `convert_audio_dir` -> id -> duration of the converted audio, seconds
+_converted_durations: dict[str, dict[str, float]] = {}
+# bytes hashed at once by `audio_hash`
+_hash_chunk_size = 1 << 22
+
 
 def get_audio_path(directory: str, name: str) -> Optional[str]:
     """
@@ -30,9 +46,8 @@ def get_audio_path(directory: str, name: str) -> Optional[str]:
     Returns:
         Optional[str]: The path to the audio file if found, otherwise None
     """
-    extensions = [".wav", ".mp3", ".flac", ".ogg"]
     file_path = None
-    for ext in extensions:
+    for ext in audio_extensions:
         candidate = os.path.join(directory, name + ext)
         if os.path.exists(candidate):
             file_path = candidate
@@ -40,31 +55,248 @@ def get_audio_path(directory: str, name: str) -> Optional[str]:
     return file_path
 
 
-def _read_audio(directory: str, name: str, sample_rate: int) -> torch.Tensor:
+class AudioSource:
+    """
+    Audio files of a test set by id, see `get_audio_source`
+    """
+
+    def find(self, name: str) -> Optional[str]:
+        """
+        Get the location of the audio of the id in the source, None if it is missing
+        """
+        raise NotImplementedError
+
+    def path(self, name: str) -> Optional[str]:
+        """
+        Get the path of the audio file on disk, None if it is not a standalone file
+        """
+        return None
+
+    def size(self, name: str) -> int:
+        """
+        Get the size of the audio file in bytes
+        """
+        raise NotImplementedError
+
+    def read(self, name: str) -> bytes:
+        """
+        Read the content of the audio file
+        """
+        raise NotImplementedError
+
+    def info(self, name: str):
+        """
+        Get the soundfile info (sample rate, frames, duration) of the audio file
+        """
+        return sf.info(io.BytesIO(self.read(name)))
+
+    def duration(self, name: str) -> float:
+        """
+        Get the duration of the audio file in seconds
+        """
+        return self.info(name).duration
+
+    def sample_rate(self, name: str) -> int:
+        """
+        Get the sample rate of the audio file
+        """
+        return self.info(name).samplerate
+
+    def order(self, name: str) -> tuple:
+        """
+        Sort key of the audio file, reading in this order is sequential I/O
+        """
+        return ()
+
+
+class DirectorySource(AudioSource):
+    """
+    Audio files in a directory, named `<id>.<extension>`
+    """
+
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    def find(self, name: str) -> Optional[str]:
+        return get_audio_path(self._directory, name)
+
+    def path(self, name: str) -> Optional[str]:
+        return self.find(name)
+
+    def size(self, name: str) -> int:
+        return os.path.getsize(self.find(name))
+
+    def read(self, name: str) -> bytes:
+        with open(self.find(name), "rb") as f:
+            return f.read()
+
+    def info(self, name: str):
+        return sf.info(self.find(name))
+
+    def duration(self, name: str) -> float:
+        path = self.find(name)
+        return _file_duration(path, os.stat(path).st_mtime_ns)
+
+
+@lru_cache(maxsize=1 << 20)
+def _file_duration(path: str, mtime: int) -> float:
+    """
+    Duration of the audio file from its header, probed once per process
+    while the file doesn't change
     """
-    Read an audio file and return a tensor
+    return sf.info(path).duration
+
+
+class ArchiveSource(AudioSource):
+    """
+    Audio files in uncompressed tar (i.e. WebDataset shards) or zip archives,
+    named `<id>.<extension>`, other members are ignored. Member offsets are indexed
+    once, so audio files are read with random access, no extraction needed.
+    """
+
+    def __init__(self, paths: list[str]):
+        """
+        Args:
+            paths (list[str]): tar or zip archives
+        """
+        self._paths = paths
+        # id -> (archive index, member name, data offset in tar, size)
+        self._index: dict[str, tuple[int, str, int, int]] = {}
+        self._zips: dict[int, zipfile.ZipFile] = {}
+        self._durations: dict[str, float] = {}
+        for i, path in enumerate(paths):
+            if path.endswith(".zip"):
+                self._zips[i] = zipfile.ZipFile(path)
+                for member in self._zips[i].infolist():
+                    if not member.is_dir():
+                        self._add(
+                            member.filename, i, member.header_offset, member.file_size
+                        )
+            else:
+                try:
+                    tar = tarfile.open(path, "r:")
+                except tarfile.ReadError as e:
+                    raise ValueError(
+                        f"Can't index {path}, only uncompressed tar archives "
+                        "can be read with random access"
+                    ) from e
+                with tar:
+                    for member in tar:
+                        if member.isfile():
+                            self._add(member.name, i, member.offset_data, member.size)
+        logging.info(f"Indexed {len(self._index)} audio files in {len(paths)} archives")
+
+    def _add(self, member: str, archive: int, offset: int, size: int):
+        name, ext = os.path.splitext(member)
+        if ext in audio_extensions and name not in self._index:
+            self._index[name] = (archive, member, offset, size)
+
+    def find(self, name: str) -> Optional[str]:
+        if name not in self._index:
+            return None
+        archive, member, _, _ = self._index[name]
+        return f"{self._paths[archive]}:{member}"
+
+    def size(self, name: str) -> int:
+        return self._index[name][3]
+
+    def read(self, name: str) -> bytes:
+        archive, member, offset, size = self._index[name]
+        if archive in self._zips:
+            return self._zips[archive].read(member)
+        # pread doesn't move a shared file position, safe to call from threads
+        fd = os.open(self._paths[archive], os.O_RDONLY)
+        try:
+            return os.pread(fd, size, offset)
+        finally:
+            os.close(fd)
+
+    def duration(self, name: str) -> float:
+        if name not in self._durations:
+            self._durations[name] = self.info(name).duration
+        return self._durations[name]
+
+    def order(self, name: str) -> tuple:
+        archive, _, offset, _ = self._index[name]
+        return archive, offset
+
+
+class ManifestSource(DirectorySource):
+    """
+    Audio files listed in a manifest (see `manifest`) with their durations
+    and sample rates, so files are neither discovered nor probed
+    """
+
+    def __init__(self, entries: dict[str, dict]):
+        """
+        Args:
+            entries (dict[str, dict]): id -> {"path", "duration", "sample_rate"}
+        """
+        self._entries = entries
+
+    def find(self, name: str) -> Optional[str]:
+        entry = self._entries.get(name)
+        return None if entry is None else entry["path"]
+
+    def duration(self, name: str) -> float:
+        return self._entries[name]["duration"]
+
+    def sample_rate(self, name: str) -> int:
+        return self._entries[name]["sample_rate"]
+
+    def __repr__(self) -> str:
+        return f"manifest of {len(self._entries)} audio files"
+
+
+@lru_cache(maxsize=16)
+def _archive_source(paths: tuple[str, ...], mtimes: tuple[float, ...]) -> ArchiveSource:
+    """
+    Archive source, indexed once per process while the archives don't change
+    """
+    return ArchiveSource(list(paths))
+
+
+def get_audio_source(location: Union[str, AudioSource]) -> AudioSource:
+    """
+    Get the audio source of a test set location: a directory with audio files,
+    a tar/zip archive, or a glob of archive shards, i.e. "shards/test-*.tar"
     Args:
-        directory (str): The directory to search for the audio file
-        name (str): The name of the audio file (without the extension)
-        sample_rate (int): The sample rate to resample the audio to
-        return_torch (bool): Whether to return a torch.Tensor, otherwise return a NumPy array
+        location (Union[str, AudioSource]): directory, archive path or glob of archives.
+            Sources (i.e. of a manifest) are returned as is
     Returns:
-        torch.Tensor: A tensor containing the audio data
+        AudioSource: audio files of the location
     """
-    file_path = get_audio_path(directory, name)
-    if file_path is None:
-        raise FileNotFoundError(
-            f"No supported audio file found for '{name}' in '{directory}'."
-        )
+    if isinstance(location, AudioSource):
+        return location
+    if os.path.isdir(location):
+        return DirectorySource(location)
+    paths = sorted(glob.glob(location))
+    if not paths:
+        raise FileNotFoundError(f"No audio directory or archives found at {location}")
+    for path in paths:
+        if os.path.splitext(path)[1] not in _archive_extensions:
+            raise ValueError(f"{path} is neither a directory nor a tar/zip archive")
+    return _archive_source(tuple(paths), tuple(os.path.getmtime(x) for x in paths))
+
 
-    # Get the original sample rate using torchaudio
-    info = sf.info(file_path)
-    orig_sample_rate = info.samplerate
+def _speechnorm(
+    input_args: list[str], sample_rate: int, stdin: Optional[bytes] = None
+) -> np.ndarray:
+    """
+    Run FFmpeg speech-specific loudness normalization
+    Args:
+        input_args (list[str]): FFmpeg input arguments
+        sample_rate (int): Sample rate of the input, kept in the output
+        stdin (Optional[bytes]): Input data, if FFmpeg reads from pipe
+    Returns:
+        np.ndarray: A float32 array containing mono normalized audio
+    """
     # FFmpeg command to normalize loudness using speechnorm
     ffmpeg_cmd = [
         "ffmpeg",
-        "-i",
-        file_path,
+        "-threads",
+        "1",  # files are converted in parallel, one CPU of the budget each
+        *input_args,
         "-af",
         "speechnorm=e=5:r=0.0003:l=1",  # Apply speech-specific loudness normalization
         "-f",
@@ -72,19 +304,19 @@ def _read_audio(directory: str, name: str, sample_rate: int) -> torch.Tensor:
         "-ac",
         "1",  # Convert to mono
         "-ar",
-        str(orig_sample_rate),  # Keep original sample rate
+        str(sample_rate),  # Keep original sample rate
         "pipe:1",  # Send output to stdout (pipe)
     ]
 
     # Run FFmpeg and capture output stream
-    process = subprocess.Popen(
+    process = subprocess.run(
         ffmpeg_cmd,
+        input=stdin,
         stdout=subprocess.PIPE,
         stderr=subprocess.DEVNULL,
-        stdin=subprocess.DEVNULL,
-        bufsize=10**8,
+        stdin=None if stdin is not None else subprocess.DEVNULL,
     )
-    raw_audio = process.stdout.read()
+    raw_audio = process.stdout
 
     # Convert raw PCM data to NumPy array
     waveform = np.frombuffer(raw_audio, dtype=np.float32)
@@ -94,15 +326,74 @@ def _read_audio(directory: str, name: str, sample_rate: int) -> torch.Tensor:
         raise RuntimeError(
             "Failed to decode audio. Check FFmpeg installation and input file."
         )
+    return waveform
 
-    # Resample only if necessary
-    if orig_sample_rate != sample_rate:
-        waveform = resampy.resample(
-            waveform, orig_sample_rate, sample_rate, filter="kaiser_best"
+
+def _resample(waveform: np.ndarray, orig_sample_rate: int, sample_rate: int):
+    """
+    Resample only if necessary
+    """
+    if orig_sample_rate == sample_rate:
+        return waveform
+    # resampy is slow to import (numba), import only if needed
+    import resampy
+
+    return resampy.resample(
+        waveform, orig_sample_rate, sample_rate, filter="kaiser_best"
+    )
+
+
+def _read_audio(directory: str, name: str, sample_rate: int) -> np.ndarray:
+    """
+    Read an audio file and return a waveform
+    Args:
+        directory (str): The directory or archives to search for the audio file
+        name (str): The name of the audio file (without the extension)
+        sample_rate (int): The sample rate to resample the audio to
+    Returns:
+        np.ndarray: A float32 array containing the audio data
+    """
+    source = get_audio_source(directory)
+    if source.find(name) is None:
+        raise FileNotFoundError(
+            f"No supported audio file found for '{name}' in '{directory}'."
         )
 
-    # Convert to PyTorch tensor and return
-    return torch.tensor(waveform).unsqueeze(0)  # Add channel dimension
+    file_path = source.path(name)
+    if file_path is not None:
+        orig_sample_rate = source.sample_rate(name)
+        waveform = _speechnorm(["-i", file_path], orig_sample_rate)
+    else:
+        # archive member is piped to FFmpeg, nothing is extracted to disk
+        data = source.read(name)
+        orig_sample_rate = sf.info(io.BytesIO(data)).samplerate
+        waveform = _speechnorm(["-i", "pipe:0"], orig_sample_rate, stdin=data)
+    return _resample(waveform, orig_sample_rate, sample_rate)
+
+
+def prepare_waveform(
+    waveform: np.ndarray,
+    orig_sample_rate: int,
+    sample_rate: int = 16000,
+    normalize: bool = True,
+) -> np.ndarray:
+    """
+    In-memory counterpart of the audio conversion: loudness normalization and resampling,
+    audio is passed to FFmpeg through a pipe, nothing is written to disk.
+    Args:
+        waveform (np.ndarray): Mono waveform, float in [-1, 1]
+        orig_sample_rate (int): Sample rate of the waveform
+        sample_rate (int): The sample rate to resample the audio to
+        normalize (bool): Whether to apply loudness normalization
+    Returns:
+        np.ndarray: A float32 array containing the audio data
+    """
+    waveform = np.ascontiguousarray(waveform, dtype=np.float32).reshape(-1)
+    if normalize:
+        input_args = ["-f", "f32le", "-ar", str(orig_sample_rate), "-ac", "1"]
+        input_args += ["-i", "pipe:0"]
+        waveform = _speechnorm(input_args, orig_sample_rate, stdin=waveform.tobytes())
+    return _resample(waveform, orig_sample_rate, sample_rate).astype(np.float32)
 
 
 def _convert_audio_file(
@@ -110,26 +401,33 @@ def _convert_audio_file(
     name: str,
     sample_rate: int,
     output_dir: str,
+    submit_time: Optional[float] = None,
 ):
     """
     Helper function to read, process, and save a single audio file.
-    This function runs in parallel using ProcessPoolExecutor.
+    This function runs in parallel worker threads.
     """
+    queue_wait = time.perf_counter() - submit_time if submit_time else 0.0
     try:
-        # Read audio and process it
-        audio = _read_audio(directory, name, sample_rate)
-        if audio is None:
-            return None
+        with profiling.stage("decode", items=1, queue_wait=queue_wait):
+            # Read audio and process it
+            audio = _read_audio(directory, name, sample_rate)
+            if audio is None:
+                monitoring.advance(failed=1)
+                return None
 
-        # Define output path
-        output_path = Path(output_dir) / f"{name}.wav"
+            # Define output path
+            output_path = Path(output_dir) / f"{name}.wav"
 
-        # Save processed audio
-        torchaudio.save(str(output_path), audio, sample_rate, format="wav")
+            # Save processed audio
+            sf.write(str(output_path), audio, sample_rate, subtype="FLOAT")
 
-        return name  # Return name of successfully processed file
+        duration = len(audio) / sample_rate
+        monitoring.advance(seconds=duration)
+        return duration  # Return duration of successfully processed file
     except Exception as e:
         logging.warning(f"Error processing {name}: {e}")
+        monitoring.advance(failed=1)
         return None  # Return None on failure
 
 
@@ -139,18 +437,26 @@ def convert_audio_dir(
     ids: list[tuple[str, str]],
     mapping: Optional[dict[str, str]] = None,
     sample_rate: int = 16000,
-    njobs: int = 8,
+    njobs: Optional[int] = None,
+    hashes: Optional[dict[str, str]] = None,
+    converted: Optional[dict[str, str]] = None,
 ):
     """
     Context manager that converts audio files in parallel and stores them in a temporary directory.
     The directory is automatically deleted when the context exits.
 
     Args:
-        directory (str): Input directory containing audio files.
+        directory (str): Input directory containing audio files, or tar/zip archives
+            (see `get_audio_source`).
         ids (list[tuple[str, str]]): List of (filename, metadata) tuples.
         mapping (dict[str, str]): Mapping of original speaker ids to generated speaker ids, should be converted too
         sample_rate (int): Target sample rate.
-        max_workers (int): Number of parallel workers (default: 4).
+        njobs (Optional[int]): Number of parallel workers, the CPU budget by default (see `threads`).
+        hashes (Optional[dict[str, str]]): id -> content hash of the audio (see `dedup`).
+            Audio with the same content is converted once, other ids are linked to it.
+        converted (Optional[dict[str, str]]): content hash -> file converted to the same
+            sample rate, i.e. by a conversion of another directory. Known audio is linked
+            instead of converted, files converted here are added.
 
     Yields:
         str: Path to the temporary directory containing processed audio files.
@@ -167,32 +473,88 @@ def convert_audio_dir(
             names = [name for name, _ in ids]
             if mapping is not None:
                 names.extend([mapping[name] for name in mapping])
-            names = list(set(names))
-            with concurrent.futures.ThreadPoolExecutor(max_workers=njobs) as executor:
-                # Submit tasks for parallel execution
-                futures = {
-                    executor.submit(
-                        _convert_audio_file,
-                        directory,
-                        name,
-                        sample_rate,
-                        tmp_dir,
-                    ): name
-                    for name in names
-                }
-
-                # Collect results
-                for future in concurrent.futures.as_completed(futures):
-                    future.result()
+            # in archive order, so shards are read sequentially
+            source = get_audio_source(directory)
+            names = sorted(
+                set(names), key=lambda x: source.order(x) if source.find(x) else ()
+            )
+            duplicates = {}
+            if hashes is not None:
+                # dedup imports this module
+                from speech_gen_eval.dedup import link_duplicates, split_duplicates
+
+                converted = {} if converted is None else converted
+                names, duplicates = split_duplicates(names, hashes, converted)
+            durations = _convert_files(directory, names, sample_rate, tmp_dir, njobs)
+            _converted_durations[tmp_dir] = durations
+            if hashes is not None:
+                link_duplicates(tmp_dir, names, duplicates, hashes, converted)
 
             # Yield the temporary directory containing converted files
             yield tmp_dir
 
         finally:
             # Ensure cleanup when context exits
+            _converted_durations.pop(tmp_dir, None)
             shutil.rmtree(tmp_dir)
 
 
+def _convert_files(
+    directory: str,
+    names: list[str],
+    sample_rate: int,
+    output_dir: str,
+    njobs: Optional[int] = None,
+) -> dict[str, float]:
+    """
+    Convert the audio files in parallel threads, each runs FFmpeg
+    Returns:
+        dict[str, float]: id -> duration of the converted audio, failed ids are skipped
+    """
+    njobs = njobs or threads.pool_size(len(names))
+    durations = {}
+    with profiling.evaluator("convert_audio_dir"), monitoring.task(
+        "convert_audio_dir", len(names)
+    ), concurrent.futures.ThreadPoolExecutor(max_workers=njobs) as executor:
+        # Submit tasks for parallel execution
+        futures = {
+            executor.submit(
+                profiling.propagate(_convert_audio_file),
+                directory,
+                name,
+                sample_rate,
+                output_dir,
+                time.perf_counter(),
+            ): name
+            for name in names
+        }
+
+        # Collect results
+        pending = len(futures)
+        for future in concurrent.futures.as_completed(futures):
+            duration = future.result()
+            if duration is not None:
+                durations[futures[future]] = duration
+            pending -= 1
+            monitoring.set_queue_depth("convert_audio_dir", pending)
+    return durations
+
+
+def converted_durations(
+    directory: Union[str, Mapping[str, np.ndarray], None],
+) -> dict[str, float]:
+    """
+    Durations of the audio converted by `convert_audio_dir` into the directory,
+    known from the conversion, so batching doesn't probe the files again.
+    Returns:
+        dict[str, float]: id -> duration in seconds, empty for other directories
+            and in-memory audio
+    """
+    if not isinstance(directory, str):
+        return {}
+    return _converted_durations.get(directory, {})
+
+
 def get_audio_paths(directory: str, ids: list[tuple[str, str]]) -> list[str]:
     """
     Get the paths to the audio files in the given directory.
@@ -205,14 +567,99 @@ def get_audio_paths(directory: str, ids: list[tuple[str, str]]) -> list[str]:
     return paths
 
 
-def sort_ids_by_audio_size(
-    directory: str, ids: list[tuple[str, str]]
+def get_audio_item(
+    directory: Union[str, Mapping[str, np.ndarray]], name: str
+) -> Optional[Union[str, np.ndarray]]:
+    """
+    Get the audio of the utterance: either a path to a file in the given directory,
+    or a waveform if the "directory" is in-memory (a mapping from id to 16kHz waveform).
+    Returns None if there is no audio for the utterance.
+    """
+    if isinstance(directory, Mapping):
+        return directory.get(name)
+    return get_audio_path(directory, name)
+
+
+def get_audio_items(
+    directory: Union[str, Mapping[str, np.ndarray]], ids: list[tuple[str, str]]
+) -> list[tuple[str, Union[str, np.ndarray]]]:
+    """
+    Get the ids and audio of the utterances (see `get_audio_item`).
+    Ids without audio are skipped.
+    """
+    items = []
+    for name, _ in ids:
+        audio = get_audio_item(directory, name)
+        if audio is not None:
+            items.append((name, audio))
+    return items
+
+
+def load_audio(
+    audio: Union[str, np.ndarray], dtype: str = "float32", sample_rate: int = 16000
+) -> np.ndarray:
+    """
+    Get the waveform of an audio item (see `get_audio_items`)
+    Args:
+        audio (Union[str, np.ndarray]): path to the audio file or a float waveform
+        dtype (str): "float32" or "int16"
+        sample_rate (int): expected sample rate
+    Returns:
+        np.ndarray: mono waveform
+    """
+    if isinstance(audio, str):
+        wav, sr = sf.read(audio, dtype=dtype)
+        assert sr == sample_rate
+        return wav
+    if dtype == "int16":
+        return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    return audio.astype(dtype, copy=False)
+
+
+def audio_hash(audio: Union[str, bytes, np.ndarray]) -> str:
+    """
+    Hash of the audio content, the one hash of the package: keys of the persistent
+    caches and deduplication within a run (see `dedup`)
+    Args:
+        audio (Union[str, bytes, np.ndarray]): path to the file (memory mapped,
+            hashed once per process while it doesn't change), its bytes,
+            or samples of an in-memory waveform
+    Returns:
+        str: hex digest
+    """
+    if isinstance(audio, str):
+        stat = os.stat(audio)
+        return _file_hash(audio, stat.st_size, stat.st_mtime_ns)
+    if isinstance(audio, np.ndarray):
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+    return _hash_buffer(memoryview(audio).cast("B"))
+
+
+def _hash_buffer(buffer: memoryview) -> str:
+    h = hashlib.sha256()
+    # chunks are large enough for hashlib to release the GIL
+    for start in range(0, len(buffer), _hash_chunk_size):
+        h.update(buffer[start : start + _hash_chunk_size])
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=1 << 20)
+def _file_hash(path: str, size: int, mtime: int) -> str:
+    if size == 0:
+        # empty files can't be memory mapped
+        return _hash_buffer(memoryview(b""))
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        with memoryview(m) as buffer:
+            return _hash_buffer(buffer)
+
+
+def sort_ids_by_duration(
+    directory: Union[str, AudioSource], ids: list[tuple[str, str]]
 ) -> list[tuple[str, str]]:
     """
-    Sort the ids by the size of the audio files.
+    Sort the ids by the duration of the audio files, longest first.
+    Durations come from the headers already read when the ids are filtered
+    (or from the manifest), file size is not comparable across formats and sample rates.
     """
-    return sorted(
-        ids,
-        key=lambda x: os.path.getsize(get_audio_path(directory, x[0])),
-        reverse=True,
-    )
+    source = get_audio_source(directory)
+    return sorted(ids, key=lambda x: source.duration(x[0]), reverse=True)
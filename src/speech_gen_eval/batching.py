@@ -0,0 +1,65 @@
+"""
+Copyright 2025 Balacoon
+
+Batching - duration-homogeneous batches of utterances for the batched evaluators,
+sized to a budget of padded audio
+"""
+
+from typing import Optional, Union
+
+import numpy as np
+import soundfile as sf
+
+
+def item_duration(audio: Union[str, np.ndarray], sample_rate: int = 16000) -> float:
+    """
+    Duration of an audio item (see `audio_dir.get_audio_items`) in seconds,
+    files are probed by the header only
+    """
+    if isinstance(audio, str):
+        return sf.info(audio).duration
+    return len(audio) / sample_rate
+
+
+def duration_batches(
+    items: list[tuple[str, Union[str, np.ndarray]]],
+    max_batch_size: int,
+    max_batch_seconds: float,
+    durations: Optional[dict[str, float]] = None,
+) -> list[list[tuple[str, Union[str, np.ndarray]]]]:
+    """
+    Split the audio items into batches of similar duration. Items are sorted
+    by duration, longest first, and a batch grows while its padded duration
+    (number of items times the longest one) fits the budget,
+    so short utterances make larger batches and long ones are not padded much.
+    Args:
+        items (list[tuple[str, Union[str, np.ndarray]]]): ids and audio of the utterances
+        max_batch_size (int): maximum number of items in a batch
+        max_batch_seconds (float): budget of padded audio in a batch, seconds.
+            An item longer than the budget makes a batch of its own.
+        durations (Optional[dict[str, float]]): id -> duration of the items known already,
+            i.e. from the conversion (see `audio_dir.converted_durations`),
+            other items are probed
+    Returns:
+        list[list[tuple[str, Union[str, np.ndarray]]]]: batches of the items
+    """
+    known = durations or {}
+    durations = [
+        known[name] if name in known else item_duration(audio) for name, audio in items
+    ]
+    order = sorted(range(len(items)), key=lambda i: durations[i], reverse=True)
+    batches, batch, longest = [], [], 0.0
+    for i in order:
+        # sorted longest first, the first item of the batch is the longest one
+        if batch and (
+            len(batch) >= max_batch_size
+            or (len(batch) + 1) * longest > max_batch_seconds
+        ):
+            batches.append(batch)
+            batch = []
+        if not batch:
+            longest = durations[i]
+        batch.append(items[i])
+    if batch:
+        batches.append(batch)
+    return batches
@@ -0,0 +1,419 @@
+"""
+Copyright 2025 Balacoon
+
+Bench - throughput benchmark on synthetic speech-like corpora
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+
+import numpy as np
+import soundfile as sf
+
+from speech_gen_eval import profiling, threads
+
+_WORDS = (
+    "the quick brown fox jumps over lazy dog she sells sea shells by shore please "
+    "call stella ask her to bring these things with from store six spoons of fresh"
+).split()
+
+
+def _synthesize_utterance(
+    rng: np.random.Generator, duration: float, sample_rate: int
+) -> np.ndarray:
+    """
+    Synthesize a speech-like signal: harmonic source with a gliding F0 contour,
+    syllable-rate amplitude envelope and short unvoiced noise bursts.
+    """
+    num_samples = int(duration * sample_rate)
+    t = np.arange(num_samples) / sample_rate
+
+    # F0 contour: declination + slow intonation + small vibrato
+    f0_base = rng.uniform(90, 220)
+    f0 = (
+        f0_base * (1.0 - 0.15 * t / max(duration, 1e-3))
+        + 0.1 * f0_base * np.sin(2 * np.pi * rng.uniform(0.3, 0.8) * t)
+        + 2.0 * np.sin(2 * np.pi * 5.5 * t)
+    )
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voiced = np.zeros(num_samples, dtype=np.float64)
+    for k in range(1, 20):
+        harmonic = k * f0 < sample_rate / 2
+        voiced += harmonic * np.sin(k * phase) / k
+
+    # syllables: ~4Hz envelope with voiced/unvoiced segments
+    syllable_rate = rng.uniform(3.0, 5.0)
+    envelope = np.clip(
+        np.sin(2 * np.pi * syllable_rate * t + rng.uniform(0, np.pi)), 0, None
+    )
+    unvoiced = np.sin(2 * np.pi * syllable_rate * t / 3.0) > 0.8
+    noise = rng.normal(0, 0.3, num_samples)
+    signal = np.where(unvoiced, noise, voiced) * envelope
+
+    signal += rng.normal(0, 0.003, num_samples)
+    signal = 0.5 * signal / (np.max(np.abs(signal)) + 1e-8)
+    return signal.astype(np.float32)
+
+
+def _sample_durations(
+    rng: np.random.Generator,
+    num_files: int,
+    min_dur: float,
+    max_dur: float,
+    distribution: str,
+) -> np.ndarray:
+    """
+    Sample utterance durations from the given distribution, clipped to [min_dur, max_dur]
+    """
+    if distribution == "uniform":
+        durations = rng.uniform(min_dur, max_dur, num_files)
+    elif distribution == "lognormal":
+        # median in the middle of the range (in log domain), most mass inside of it
+        mu = (np.log(min_dur) + np.log(max_dur)) / 2
+        sigma = (np.log(max_dur) - np.log(min_dur)) / 4
+        durations = rng.lognormal(mu, sigma, num_files)
+    elif distribution == "fixed":
+        durations = np.full(num_files, (min_dur + max_dur) / 2)
+    else:
+        raise ValueError(f"Unknown duration distribution: {distribution}")
+    return np.clip(durations, min_dur, max_dur)
+
+
+def generate_corpus(
+    out_dir: str,
+    num_files: int = 100,
+    min_dur: float = 1.0,
+    max_dur: float = 10.0,
+    distribution: str = "lognormal",
+    sample_rate: int = 24000,
+    seed: int = 0,
+) -> dict[str, str]:
+    """
+    Generate a synthetic corpus: generated and original audio directories,
+    text file and mapping file, in the same layout `speech-gen-eval` expects.
+    Args:
+        out_dir (str): Directory to put the corpus into
+        num_files (int): Number of utterances to generate
+        min_dur (float): Minimum utterance duration in seconds
+        max_dur (float): Maximum utterance duration in seconds
+        distribution (str): Durations distribution: uniform, lognormal or fixed
+        sample_rate (int): Sample rate of the generated audio
+        seed (int): Random seed, corpus is deterministic given the seed
+    Returns:
+        dict[str, str]: Paths to "txt", "mapping", "generated_audio", "original_audio"
+    """
+    rng = np.random.default_rng(seed)
+    paths = {
+        "txt": os.path.join(out_dir, "txt"),
+        "mapping": os.path.join(out_dir, "mapping"),
+        "generated_audio": os.path.join(out_dir, "generated"),
+        "original_audio": os.path.join(out_dir, "original"),
+    }
+    os.makedirs(paths["generated_audio"], exist_ok=True)
+    os.makedirs(paths["original_audio"], exist_ok=True)
+
+    durations = _sample_durations(rng, num_files, min_dur, max_dur, distribution)
+    names = [f"utt_{i:06d}" for i in range(num_files)]
+    with open(paths["txt"], "w", encoding="utf-8") as txt_fp, open(
+        paths["mapping"], "w"
+    ) as mapping_fp:
+        for i, (name, duration) in enumerate(zip(names, durations)):
+            num_words = max(1, int(duration * 2.5))
+            text = " ".join(rng.choice(_WORDS, num_words))
+            txt_fp.write(f"{name}\t{text}\n")
+            # each generated utterance references another one (i.e. zero-shot setup)
+            mapping_fp.write(f"{name}\t{names[(i + 1) % num_files]}\n")
+            for directory in [paths["generated_audio"], paths["original_audio"]]:
+                audio = _synthesize_utterance(rng, duration, sample_rate)
+                sf.write(os.path.join(directory, name + ".wav"), audio, sample_rate)
+    return paths
+
+
+class _StageTimer:
+    """
+    Collects per-stage timings of the benchmark.
+    A failed stage is recorded with its error and stops the benchmark
+    """
+
+    def __init__(self, audio_duration: float):
+        self._audio_duration = audio_duration
+        self.stages: dict[str, dict] = {}
+        self.failed: str | None = None
+
+    @contextmanager
+    def stage(self, name: str, num_files: int, audio_duration: float | None = None):
+        audio_duration = (
+            self._audio_duration if audio_duration is None else audio_duration
+        )
+        record = {"files": num_files}
+        wall_start = time.perf_counter()
+        cpu_start = profiling.cpu_time()
+        try:
+            yield record
+        except Exception as e:
+            logging.error(f"Benchmark stage {name} failed: {e}")
+            record["error"] = str(e)
+            self.failed = name
+            raise
+        finally:
+            wall = time.perf_counter() - wall_start
+            record["wall_time"] = round(wall, 4)
+            record["cpu_time"] = round(profiling.cpu_time() - cpu_start, 4)
+            record["files_per_sec"] = round(num_files / wall, 3) if wall > 0 else None
+            record["real_time_factor"] = (
+                round(wall / audio_duration, 5) if audio_duration > 0 else None
+            )
+            # ru_maxrss can't be reset, this is the peak of the process so far
+            record["process_peak_rss_mb"] = profiling.peak_rss_mb()
+            self.stages[name] = record
+
+
+def run_benchmark(
+    corpus_dir: str,
+    evaluators: list[str] | None = None,
+    num_files: int = 100,
+    min_dur: float = 1.0,
+    max_dur: float = 10.0,
+    distribution: str = "lognormal",
+    sample_rate: int = 24000,
+    seed: int = 0,
+) -> dict:
+    """
+    Generate a synthetic corpus and time all the stages of the evaluation on it.
+    Stages run the same plan and combined evaluator as `speech_gen_eval`:
+    conversion of the audio the plan needs, shared features, then each of the evaluators
+    Args:
+        corpus_dir (str): Directory to generate the corpus into
+        evaluators (list[str] | None): Evaluators to benchmark, all registered ones if None
+        num_files, min_dur, max_dur, distribution, sample_rate, seed: see `generate_corpus`
+    Returns:
+        dict: benchmark report, JSON-serializable. "failed" is the name of the stage
+            that raised, later stages are not run
+    """
+    from speech_gen_eval.audio_dir import sort_ids_by_duration
+    from speech_gen_eval.combined_evaluator import evaluator_names
+    from speech_gen_eval.ids import read_txt_and_mapping
+
+    if evaluators is None:
+        evaluators = evaluator_names
+
+    start = time.perf_counter()
+    paths = generate_corpus(
+        corpus_dir,
+        num_files=num_files,
+        min_dur=min_dur,
+        max_dur=max_dur,
+        distribution=distribution,
+        sample_rate=sample_rate,
+        seed=seed,
+    )
+    logging.info(f"Generated synthetic corpus in {time.perf_counter() - start:.2f}s")
+    # generated and original audio of an id have the same duration
+    durations = {
+        os.path.splitext(x)[0]: sf.info(
+            os.path.join(paths["generated_audio"], x)
+        ).duration
+        for x in os.listdir(paths["generated_audio"])
+    }
+    total_duration = float(sum(durations.values()))
+    timer = _StageTimer(total_duration)
+
+    with profiling.profile_run() as profiler:
+        try:
+            with timer.stage("read_txt_and_mapping", num_files):
+                ids, mapping = read_txt_and_mapping(
+                    paths["txt"],
+                    paths["generated_audio"],
+                    mapping_path=paths["mapping"],
+                    original_audio=paths["original_audio"],
+                    ignore_missing=True,
+                )
+                ids = sort_ids_by_duration(paths["generated_audio"], ids)
+            _run_stages(timer, evaluators, ids, mapping, paths, durations)
+        except Exception:
+            # recorded by the timer, the report is returned with the failed stage
+            pass
+
+    return {
+        "environment": _environment(),
+        "config": {
+            "num_files": num_files,
+            "min_dur": min_dur,
+            "max_dur": max_dur,
+            "distribution": distribution,
+            "sample_rate": sample_rate,
+            "seed": seed,
+            "evaluators": evaluators,
+        },
+        "corpus": {"files": num_files, "total_duration": round(total_duration, 3)},
+        "stages": timer.stages,
+        "failed": timer.failed,
+        "profile": profiler.summary(),
+        "peak_rss_mb": profiling.peak_rss_mb(),
+    }
+
+
+def _run_stages(
+    timer: _StageTimer,
+    evaluators: list[str],
+    ids: list[tuple[str, str]],
+    mapping: dict[str, str],
+    paths: dict[str, str],
+    durations: dict[str, float],
+):
+    """
+    Time conversion, shared features and the evaluators, as they run in `speech_gen_eval`
+    """
+    from speech_gen_eval.audio_dir import convert_audio_dir
+    from speech_gen_eval.combined_evaluator import CombinedEvaluator
+    from speech_gen_eval.features import shared_features
+    from speech_gen_eval.plan import EvaluationPlan
+
+    plan = EvaluationPlan(evaluators, ids, mapping)
+    # only the original audio evaluators read is converted
+    original_ids = [(name, "") for name in plan.original]
+    converted = [name for name, _ in ids] + plan.original
+    with ExitStack() as stack:
+        with timer.stage(
+            "convert_audio_dir",
+            len(converted),
+            sum(durations.get(x, 0.0) for x in converted),
+        ):
+            generated_16khz = stack.enter_context(
+                convert_audio_dir(paths["generated_audio"], ids, sample_rate=16000)
+            )
+            original_16khz = stack.enter_context(
+                convert_audio_dir(
+                    paths["original_audio"] if plan.original else None,
+                    original_ids,
+                    sample_rate=16000,
+                )
+            )
+        feature_ids = [
+            x
+            for feature, per_dir in plan.features.items()
+            if feature in shared_features
+            for names in per_dir.values()
+            for x in names
+        ]
+        if feature_ids:
+            with timer.stage(
+                "features",
+                len(feature_ids),
+                sum(durations.get(x, 0.0) for x in feature_ids),
+            ):
+                plan.compute_shared_features(generated_16khz, original_16khz)
+
+        for name in evaluators:
+            with timer.stage(name, len(ids)) as record:
+                evaluator = CombinedEvaluator(
+                    [name],
+                    ids=ids,
+                    generated_audio=generated_16khz,
+                    original_audio=original_16khz,
+                    mapping=mapping,
+                    ignore_errors=True,
+                )
+                record["metrics"] = {k: float(v) for k, v in evaluator.get_metric()}
+
+
+def _environment() -> dict:
+    """
+    Describe the machine the benchmark runs on, to compare like with like
+    """
+    import torch
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cpu_budget": threads.get_cpus(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "cuda": torch.cuda.is_available(),
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    Parse command line arguments of the `bench` command
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    from speech_gen_eval.combined_evaluator import evaluator_names
+
+    ap = argparse.ArgumentParser(
+        prog="speech-gen-eval bench",
+        description="Benchmarks evaluation throughput on a synthetic corpus",
+    )
+    ap.add_argument("--num-files", type=int, default=100, help="Number of utterances")
+    ap.add_argument("--min-dur", type=float, default=1.0, help="Min duration, seconds")
+    ap.add_argument("--max-dur", type=float, default=10.0, help="Max duration, seconds")
+    ap.add_argument(
+        "--distribution",
+        choices=["uniform", "lognormal", "fixed"],
+        default="lognormal",
+        help="Distribution of utterance durations",
+    )
+    ap.add_argument("--sample-rate", type=int, default=24000, help="Corpus sample rate")
+    ap.add_argument("--seed", type=int, default=0, help="Random seed of the corpus")
+    ap.add_argument(
+        "--evaluators",
+        nargs="*",
+        choices=evaluator_names,
+        help="Evaluators to benchmark, all by default",
+    )
+    ap.add_argument(
+        "--cpu",
+        action="store_true",
+        help="Hide GPUs, to benchmark CPU-only throughput",
+    )
+    ap.add_argument(
+        "--cpus",
+        type=int,
+        help="CPU budget of the evaluation, all available by default",
+    )
+    ap.add_argument(
+        "--corpus-dir", help="Where to keep the corpus, temporary by default"
+    )
+    ap.add_argument("--out", help="JSON file to save the report, stdout by default")
+    return ap.parse_args(argv)
+
+
+def main(argv: list[str] | None = None):
+    """
+    Entry point of the `bench` command
+    """
+    args = parse_args(argv)
+    if args.cpu:
+        # has to be set before cuda is initialized
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    threads.set_cpus(args.cpus)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        report = run_benchmark(
+            args.corpus_dir or tmp_dir,
+            evaluators=args.evaluators,
+            num_files=args.num_files,
+            min_dur=args.min_dur,
+            max_dur=args.max_dur,
+            distribution=args.distribution,
+            sample_rate=args.sample_rate,
+            seed=args.seed,
+        )
+
+    report_str = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report_str + "\n")
+    else:
+        print(report_str)
+    if report["failed"]:
+        sys.exit(f"Benchmark stage {report['failed']} failed, see the report")
@@ -0,0 +1,183 @@
+"""
+Copyright 2025 Balacoon
+
+Bootstrap - confidence intervals of the metrics and paired comparison of two runs,
+by resampling utterances. Resampled statistics are summed with matrix products,
+metrics are computed for all the resamples at once (`metrics_from_stats` is element-wise).
+"""
+
+from typing import Optional
+
+import numpy as np
+import yaml
+
+from speech_gen_eval.combined_evaluator import name2evaluator
+
+# maximum number of resampled indices drawn at once, bounds the memory
+_max_block_elements = 1 << 23
+
+
+def stats_matrix(
+    utterance_stats: dict[str, dict[str, float]], ids: list[str], keys: list[str]
+) -> np.ndarray:
+    """
+    Per-utterance statistics as a matrix [len(ids), len(keys)], missing ones are zeros
+    """
+    matrix = np.zeros((len(ids), len(keys)))
+    column = {key: j for j, key in enumerate(keys)}
+    for i, name in enumerate(ids):
+        for key, value in utterance_stats[name].items():
+            matrix[i, column[key]] = value
+    return matrix
+
+
+def _resampled_sums(
+    matrices: list[np.ndarray], num_resamples: int, seed: int
+) -> list[np.ndarray]:
+    """
+    Sum statistics of the utterances resampled with replacement. All the matrices
+    (i.e. of two runs for a paired comparison) are resampled with the same indices.
+    Args:
+        matrices (list[np.ndarray]): per-utterance statistics, [num_utterances, num_stats]
+        num_resamples (int): number of resamples
+        seed (int): seed of the random generator
+    Returns:
+        list[np.ndarray]: summed statistics of each resample, [num_resamples, num_stats]
+    """
+    n = matrices[0].shape[0]
+    rng = np.random.default_rng(seed)
+    block = max(1, _max_block_elements // max(n, 1))
+    sums = [[] for _ in matrices]
+    for start in range(0, num_resamples, block):
+        b = min(block, num_resamples - start)
+        # how many times each utterance is drawn in each of the resamples
+        idx = rng.integers(0, n, size=(b, n)) + n * np.arange(b)[:, None]
+        counts = np.bincount(idx.ravel(), minlength=b * n).reshape(b, n)
+        for lst, matrix in zip(sums, matrices):
+            lst.append(counts @ matrix)
+    return [np.concatenate(x) for x in sums]
+
+
+def row_metrics(
+    eval_name: str, keys: list[str], rows: np.ndarray
+) -> dict[str, np.ndarray]:
+    """
+    Metrics of the evaluator for each row of statistics,
+    i.e. of each resample or each utterance
+    Args:
+        eval_name (str): name of the evaluator
+        keys (list[str]): names of the statistics, columns of the rows
+        rows (np.ndarray): statistics, [num_rows, len(keys)]
+    Returns:
+        dict[str, np.ndarray]: metric name -> values, [num_rows]
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        metrics = name2evaluator[eval_name].metrics_from_stats(
+            {key: rows[:, j] for j, key in enumerate(keys)}
+        )
+    # metrics which are not per-utterance (i.e. EER) are scalars, they are skipped
+    return {
+        metric: np.asarray(value, dtype=float)
+        for metric, value in metrics
+        if np.ndim(value) == 1
+    }
+
+
+def bootstrap_intervals(
+    utterance_stats: dict[str, dict[str, dict[str, float]]],
+    num_resamples: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> dict[str, list[float]]:
+    """
+    Percentile bootstrap confidence intervals of the metrics
+    Args:
+        utterance_stats (dict[str, dict[str, dict[str, float]]]): evaluator name
+            -> utterance id -> statistics name -> value
+        num_resamples (int): number of resamples
+        confidence (float): confidence level of the intervals
+        seed (int): seed of the random generator
+    Returns:
+        dict[str, list[float]]: metric name -> [low, high]
+    """
+    alpha = (1.0 - confidence) / 2 * 100
+    intervals = {}
+    for eval_name, stats in utterance_stats.items():
+        if not stats:
+            continue
+        ids = sorted(stats)
+        keys = sorted({key for x in stats.values() for key in x})
+        (sums,) = _resampled_sums([stats_matrix(stats, ids, keys)], num_resamples, seed)
+        for metric, values in row_metrics(eval_name, keys, sums).items():
+            low, high = np.nanpercentile(values, [alpha, 100 - alpha])
+            intervals[metric] = [float(low), float(high)]
+    return intervals
+
+
+def paired_comparison(
+    utterance_stats: dict[str, dict[str, dict[str, float]]],
+    baseline_stats: dict[str, dict[str, dict[str, float]]],
+    num_resamples: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> dict[str, dict[str, float]]:
+    """
+    Paired bootstrap comparison of two runs on the utterances both have evaluated:
+    the same utterances are resampled for both runs, so per-utterance
+    variation cancels out and small differences between systems are detected.
+    Args:
+        utterance_stats (dict[str, dict[str, dict[str, float]]]): evaluator name
+            -> utterance id -> statistics name -> value
+        baseline_stats (dict[str, dict[str, dict[str, float]]]): same for the baseline run
+        num_resamples (int): number of resamples
+        confidence (float): confidence level of the delta interval
+        seed (int): seed of the random generator
+    Returns:
+        dict[str, dict[str, float]]: metric name -> "delta" (run minus baseline),
+            "low" and "high" of its interval, two-sided "p_value"
+            of the delta being of the other sign, and number of paired "utterances"
+    """
+    alpha = (1.0 - confidence) / 2 * 100
+    comparison = {}
+    for eval_name, stats in utterance_stats.items():
+        baseline = baseline_stats.get(eval_name) or {}
+        ids = sorted(set(stats) & set(baseline))
+        if not ids:
+            continue
+        keys = sorted(
+            {key for x in ids for key in stats[x]}
+            | {key for x in ids for key in baseline[x]}
+        )
+        matrices = [stats_matrix(stats, ids, keys), stats_matrix(baseline, ids, keys)]
+        point = [
+            row_metrics(eval_name, keys, x.sum(axis=0, keepdims=True)) for x in matrices
+        ]
+        sums = _resampled_sums(matrices, num_resamples, seed)
+        resampled = [row_metrics(eval_name, keys, x) for x in sums]
+        for metric in resampled[0]:
+            deltas = resampled[0][metric] - resampled[1][metric]
+            deltas = deltas[np.isfinite(deltas)]
+            if len(deltas) == 0:
+                continue
+            low, high = np.percentile(deltas, [alpha, 100 - alpha])
+            p_value = 2 * min(np.mean(deltas <= 0), np.mean(deltas >= 0))
+            comparison[metric] = {
+                "delta": float(point[0][metric][0] - point[1][metric][0]),
+                "low": float(low),
+                "high": float(high),
+                "p_value": float(min(p_value, 1.0)),
+                "utterances": len(ids),
+            }
+    return comparison
+
+
+def read_utterance_stats(path: str) -> Optional[dict]:
+    """
+    Read per-utterance statistics from the output yaml of a run with bootstrap,
+    None if the run has no per-utterance statistics
+    """
+    # per-utterance statistics are large, use the C loader if PyYAML is built with it
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(path, "r") as f:
+        output = yaml.load(f, Loader=loader)
+    return output.get("utterance_stats")
@@ -4,35 +4,59 @@ Copyright 2025 Balacoon
 Combined evaluator executes multiple evaluators and returns a list of metrics
 """
 
+import importlib
 import logging
 import time
+from collections.abc import Mapping
+from importlib.metadata import entry_points
 
-from speech_gen_eval.aesthetics import AestheticsEvaluator
+from speech_gen_eval import monitoring, profiling
 from speech_gen_eval.evaluator import Evaluator
-from speech_gen_eval.f0_accuracy import F0AccuracyEvaluator
-from speech_gen_eval.f0_stats import F0StatsEvaluator
-from speech_gen_eval.opensmile import OpenSmileEvaluator
-from speech_gen_eval.secs import (
-    ECAPA2SECSEvaluator,
-    ECAPASECSEvaluator,
-    ReDimNetSECSEvaluator,
-)
-from speech_gen_eval.utmos_quality import UTMOSQualityEvaluator
-from speech_gen_eval.utmosv2_quality import UTMOSv2QualityEvaluator
-from speech_gen_eval.whisperv3_intelligibility import WhisperV3IntelligibilityEvaluator
-
-name2evaluator = {
-    "utmos": UTMOSQualityEvaluator,
-    "utmosv2": UTMOSv2QualityEvaluator,
-    "cer": WhisperV3IntelligibilityEvaluator,
-    "aesthetics": AestheticsEvaluator,
-    "ecapa_secs": ECAPASECSEvaluator,
-    "ecapa2_secs": ECAPA2SECSEvaluator,
-    "redimnet_secs": ReDimNetSECSEvaluator,
-    "f0accuracy": F0AccuracyEvaluator,
-    "f0stats": F0StatsEvaluator,
-    "jitter": OpenSmileEvaluator,
+
+# built-in evaluators, "module:class". Modules are imported only when the evaluator
+# is selected, since they pull heavy dependencies (transformers, torch, opensmile, ...)
+_builtin_evaluators = {
+    "utmos": "speech_gen_eval.utmos_quality:UTMOSQualityEvaluator",
+    "utmosv2": "speech_gen_eval.utmosv2_quality:UTMOSv2QualityEvaluator",
+    "cer": "speech_gen_eval.whisperv3_intelligibility:WhisperV3IntelligibilityEvaluator",
+    "aesthetics": "speech_gen_eval.aesthetics:AestheticsEvaluator",
+    "ecapa_secs": "speech_gen_eval.secs:ECAPASECSEvaluator",
+    "ecapa2_secs": "speech_gen_eval.secs:ECAPA2SECSEvaluator",
+    "redimnet_secs": "speech_gen_eval.secs:ReDimNetSECSEvaluator",
+    "f0accuracy": "speech_gen_eval.f0_accuracy:F0AccuracyEvaluator",
+    "f0stats": "speech_gen_eval.f0_stats:F0StatsEvaluator",
+    "jitter": "speech_gen_eval.opensmile:OpenSmileEvaluator",
 }
+# third-party packages can register evaluators under this entry point group
+_entry_point_group = "speech_gen_eval.evaluators"
+
+
+class _LazyEvaluatorRegistry(Mapping):
+    """
+    Maps evaluator name to evaluator class, importing the class on first access
+    """
+
+    def __init__(self, specs: dict[str, str]):
+        self._specs = dict(specs)
+        for entry_point in entry_points(group=_entry_point_group):
+            self._specs.setdefault(entry_point.name, entry_point.value)
+        self._classes: dict[str, type] = {}
+
+    def __getitem__(self, name: str) -> type:
+        if name not in self._classes:
+            module_name, class_name = self._specs[name].split(":")
+            module = importlib.import_module(module_name)
+            self._classes[name] = getattr(module, class_name)
+        return self._classes[name]
+
+    def __iter__(self):
+        return iter(self._specs)
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+
+name2evaluator = _LazyEvaluatorRegistry(_builtin_evaluators)
 evaluator_names = sorted(list(name2evaluator.keys()))
 type2names = {
     "tts": ["cer", "utmos", "aesthetics", "f0stats"],
@@ -47,15 +71,94 @@ class CombinedEvaluator(Evaluator):
     Evaluator that combines multiple evaluators
     """
 
-    def __init__(self, eval_names: list[str], *args, **kwargs):
+    def __init__(
+        self,
+        eval_names: list[str],
+        *args,
+        model_cache: dict | None = None,
+        backends: dict[str, str] | None = None,
+        precisions: dict[str, str] | None = None,
+        **kwargs,
+    ):
         """
         Initialize the evaluator
         Args:
-            system_type (str): The type of system to evaluate
+            eval_names (list[str]): Names of the evaluators to run
+            model_cache (dict | None): Models shared between evaluations,
+                i.e. of an `EvaluationSession`
+            backends (dict[str, str] | None): evaluator name -> execution backend
+                ("torch" or "onnx"), "torch" for evaluators not listed
+            precisions (dict[str, str] | None): evaluator name -> CPU inference precision
+                ("fp32", "bf16" or "int8"), "fp32" for evaluators not listed
         """
+        backends = backends or {}
+        precisions = precisions or {}
+        for setting, values in [("backend", backends), ("precision", precisions)]:
+            for name, value in values.items():
+                if name not in eval_names:
+                    raise ValueError(
+                        f"{setting} is set for {name}, which is not evaluated"
+                    )
+                if value not in getattr(name2evaluator[name], f"supported_{setting}s"):
+                    raise ValueError(f"{name} doesn't support {value} {setting}")
+        self._names = eval_names
+        # number of utterances, each of the evaluators is a monitoring task of this size
+        self._num_ids = len(kwargs.get("ids") or [])
         self._evaluators = [
             name2evaluator[name](*args, **kwargs) for name in eval_names
         ]
+        for name, eval in zip(eval_names, self._evaluators):
+            eval.model_cache = model_cache
+            eval.backend = backends.get(name, "torch")
+            eval.precision = precisions.get(name, "fp32")
+
+    def get_utterance_stats(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        Run each evaluator and get its per-utterance sufficient statistics
+        Returns:
+            dict[str, dict[str, dict[str, float]]]: evaluator name -> utterance id
+                -> statistics name -> value
+        """
+        stats = {}
+        for name, eval in zip(self._names, self._evaluators):
+            start = time.time()
+            with profiling.evaluator(name), monitoring.task(
+                name, self._num_ids
+            ) as task:
+                stats[name] = eval.get_utterance_stats()
+                task["evaluated"] = len(stats[name])
+            logging.info(f"It took {time.time() - start} to run {eval.get_info()}")
+        return stats
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """
+        Run each evaluator and get its sufficient statistics
+        Returns:
+            dict[str, dict[str, float]]: evaluator name -> summed statistics
+        """
+        stats = {}
+        for name, eval in zip(self._names, self._evaluators):
+            start = time.time()
+            with profiling.evaluator(name), monitoring.task(
+                name, self._num_ids
+            ) as task:
+                stats[name] = eval.get_stats()
+                task["evaluated"] = len(eval.utterance_stats or {})
+            logging.info(f"It took {time.time() - start} to run {eval.get_info()}")
+        return stats
+
+    @property
+    def utterance_stats(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        Per-utterance statistics summed by the last `get_stats`
+        Returns:
+            dict[str, dict[str, dict[str, float]]]: evaluator name -> utterance id
+                -> statistics name -> value
+        """
+        return {
+            name: eval.utterance_stats or {}
+            for name, eval in zip(self._names, self._evaluators)
+        }
 
     def get_metric(self) -> list[tuple[str, float]]:
         """
@@ -64,9 +167,28 @@ class CombinedEvaluator(Evaluator):
         Returns:
             list[tuple[str, float]]: A list of tuples, where each tuple contains a metric name and a value
         """
-        metrics = []
-        for eval in self._evaluators:
-            start = time.time()
-            metrics.extend(eval.get_metric())
-            logging.info(f"It took {time.time() - start} to run {eval.get_info()}")
-        return metrics
+        return metrics_from_stats(self.get_stats())
+
+
+def metrics_from_stats(
+    stats: dict[str, dict[str, float]],
+) -> list[tuple[str, float]]:
+    """
+    Compute metrics of multiple evaluators from their summed sufficient statistics,
+    i.e. merged from multiple shards
+    Args:
+        stats (dict[str, dict[str, float]]): evaluator name -> summed statistics
+    Returns:
+        list[tuple[str, float]]: A list of tuples, where each tuple contains a metric name and a value
+    """
+    metrics = []
+    for name, eval_stats in stats.items():
+        evaluator_cls = name2evaluator[name]
+        if not eval_stats:
+            # nothing was evaluated, i.e. model is not available
+            metrics.extend(evaluator_cls.metrics_without_stats())
+            continue
+        with profiling.evaluator(name), profiling.stage("aggregation"):
+            eval_metrics = evaluator_cls.metrics_from_stats(eval_stats)
+        metrics.extend((metric, float(value)) for metric, value in eval_metrics)
+    return metrics
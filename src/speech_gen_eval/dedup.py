@@ -0,0 +1,164 @@
+"""
+Copyright 2025 Balacoon
+
+Dedup - content hashes of the audio of a run, so identical audio (a reference shared
+by many ids, generated files which are the originals, duplicated clips) is converted,
+embedded and scored once, and the results fan out to all the ids
+"""
+
+import concurrent.futures
+import logging
+import os
+import shutil
+from typing import Optional, Union
+
+from speech_gen_eval import threads
+from speech_gen_eval.audio_dir import (
+    AudioSource,
+    audio_hash,
+    converted_durations,
+    get_audio_source,
+)
+
+
+def hash_audio(
+    location: Optional[Union[str, AudioSource]], names: list[str]
+) -> dict[str, str]:
+    """
+    Content hashes of the audio files (see `audio_dir.audio_hash`), computed in parallel.
+    Used for both the keys of the stats cache and deduplication within a run
+    Args:
+        location (Optional[Union[str, AudioSource]]): directory, archives or a source
+            (see `get_audio_source`), nothing is hashed if None
+        names (list[str]): ids of the audio files
+    Returns:
+        dict[str, str]: id -> hash, ids without audio are skipped
+    """
+    if location is None or not names:
+        return {}
+    source = get_audio_source(location)
+
+    def _hash(name: str) -> Optional[str]:
+        if source.find(name) is None:
+            return None
+        path = source.path(name)
+        return audio_hash(path if path is not None else source.read(name))
+
+    with concurrent.futures.ThreadPoolExecutor(threads.pool_size(len(names))) as pool:
+        hashes = dict(zip(names, pool.map(_hash, names)))
+    return {name: x for name, x in hashes.items() if x is not None}
+
+
+def split_duplicates(
+    names: list[str], hashes: dict[str, str], converted: dict[str, str]
+) -> tuple[list[str], dict[str, str]]:
+    """
+    Split the audio to convert from the duplicates, which are linked once converted
+    Args:
+        names (list[str]): ids of the audio files, in the order of conversion
+        hashes (dict[str, str]): id -> content hash, see `hash_audio`
+        converted (dict[str, str]): content hash -> file already converted
+    Returns:
+        tuple: ids to convert (the first one of each content),
+            duplicate id -> hash of the audio converted under another id
+    """
+    first: set[str] = set()
+    duplicates = {}
+    for name in names:
+        content = hashes.get(name)
+        if content in converted or content in first:
+            duplicates[name] = content
+        elif content is not None:
+            first.add(content)
+    return [x for x in names if x not in duplicates], duplicates
+
+
+def link_duplicates(
+    output_dir: str,
+    names: list[str],
+    duplicates: dict[str, str],
+    hashes: dict[str, str],
+    converted: dict[str, str],
+):
+    """
+    Register the files converted into the directory and link the duplicates to them,
+    durations of the linked files are recorded for `audio_dir.converted_durations`
+    Args:
+        output_dir (str): directory of the conversion
+        names (list[str]): converted ids, see `split_duplicates`
+        duplicates (dict[str, str]): duplicate id -> content hash, see `split_duplicates`
+        hashes (dict[str, str]): id -> content hash
+        converted (dict[str, str]): content hash -> converted file, updated in place
+    """
+    for name in names:
+        path = os.path.join(output_dir, f"{name}.wav")
+        if name in hashes and os.path.isfile(path):
+            converted[hashes[name]] = path
+    # the registry of the directory, updated in place
+    durations = converted_durations(output_dir)
+    for name, content in duplicates.items():
+        if content not in converted:
+            continue
+        src = converted[content]
+        _link(src, os.path.join(output_dir, f"{name}.wav"))
+        stem = os.path.splitext(os.path.basename(src))[0]
+        duration = converted_durations(os.path.dirname(src)).get(stem)
+        if duration is not None:
+            durations[name] = duration
+    if duplicates:
+        logging.info(f"{len(duplicates)} files are duplicates, not converted")
+
+
+def _link(src: str, dst: str):
+    """
+    Hard link a converted file, copy it if the filesystem doesn't support links
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def unique_ids(
+    ids: list[tuple[str, str]], keys: dict[str, str]
+) -> tuple[list[tuple[str, str]], dict[str, str]]:
+    """
+    Collapse utterances with identical inputs
+    Args:
+        ids (list[tuple[str, str]]): ids and texts of the utterances
+        keys (dict[str, str]): id -> key of the inputs (see `stats_cache.utterance_keys`),
+            utterances without a key are kept
+    Returns:
+        tuple: the first utterance of each key (in order of the ids),
+            duplicate id -> id it is a duplicate of
+    """
+    first: dict[str, str] = {}
+    unique, duplicates = [], {}
+    for name, text in ids:
+        key = keys.get(name)
+        if key is None:
+            unique.append((name, text))
+        elif key in first:
+            duplicates[name] = first[key]
+        else:
+            first[key] = name
+            unique.append((name, text))
+    return unique, duplicates
+
+
+def fan_out(
+    utterance_stats: dict[str, dict[str, float]], duplicates: dict[str, str]
+) -> dict[str, dict[str, float]]:
+    """
+    Copy statistics of the evaluated utterances to their duplicates
+    Args:
+        utterance_stats (dict[str, dict[str, float]]): utterance id -> statistics
+        duplicates (dict[str, str]): duplicate id -> evaluated id, see `unique_ids`
+    Returns:
+        dict[str, dict[str, float]]: statistics of the evaluated utterances and their duplicates
+    """
+    stats = dict(utterance_stats)
+    for name, first in duplicates.items():
+        if first in utterance_stats:
+            stats[name] = dict(utterance_stats[first])
+    return stats
@@ -5,31 +5,94 @@ Main evaluation function
 """
 
 import logging
+import os
+import time
 import warnings
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
 
+import numpy as np
 import yaml
 
 # supress warnings from torch and transformers
 warnings.filterwarnings("ignore", category=FutureWarning, module="transformers")
 warnings.filterwarnings("ignore", category=UserWarning, module="torch")
 
-from speech_gen_eval.audio_dir import convert_audio_dir, sort_ids_by_audio_size
+from speech_gen_eval import monitoring, profiling
+from speech_gen_eval.audio_dir import convert_audio_dir, sort_ids_by_duration
+from speech_gen_eval.bootstrap import (
+    bootstrap_intervals,
+    paired_comparison,
+    read_utterance_stats,
+)
 from speech_gen_eval.combined_evaluator import (
     CombinedEvaluator,
+    metrics_from_stats,
+    name2evaluator,
     type2names,
 )
-from speech_gen_eval.ids import read_txt_and_mapping
+from speech_gen_eval.dedup import fan_out, hash_audio, unique_ids
+from speech_gen_eval.evaluator import sum_stats
+from speech_gen_eval.ids import (
+    parse_shard,
+    read_manifest_ids,
+    read_speakers,
+    read_txt_and_mapping,
+)
+from speech_gen_eval.manifest import Manifest, read_manifest
+from speech_gen_eval.plan import EvaluationPlan
+from speech_gen_eval.results_store import ResultsStore
+from speech_gen_eval.stats_cache import (
+    StatsCache,
+    evaluator_settings,
+    utterance_keys,
+)
+
+# utterances evaluated before the first check of the early-stopping mode,
+# next chunks grow with the number of evaluated utterances
+_early_stop_min_chunk = 50
+# ways to run the evaluation, see `_select_mode`: early stopping on a random subset,
+# incremental with cached statistics (with or without deduplication),
+# with utterances of identical inputs evaluated once, or all the utterances
+_run_modes = ["early_stop", "incremental", "incremental_dedup", "dedup", "plain"]
 
 
 def speech_gen_eval(
-    txt_path: str,
-    generated_audio: str,
+    txt_path: str | None,
+    generated_audio: str | None,
     eval_type: str,
     original_audio: str | None = None,
     mapping_path: str | None = None,
     evaluators: list[str] | None = None,
     ignore_missing: bool = False,
     out_path: str | None = None,
+    speakers_path: str | None = None,
+    secs_modes: list[str] | None = None,
+    profile: bool = False,
+    trace_path: str | None = None,
+    cprofile_path: str | None = None,
+    torch_profile_path: str | None = None,
+    shard: str | None = None,
+    dry_run: bool = False,
+    backends: dict[str, str] | None = None,
+    precisions: dict[str, str] | None = None,
+    transcript_cache: str | None = None,
+    asr_decoding: dict | None = None,
+    f0_alignment: str | None = None,
+    stats_cache: str | None = None,
+    dedup: bool = False,
+    manifest_path: str | None = None,
+    bootstrap: int | None = None,
+    confidence: float = 0.95,
+    baseline_path: str | None = None,
+    early_stop: float | None = None,
+    metric_tolerances: dict[str, float] | None = None,
+    time_budget: float | None = None,
+    results_db: str | None = None,
+    system: str | None = None,
+    progress: bool = True,
+    metrics_textfile: str | None = None,
+    metrics_port: int | None = None,
     **kwargs,
 ) -> list[tuple[str, float]]:
     """
@@ -43,42 +106,790 @@ def speech_gen_eval(
         evaluators: List of evaluators for custom evaluation
         ignore_missing: Whether to ignore missing/failed files
         out_path: Output file to save metrics
+        speakers_path: Path to file mapping original audio ids to speakers
+        secs_modes: Additional speaker similarity modes, "centroid" and/or "matrix"
+        profile: Whether to record per-evaluator and per-stage timings into the output file
+        trace_path: Where to save recorded spans (Chrome trace, or OpenTelemetry-style if ".jsonl")
+        cprofile_path: Where to dump cProfile stats of the run
+        torch_profile_path: Where to export torch.profiler trace of the run
+        shard: Evaluate only a shard of ids, "i/N". Sufficient statistics are saved
+            to the output file, so shards can be merged with `speech-gen-eval merge`
+        dry_run: Only print the evaluation plan with the estimated cost, evaluate nothing
+        backends: Execution backend per evaluator, i.e. {"utmos": "onnx"}
+        precisions: CPU inference precision per evaluator, i.e. {"cer": "int8"}
+        transcript_cache: sqlite file with cached ASR transcripts, only new or changed
+            audio is transcribed. Not cached if None
+        asr_decoding: ASR decoding options: forced "language" and "task",
+            "bounded" for greedy decoding with new tokens capped from the text length
+        f0_alignment: How F0 accuracy pairs generated and reference frames:
+            "time" (default) or "dtw" for audio which length differs
+        stats_cache: Incremental mode: sqlite file with cached per-utterance statistics,
+            only new or changed utterances are evaluated
+        dedup: Evaluate utterances with identical inputs (same audio content,
+            and text if the evaluator reads it) once, and copy their statistics.
+            All the audio is hashed first, so it pays off only for sets with duplicates.
+            Can't be combined with the early-stopping mode
+        manifest_path: JSONL/Parquet manifest (see `speech-gen-eval index`) with ids, texts,
+            audio paths and durations, replaces txt_path, generated_audio,
+            original_audio and mapping_path
+        bootstrap: Number of bootstrap resamples: confidence intervals of the metrics
+            and per-utterance statistics are saved to the output file
+        confidence: Confidence level of the bootstrap intervals
+        baseline_path: Output file of a baseline run with bootstrap, to compare with
+            by a paired bootstrap test (requires bootstrap)
+        early_stop: Early-stopping mode: evaluate a random stream of utterances and stop
+            each evaluator once half-widths of the confidence intervals of its metrics
+            are within this tolerance. Implies bootstrap (1000 resamples by default)
+        metric_tolerances: Per-metric tolerances of the early-stopping mode,
+            i.e. {"whisperv3_cer": 0.005}, early_stop for metrics not listed
+        time_budget: Seconds after which the early-stopping mode stops
+            all the evaluators
+        results_db: SQLite results store to save the run with per-utterance scores to,
+            see `results_store`
+        system: Name of the evaluated system in the results store,
+            name of the generated audio directory (or the manifest) by default
+        progress: Whether to show the progress of conversion and evaluators with ETA
+        metrics_textfile: File to keep live counters of the run in (Prometheus text format),
+            for the node_exporter textfile collector, see `monitoring`
+        metrics_port: Serve live counters of the run at http://127.0.0.1:<port>/metrics
         **kwargs: Additional fields to be saved to the output file
     Returns:
         List of (metric_name, value) tuples
     """
-    txt, mapping = read_txt_and_mapping(
+    mode = _select_mode(early_stop, stats_cache, dedup, shard, secs_modes)
+    manifest = None
+    if manifest_path is not None:
+        manifest = read_manifest(manifest_path)
+        generated_audio, original_audio = manifest.generated, manifest.original
+    if dry_run:
+        plan = _make_plan(
+            txt_path,
+            generated_audio,
+            eval_type,
+            original_audio=original_audio,
+            mapping_path=mapping_path,
+            evaluators=evaluators,
+            ignore_missing=ignore_missing,
+            shard=parse_shard(shard) if shard else None,
+            manifest=manifest,
+        )[0]
+        print(plan.describe(generated_audio, original_audio), end="")
+        return []
+
+    profile = profile or trace_path is not None
+    stopping = None
+    if mode == "early_stop":
+        bootstrap = bootstrap or 1000
+        stopping = dict(
+            tolerance=early_stop,
+            metric_tolerances=metric_tolerances or {},
+            time_budget=time_budget,
+            resamples=bootstrap,
+            confidence=confidence,
+        )
+    with profiling.profile_run() if profile else nullcontext() as profiler:
+        with monitoring.monitor_run(
+            textfile=metrics_textfile, port=metrics_port, display=progress
+        ), profiling.hot_path_profiler(cprofile_path, torch_profile_path):
+            stats, utterance_stats = _run_evaluation(
+                txt_path,
+                generated_audio,
+                eval_type,
+                original_audio=original_audio,
+                mapping_path=mapping_path,
+                evaluators=evaluators,
+                ignore_missing=ignore_missing,
+                shard=parse_shard(shard) if shard else None,
+                backends=backends,
+                precisions=precisions,
+                speakers=read_speakers(speakers_path) if speakers_path else None,
+                secs_modes=secs_modes,
+                transcript_cache=transcript_cache,
+                asr_decoding=asr_decoding,
+                f0_alignment=f0_alignment,
+                stats_cache=stats_cache,
+                manifest=manifest,
+                mode=mode,
+                stopping=stopping,
+            )
+            metrics = metrics_from_stats(stats)
+            for metric in metrics:
+                logging.info(f"{metric[0]}: {metric[1]:.4f}")
+            if bootstrap:
+                with profiling.stage("bootstrap"):
+                    intervals, comparison = _bootstrap(
+                        utterance_stats, bootstrap, confidence, baseline_path
+                    )
+    if trace_path:
+        profiler.save_trace(trace_path)
+
+    if results_db:
+        location = manifest_path if manifest_path is not None else generated_audio
+        _save_run(
+            results_db,
+            system or os.path.basename(os.path.normpath(location)),
+            metrics,
+            utterance_stats,
+            config=dict(
+                eval_type=eval_type,
+                evaluators=list(stats),
+                shard=shard,
+                backends=backends,
+                precisions=precisions,
+                asr_decoding=asr_decoding,
+                f0_alignment=f0_alignment,
+                **kwargs,
+            ),
+        )
+
+    if out_path:
+        _write_output(
+            out_path,
+            {"metrics": dict(metrics), **kwargs},
+            shard=shard,
+            stats=stats,
+            bootstrap=(
+                _bootstrap_output(
+                    stats,
+                    utterance_stats,
+                    bootstrap,
+                    confidence,
+                    intervals,
+                    comparison,
+                    stopping,
+                )
+                if bootstrap
+                else None
+            ),
+            profile=profiler.summary() if profile else None,
+        )
+
+    return metrics
+
+
+def _write_output(
+    out_path: str,
+    output_dict: dict,
+    shard: str | None = None,
+    stats: dict[str, dict[str, float]] | None = None,
+    bootstrap: dict | None = None,
+    profile: dict | None = None,
+):
+    """
+    Save the output yaml: metrics and extra fields, sufficient statistics of a shard
+    (see `merge`), bootstrap fields (see `_bootstrap_output`) and the profile
+    """
+    if shard:
+        output_dict["shard"] = shard
+        output_dict["stats"] = stats
+    if bootstrap is not None:
+        output_dict.update(bootstrap)
+    if profile is not None:
+        output_dict["profile"] = profile
+    with open(out_path, "w") as f:
+        yaml.dump(output_dict, f, default_flow_style=False)
+
+
+def _save_run(
+    results_db: str,
+    system: str,
+    metrics: list[tuple[str, float]],
+    utterance_stats: dict[str, dict[str, dict[str, float]]],
+    config: dict,
+):
+    """
+    Save the run with per-utterance scores to the results store, see `results_store`
+    """
+    store = ResultsStore(results_db)
+    run_id = store.add_run(system, metrics, utterance_stats, config=config)
+    store.close()
+    logging.info(f"Saved run {run_id} to {results_db}")
+
+
+def _bootstrap_output(
+    stats: dict[str, dict[str, float]],
+    utterance_stats: dict[str, dict[str, dict[str, float]]],
+    resamples: int,
+    confidence: float,
+    intervals: dict[str, list[float]],
+    comparison: dict[str, dict[str, float]] | None,
+    stopping: dict | None,
+) -> dict:
+    """
+    Fields of the output file of a run with bootstrap: confidence intervals,
+    comparison with the baseline, convergence of the early-stopping mode
+    and per-utterance statistics, so later runs can be compared with this one
+    """
+    output_dict = {
+        "bootstrap": {"resamples": resamples, "confidence": confidence},
+        "confidence_intervals": intervals,
+    }
+    if comparison is not None:
+        output_dict["comparison"] = comparison
+    if stopping is not None:
+        output_dict["early_stopping"] = {
+            name: {
+                "utterances": len(utterance_stats[name]),
+                "converged": _converged(name, stats[name], intervals, stopping),
+            }
+            for name in stats
+        }
+    output_dict["utterance_stats"] = {
+        name: {
+            x: {key: float(v) for key, v in values.items()}
+            for x, values in eval_stats.items()
+        }
+        for name, eval_stats in utterance_stats.items()
+    }
+    return output_dict
+
+
+def _select_mode(
+    early_stop: float | None,
+    stats_cache: str | None,
+    dedup: bool,
+    shard: str | None,
+    secs_modes: list[str] | None,
+) -> str:
+    """
+    Select how the evaluation runs, see `speech_gen_eval` for the arguments.
+    Arguments of modes which can't be combined raise instead of overriding each other
+    Returns:
+        str: one of `_run_modes`
+    """
+    if shard and secs_modes:
+        # centroids and the similarity matrix would be computed within each shard
+        raise ValueError(
+            "Speaker similarity modes compare utterances across the whole set, "
+            "they can't be sharded"
+        )
+    if early_stop is not None:
+        if stats_cache is not None or secs_modes or dedup:
+            raise ValueError(
+                "Early stopping evaluates a random subset of utterances, "
+                "it can't be combined with stats_cache, secs_modes or dedup"
+            )
+        return "early_stop"
+    if stats_cache is not None:
+        return "incremental_dedup" if dedup else "incremental"
+    return "dedup" if dedup else "plain"
+
+
+def _bootstrap(
+    utterance_stats: dict[str, dict[str, dict[str, float]]],
+    num_resamples: int,
+    confidence: float,
+    baseline_path: str | None,
+) -> tuple[dict[str, list[float]], dict[str, dict[str, float]] | None]:
+    """
+    Bootstrap confidence intervals of the metrics and, if there is a baseline run,
+    paired comparison with it
+    Returns:
+        tuple: metric name -> [low, high], metric name -> comparison (or None)
+    """
+    intervals = bootstrap_intervals(
+        utterance_stats, num_resamples=num_resamples, confidence=confidence
+    )
+    for metric, (low, high) in intervals.items():
+        logging.info(f"{metric}: {confidence:.0%} CI [{low:.4f}, {high:.4f}]")
+    if baseline_path is None:
+        return intervals, None
+    baseline_stats = read_utterance_stats(baseline_path)
+    if baseline_stats is None:
+        raise ValueError(f"{baseline_path} has no per-utterance statistics")
+    comparison = paired_comparison(
+        utterance_stats,
+        baseline_stats,
+        num_resamples=num_resamples,
+        confidence=confidence,
+    )
+    for metric, x in comparison.items():
+        logging.info(
+            f"{metric}: {x['delta']:+.4f} vs baseline "
+            f"[{x['low']:+.4f}, {x['high']:+.4f}], p={x['p_value']:.4f}"
+        )
+    return intervals, comparison
+
+
+def _make_plan(
+    txt_path: str,
+    generated_audio: str,
+    eval_type: str,
+    original_audio: str | None = None,
+    mapping_path: str | None = None,
+    evaluators: list[str] | None = None,
+    ignore_missing: bool = False,
+    shard: tuple[int, int] | None = None,
+    manifest: Manifest | None = None,
+) -> tuple[EvaluationPlan, list[tuple[str, str]], dict[str, str] | None]:
+    """
+    Read the ids and plan the evaluation, see `speech_gen_eval` for the arguments
+    Returns:
+        tuple: the plan, ids and texts to evaluate, mapping to reference ids
+    """
+    with profiling.stage("read_ids"):
+        if manifest is not None:
+            # durations are in the manifest, audio files are not touched
+            txt, mapping = read_manifest_ids(
+                manifest, ignore_missing=ignore_missing, shard=shard
+            )
+        else:
+            txt, mapping = read_txt_and_mapping(
+                txt_path,
+                generated_audio,
+                mapping_path=mapping_path,
+                original_audio=original_audio,
+                ignore_missing=ignore_missing,
+                shard=shard,
+            )
+        txt = sort_ids_by_duration(generated_audio, txt)
+    eval_names = evaluators if eval_type == "custom" else type2names[eval_type]
+    return EvaluationPlan(eval_names, txt, mapping), txt, mapping
+
+
+def _run_evaluation(
+    txt_path: str,
+    generated_audio: str,
+    eval_type: str,
+    original_audio: str | None = None,
+    mapping_path: str | None = None,
+    evaluators: list[str] | None = None,
+    ignore_missing: bool = False,
+    shard: tuple[int, int] | None = None,
+    backends: dict[str, str] | None = None,
+    precisions: dict[str, str] | None = None,
+    speakers: dict[str, str] | None = None,
+    secs_modes: list[str] | None = None,
+    transcript_cache: str | None = None,
+    asr_decoding: dict | None = None,
+    f0_alignment: str | None = None,
+    stats_cache: str | None = None,
+    manifest: Manifest | None = None,
+    mode: str = "plain",
+    stopping: dict | None = None,
+) -> tuple[dict[str, dict[str, float]], dict[str, dict[str, dict[str, float]]]]:
+    """
+    Read the ids, convert the audio the plan needs and run the evaluators,
+    see `speech_gen_eval` for the arguments. `mode` is one of `_run_modes`
+    (see `_select_mode`), `stopping` are the settings of the early-stopping mode,
+    see `_run_early_stopping`
+    Returns:
+        tuple: evaluator name -> summed sufficient statistics,
+            evaluator name -> utterance id -> statistics
+    """
+    plan, txt, mapping = _make_plan(
         txt_path,
         generated_audio,
-        mapping_path=mapping_path,
+        eval_type,
         original_audio=original_audio,
+        mapping_path=mapping_path,
+        evaluators=evaluators,
         ignore_missing=ignore_missing,
+        shard=shard,
+        manifest=manifest,
+    )
+    evaluator_kwargs = dict(
+        mapping=mapping,
+        ignore_errors=ignore_missing,
+        speakers=speakers,
+        secs_modes=secs_modes,
+        transcript_cache=transcript_cache,
+        asr_decoding=asr_decoding,
+        f0_alignment=f0_alignment,
+        # evaluators don't hash the audio to reuse results if it is not deduplicated
+        dedup=mode in ["dedup", "incremental_dedup"],
+    )
+    if mode == "early_stop":
+        return _run_early_stopping(
+            plan,
+            txt,
+            generated_audio,
+            original_audio,
+            stopping,
+            backends=backends or {},
+            precisions=precisions or {},
+            **evaluator_kwargs,
+        )
+    if mode in ["incremental", "incremental_dedup"]:
+        return _run_incremental(
+            plan,
+            txt,
+            generated_audio,
+            original_audio,
+            stats_cache,
+            backends=backends or {},
+            precisions=precisions or {},
+            **evaluator_kwargs,
+        )
+    if mode == "dedup":
+        return _run_deduplicated(
+            plan,
+            txt,
+            generated_audio,
+            original_audio,
+            backends=backends or {},
+            precisions=precisions or {},
+            **evaluator_kwargs,
+        )
+    monitoring.set_weights(_progress_weights(plan, generated_audio, original_audio))
+    with converted_audio(
+        plan, txt, generated_audio, original_audio, ignore_missing
+    ) as (generated_16khz, original_16khz):
+        evaluator = CombinedEvaluator(
+            plan.evaluators,
+            ids=txt,
+            generated_audio=generated_16khz,
+            original_audio=original_16khz,
+            backends=backends,
+            precisions=precisions,
+            **evaluator_kwargs,
+        )
+        stats = evaluator.get_stats()
+        return stats, evaluator.utterance_stats
+
+
+def _run_deduplicated(
+    plan: EvaluationPlan,
+    txt: list[tuple[str, str]],
+    generated_audio: str,
+    original_audio: str | None,
+    backends: dict[str, str],
+    precisions: dict[str, str],
+    mapping: dict[str, str] | None = None,
+    ignore_errors: bool = False,
+    **kwargs,
+) -> tuple[dict[str, dict[str, float]], dict[str, dict[str, dict[str, float]]]]:
+    """
+    Evaluate each unique input of the evaluators once: utterances which audio
+    (and text, if the evaluator reads it) has the same content as of an earlier one
+    get its statistics. Audio files with the same content are converted once.
+    Evaluators which statistics depend on all the utterances run on all of them.
+    Returns:
+        tuple: evaluator name -> summed sufficient statistics,
+            evaluator name -> utterance id -> statistics
+    """
+    with profiling.stage("dedup", items=len(txt)):
+        hashes = (
+            hash_audio(generated_audio, [name for name, _ in txt]),
+            hash_audio(original_audio, plan.original),
+        )
+        # utterances each of the evaluators evaluates, duplicate id -> evaluated id
+        todo, duplicates = {}, {}
+        for name in plan.evaluators:
+            settings = evaluator_settings(
+                name,
+                backends.get(name, "torch"),
+                precisions.get(name, "fp32"),
+                **kwargs,
+            )
+            if settings is None:
+                todo[name], duplicates[name] = txt, {}
+                continue
+            keys = utterance_keys(name, settings, txt, *hashes, mapping)
+            todo[name], duplicates[name] = unique_ids(txt, keys)
+            if duplicates[name]:
+                logging.info(
+                    f"{name}: {len(duplicates[name])} utterances are duplicates, "
+                    f"evaluating {len(todo[name])}"
+                )
+    todo_ids = {x[0] for ids in todo.values() for x in ids}
+    run_txt = [x for x in txt if x[0] in todo_ids]
+    run_plan = EvaluationPlan(plan.evaluators, run_txt, mapping)
+    monitoring.set_weights(_progress_weights(run_plan, generated_audio, original_audio))
+    # evaluators of the same utterances run together
+    groups = defaultdict(list)
+    for name, ids in todo.items():
+        groups[tuple(x[0] for x in ids)].append(name)
+
+    stats, utterance_stats = {}, {}
+    with converted_audio(
+        run_plan, run_txt, generated_audio, original_audio, ignore_errors, hashes
+    ) as (generated_16khz, original_16khz):
+        for names in groups.values():
+            evaluator = CombinedEvaluator(
+                names,
+                ids=todo[names[0]],
+                generated_audio=generated_16khz,
+                original_audio=original_16khz,
+                mapping=mapping,
+                ignore_errors=ignore_errors,
+                backends={x: backends[x] for x in names if x in backends},
+                precisions={x: precisions[x] for x in names if x in precisions},
+                **kwargs,
+            )
+            stats.update(evaluator.get_stats())
+            utterance_stats.update(evaluator.utterance_stats)
+    for name, evaluated in duplicates.items():
+        if evaluated:
+            utterance_stats[name] = fan_out(utterance_stats[name], evaluated)
+            stats[name] = sum_stats(list(utterance_stats[name].values()))
+    return (
+        {name: stats[name] for name in plan.evaluators},
+        {name: utterance_stats[name] for name in plan.evaluators},
     )
-    txt = sort_ids_by_audio_size(generated_audio, txt)
 
-    with convert_audio_dir(generated_audio, txt, sample_rate=16000) as generated_16khz:
+
+def _progress_weights(
+    plan: EvaluationPlan, generated_audio: str, original_audio: str | None
+) -> dict[str, float]:
+    """
+    Estimated cost of the monitoring tasks of the plan (see `monitoring`),
+    overall progress of the run is weighted with them
+    """
+    weights = {}
+    for stage, seconds in plan.estimate(generated_audio, original_audio).items():
+        if stage != "convert_audio_dir" and stage not in plan.evaluators:
+            # shared features are computed within a single task
+            stage = "features"
+        weights[stage] = weights.get(stage, 0.0) + seconds
+    return weights
+
+
+@contextmanager
+def converted_audio(
+    plan: EvaluationPlan,
+    txt: list[tuple[str, str]],
+    generated_audio: str,
+    original_audio: str | None,
+    ignore_missing: bool,
+    hashes: tuple[dict[str, str], dict[str, str]] | None = None,
+):
+    """
+    Convert the audio the plan needs to 16kHz and compute the shared features.
+    With content hashes of generated and original audio (see `dedup`),
+    audio with the same content is converted once, in both directories
+    Yields:
+        tuple: directories with converted generated and original audio
+    """
+    # only the original audio evaluators read is converted
+    original_ids = [(name, "") for name in plan.original]
+    generated_hashes, original_hashes = hashes or (None, None)
+    # content hash -> converted file, shared by both conversions
+    converted = {}
+    with convert_audio_dir(
+        generated_audio,
+        txt,
+        sample_rate=16000,
+        hashes=generated_hashes,
+        converted=converted,
+    ) as generated_16khz:
         with convert_audio_dir(
-            original_audio, txt, mapping=mapping, sample_rate=16000
+            original_audio if plan.original else None,
+            original_ids,
+            sample_rate=16000,
+            hashes=original_hashes,
+            converted=converted,
         ) as original_16khz:
-            if eval_type == "custom":
-                eval_names = evaluators
-            else:
-                eval_names = type2names[eval_type]
+            plan.compute_shared_features(
+                generated_16khz, original_16khz, ignore_errors=ignore_missing
+            )
+            yield generated_16khz, original_16khz
+
+
+def _run_incremental(
+    plan: EvaluationPlan,
+    txt: list[tuple[str, str]],
+    generated_audio: str,
+    original_audio: str | None,
+    stats_cache_path: str,
+    backends: dict[str, str],
+    precisions: dict[str, str],
+    mapping: dict[str, str] | None = None,
+    ignore_errors: bool = False,
+    dedup: bool = False,
+    **kwargs,
+) -> tuple[dict[str, dict[str, float]], dict[str, dict[str, dict[str, float]]]]:
+    """
+    Evaluate only utterances which per-utterance statistics are not cached yet
+    (new or changed audio, text or evaluator settings), store them,
+    and sum them with the cached ones.
+    Evaluators which statistics can't be cached run on all the utterances.
+    Args:
+        dedup (bool): evaluate utterances with the same key as an earlier one once
+    Returns:
+        tuple: evaluator name -> summed sufficient statistics,
+            evaluator name -> utterance id -> statistics
+    """
+    cache = StatsCache(stats_cache_path)
+    with profiling.stage("stats_cache_lookup", items=len(txt)):
+        generated_hashes = hash_audio(generated_audio, plan.generated)
+        original_hashes = hash_audio(original_audio, plan.original)
+        keys, cached, uncached = {}, {}, []
+        for name in plan.evaluators:
+            settings = evaluator_settings(
+                name,
+                backends.get(name, "torch"),
+                precisions.get(name, "fp32"),
+                **kwargs,
+            )
+            if settings is None:
+                uncached.append(name)
+                continue
+            keys[name] = utterance_keys(
+                name, settings, txt, generated_hashes, original_hashes, mapping
+            )
+            found = cache.get(sorted(set(keys[name].values())))
+            cached[name] = {x: found[k] for x, k in keys[name].items() if k in found}
+    # ids each of the evaluators has to evaluate
+    todo = {
+        name: [x for x in txt if x[0] not in cached[name]]
+        for name in keys
+        if len(cached[name]) < len(txt)
+    }
+    # utterances with the same key as an earlier one are evaluated once
+    unique = {
+        name: unique_ids(ids, keys[name]) if dedup else (ids, {})
+        for name, ids in todo.items()
+    }
+    todo = {name: ids for name, (ids, _) in unique.items()}
+    duplicates = {name: x for name, (_, x) in unique.items()}
+    for name in keys:
+        logging.info(
+            f"{name}: {len(cached[name])} utterances are cached, "
+            f"evaluating {len(todo.get(name, []))}"
+        )
+    todo_ids = {x[0] for ids in todo.values() for x in ids}
+    run_txt = txt if uncached else [x for x in txt if x[0] in todo_ids]
+
+    stats, utterance_stats = {}, {}
+    run_plan = EvaluationPlan(list(todo) + uncached, run_txt, mapping)
+    if run_plan.evaluators:
+        with converted_audio(
+            run_plan, run_txt, generated_audio, original_audio, ignore_errors
+        ) as (generated_16khz, original_16khz):
+
+            def _evaluator(names, ids):
+                return CombinedEvaluator(
+                    names,
+                    ids=ids,
+                    generated_audio=generated_16khz,
+                    original_audio=original_16khz,
+                    mapping=mapping,
+                    ignore_errors=ignore_errors,
+                    backends={x: backends[x] for x in names if x in backends},
+                    precisions={x: precisions[x] for x in names if x in precisions},
+                    dedup=dedup,
+                    **kwargs,
+                )
+
+            for name, ids in todo.items():
+                new = _evaluator([name], ids).get_utterance_stats()[name]
+                new = fan_out(new, duplicates[name])
+                cache.put({keys[name][x]: new[x] for x in new if x in keys[name]})
+                cached[name].update(new)
+            if uncached:
+                evaluator = _evaluator(uncached, txt)
+                stats.update(evaluator.get_stats())
+                utterance_stats.update(evaluator.utterance_stats)
+    cache.close()
+    for name in keys:
+        stats[name] = sum_stats(list(cached[name].values()))
+        utterance_stats[name] = cached[name]
+    return (
+        {name: stats[name] for name in plan.evaluators},
+        {name: utterance_stats[name] for name in plan.evaluators},
+    )
+
+
+def _run_early_stopping(
+    plan: EvaluationPlan,
+    txt: list[tuple[str, str]],
+    generated_audio: str,
+    original_audio: str | None,
+    stopping: dict,
+    backends: dict[str, str],
+    precisions: dict[str, str],
+    mapping: dict[str, str] | None = None,
+    ignore_errors: bool = False,
+    seed: int = 0,
+    **kwargs,
+) -> tuple[dict[str, dict[str, float]], dict[str, dict[str, dict[str, float]]]]:
+    """
+    Evaluate a random stream of utterances in growing chunks. After each chunk,
+    evaluators which metrics are known within the tolerance (half-width
+    of the bootstrap confidence interval) stop, the rest continue on the next chunk,
+    until all the evaluators stop, the utterances or the time budget run out.
+    Args:
+        stopping (dict): "tolerance", "metric_tolerances", "time_budget",
+            "resamples" and "confidence", see `speech_gen_eval`
+        seed (int): seed of the random order of the utterances
+    Returns:
+        tuple: evaluator name -> summed sufficient statistics,
+            evaluator name -> utterance id -> statistics
+    """
+    for name in plan.evaluators:
+        if name2evaluator[name].cache_settings(**kwargs) is None:
+            raise ValueError(
+                f"Statistics of {name} depend on all the utterances, "
+                "it can't be evaluated on a subset"
+            )
+    order = np.random.default_rng(seed).permutation(len(txt))
+    stream = [txt[i] for i in order]
+    active = list(plan.evaluators)
+    utterance_stats = {name: {} for name in plan.evaluators}
+    # models are loaded once for all the chunks
+    model_cache = {}
+    start, done = time.time(), 0
+    while active and done < len(stream):
+        chunk = stream[done : done + max(_early_stop_min_chunk, done // 2)]
+        done += len(chunk)
+        chunk_plan = EvaluationPlan(active, chunk, mapping)
+        with converted_audio(
+            chunk_plan, chunk, generated_audio, original_audio, ignore_errors
+        ) as (generated_16khz, original_16khz):
             evaluator = CombinedEvaluator(
-                eval_names,
-                ids=txt,
+                active,
+                ids=chunk,
                 generated_audio=generated_16khz,
-                mapping=mapping,
                 original_audio=original_16khz,
-                ignore_errors=ignore_missing,
+                mapping=mapping,
+                ignore_errors=ignore_errors,
+                model_cache=model_cache,
+                backends={x: backends[x] for x in active if x in backends},
+                precisions={x: precisions[x] for x in active if x in precisions},
+                **kwargs,
             )
-            metrics = evaluator.get_metric()
-            for metric in metrics:
-                logging.info(f"{metric[0]}: {metric[1]:.4f}")
+            for name, stats in evaluator.get_utterance_stats().items():
+                utterance_stats[name].update(stats)
+        with profiling.stage("bootstrap"):
+            for name in list(active):
+                stats = utterance_stats[name]
+                intervals = bootstrap_intervals(
+                    {name: stats},
+                    num_resamples=stopping["resamples"],
+                    confidence=stopping["confidence"],
+                )
+                if _converged(
+                    name, sum_stats(list(stats.values())), intervals, stopping
+                ):
+                    logging.info(f"{name} converged after {len(stats)} utterances")
+                    active.remove(name)
+        budget = stopping["time_budget"]
+        if active and budget is not None and time.time() - start > budget:
+            logging.warning(f"Time budget is over, stopping {active}")
+            break
+    logging.info(f"Early stopping evaluated {done} of {len(stream)} utterances")
+    stats = {name: sum_stats(list(x.values())) for name, x in utterance_stats.items()}
+    return stats, utterance_stats
 
-    if out_path:
-        output_dict = {"metrics": dict(metrics), **kwargs}
-        with open(out_path, "w") as f:
-            yaml.dump(output_dict, f, default_flow_style=False)
 
-    return metrics
+def _converged(
+    name: str,
+    stats: dict[str, float],
+    intervals: dict[str, list[float]],
+    stopping: dict,
+) -> bool:
+    """
+    Check if all the metrics of the evaluator which have confidence intervals
+    are known within their tolerance
+    """
+    if not stats:
+        return False
+    metrics = [x for x, _ in name2evaluator[name].metrics_from_stats(stats)]
+    widths = {
+        x: (intervals[x][1] - intervals[x][0]) / 2 for x in metrics if x in intervals
+    }
+    return bool(widths) and all(
+        width <= stopping["metric_tolerances"].get(x, stopping["tolerance"])
+        for x, width in widths.items()
+    )
@@ -4,19 +4,140 @@ Copyright 2025 Balacoon
 Evaluator - abstract class that does some objective measurement for audio
 """
 
+from collections import defaultdict
+from typing import Callable, Optional
+
+
+def sum_stats(stats_lst: list[dict[str, float]]) -> dict[str, float]:
+    """
+    Sum sufficient statistics, i.e. of multiple utterances or of multiple shards
+    Args:
+        stats_lst (list[dict[str, float]]): statistics to sum
+    Returns:
+        dict[str, float]: summed statistics
+    """
+    total: dict[str, float] = defaultdict(float)
+    for stats in stats_lst:
+        for key, value in stats.items():
+            total[key] += value
+    return dict(total)
+
 
 class Evaluator:
     """
-    Abstract class for evaluators
+    Abstract class for evaluators.
+    Evaluators compute additive sufficient statistics per utterance
+    (sums, squared sums, counts, edit counts), metrics are computed from their sums.
+    This way partial results (i.e. of different shards) can be merged exactly.
     """
 
+    # audio the evaluator reads: "generated", "original" (original audio of the same id)
+    # and/or "reference" (original audio of the reference id from the mapping).
+    # The evaluation plan converts only the audio evaluators need.
+    inputs: tuple[str, ...] = ("generated",)
+    # features the evaluator uses on each of its inputs, i.e. "f0" or "speaker_embedding".
+    # Features in `features.shared_features` are computed once by the plan.
+    features: tuple[str, ...] = ()
+    # whether the statistics depend on the text of the utterance
+    uses_text: bool = False
+    # version of the per-utterance statistics. Bump it when they change,
+    # so statistics cached by the incremental mode (see `stats_cache`) are recomputed.
+    version: int = 1
+    # metrics which are better when lower (i.e. error rates), higher is better for the rest.
+    # Used to find regressed utterances in the results store (see `results_store`)
+    lower_is_better: tuple[str, ...] = ()
+    # rough CPU processing time per second of audio (excluding shared features),
+    # used to estimate the cost of the evaluation plan
+    rtf: float = 0.1
+    # execution backends of the evaluator's model, see `onnx_backend`.
+    # Selected backend is set by `CombinedEvaluator`.
+    supported_backends: tuple[str, ...] = ("torch",)
+    backend: str = "torch"
+    # CPU inference precisions of the evaluator's model, see `precision`.
+    # Selected precision is set by `CombinedEvaluator`.
+    supported_precisions: tuple[str, ...] = ("fp32",)
+    precision: str = "fp32"
+
+    # models shared between evaluator instances, i.e. of an evaluation session.
+    # if not set, models are loaded on each evaluation.
+    model_cache: Optional[dict] = None
+    # per-utterance statistics summed by the last `get_stats`,
+    # i.e. for bootstrap confidence intervals (see `bootstrap`)
+    utterance_stats: Optional[dict[str, dict[str, float]]] = None
+
+    def _get_model(self, key: str, load_fn: Callable):
+        """
+        Get a model from the cache, loading it if it is not there yet
+        Args:
+            key (str): key of the model in the cache
+            load_fn (Callable): function loading the model
+        """
+        if self.model_cache is None:
+            return load_fn()
+        if key not in self.model_cache:
+            self.model_cache[key] = load_fn()
+        return self.model_cache[key]
+
+    @classmethod
+    def cache_settings(cls, **kwargs) -> Optional[dict]:
+        """
+        Settings of the run the per-utterance statistics depend on, besides the audio,
+        backend and precision. They are a part of the key statistics are cached with
+        in the incremental mode. None if statistics of an utterance depend on other
+        utterances, so they can't be cached.
+        Args:
+            **kwargs: arguments evaluators are created with
+        """
+        return {}
+
+    def get_utterance_stats(self) -> dict[str, dict[str, float]]:
+        """
+        Get sufficient statistics for each of the evaluated utterances
+        Returns:
+            dict[str, dict[str, float]]: utterance id -> statistics name -> value
+        """
+        pass
+
+    def get_stats(self) -> dict[str, float]:
+        """
+        Get sufficient statistics summed over all the evaluated utterances
+        Returns:
+            dict[str, float]: statistics name -> value
+        """
+        self.utterance_stats = self.get_utterance_stats()
+        return sum_stats(list(self.utterance_stats.values()))
+
+    @classmethod
+    def metrics_from_stats(cls, stats: dict[str, float]) -> list[tuple[str, float]]:
+        """
+        Compute metrics from summed sufficient statistics.
+        Works element-wise if statistics are numpy arrays.
+        Args:
+            stats (dict[str, float]): statistics name -> value
+        Returns:
+            list[tuple[str, float]]: A list of tuples, where each tuple contains a metric name and a value
+        """
+        pass
+
+    @classmethod
+    def metrics_without_stats(cls) -> list[tuple[str, float]]:
+        """
+        Metrics reported when nothing was evaluated, i.e. model is not available.
+        None by default
+        """
+        return []
+
     def get_metric(self) -> list[tuple[str, float]]:
         """
         Get the metric for the evaluator
         Returns:
             list[tuple[str, float]]: A list of tuples, where each tuple contains a metric name and a value
         """
-        pass
+        stats = self.get_stats()
+        if not stats:
+            # nothing was evaluated, i.e. model is not available
+            return self.metrics_without_stats()
+        return [(name, float(value)) for name, value in self.metrics_from_stats(stats)]
 
     def get_info(self) -> str:
         """
@@ -4,63 +4,151 @@ Copyright 2025, Balacoon
 This evaluator compares F0 in generated and reference audio.
 """
 
+import logging
 from functools import partial
 from multiprocessing import Pool
 
 import librosa
 import numpy as np
-from scipy.stats import pearsonr
 
-from speech_gen_eval import evaluator
-from speech_gen_eval.audio_dir import get_audio_paths
+from speech_gen_eval import evaluator, monitoring, profiling, threads
+from speech_gen_eval.audio_dir import get_audio_item, load_audio
+from speech_gen_eval.features import get_f0
 
+# ways to pair frames of generated and reference F0 tracks, see `align_f0`
+alignments = ["time", "dtw"]
+# frames of F0 tracks (see `features.compute_f0`, pyin defaults at 16kHz)
+_frame_length = 2048
+_hop_length = 512
+# in the "dtw" mode, tracks which lengths differ by more frames are aligned by DTW
+_max_length_mismatch = 2
+# pairs of utterances a worker processes at once
+_chunk_size = 16
 
-def _process_single_file(
-    generated_path: str, original_path: str, ignore_errors: bool = False
-) -> dict[str, float]:
+
+def align_f0(
+    f0: np.ndarray, f0_ref: np.ndarray, path: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pair frames of generated and reference F0 tracks: frames at the same time
+    (the longer track is truncated), or along a DTW path
+    Args:
+        f0 (np.ndarray): generated F0 track, NaN in unvoiced frames
+        f0_ref (np.ndarray): reference F0 track
+        path (np.ndarray | None): pairs of generated and reference frames, [num_pairs, 2]
+    Returns:
+        tuple[np.ndarray, np.ndarray]: paired frames of the tracks, of the same length
+    """
+    if path is None:
+        length = min(len(f0), len(f0_ref))
+        return f0[:length], f0_ref[:length]
+    path = path[(path[:, 0] < len(f0)) & (path[:, 1] < len(f0_ref))]
+    return f0[path[:, 0]], f0_ref[path[:, 1]]
+
+
+def dtw_path(y: np.ndarray, y_ref: np.ndarray) -> np.ndarray:
+    """
+    DTW alignment of MFCC frames of two 16kHz waveforms, frames match the F0 frames
+    Returns:
+        np.ndarray: pairs of generated and reference frames, [num_pairs, 2]
+    """
+    mfcc, mfcc_ref = [
+        librosa.feature.mfcc(
+            y=x, sr=16000, n_mfcc=13, n_fft=_frame_length, hop_length=_hop_length
+        )
+        for x in (y, y_ref)
+    ]
+    _, path = librosa.sequence.dtw(X=mfcc, Y=mfcc_ref, metric="euclidean")
+    return path[::-1]
+
+
+def accuracy_stats(
+    pairs: list[tuple[np.ndarray, np.ndarray]],
+) -> dict[str, np.ndarray]:
+    """
+    F0 error counts and correlation statistics of aligned pairs of F0 tracks,
+    computed for all the pairs at once: frames voiced in both tracks are concatenated
+    and summed per pair
+    Args:
+        pairs (list[tuple[np.ndarray, np.ndarray]]): aligned tracks, see `align_f0`
+    Returns:
+        dict[str, np.ndarray]: statistics name -> values, [len(pairs)]
+    """
+    f0 = np.concatenate([x for x, _ in pairs])
+    f0_ref = np.concatenate([x for _, x in pairs])
+    pair = np.repeat(np.arange(len(pairs)), [len(x) for x, _ in pairs])
+    voiced = ~np.isnan(f0) & ~np.isnan(f0_ref)
+    pair = pair[voiced]
+    log_f0, log_f0_ref = np.log(f0[voiced]), np.log(f0_ref[voiced])
+
+    def per_pair(values: np.ndarray | None = None) -> np.ndarray:
+        return np.bincount(pair, weights=values, minlength=len(pairs))
+
+    count = per_pair()
+    diff = np.abs(log_f0 - log_f0_ref)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # centered by the means of the pairs first, more precise than from raw moments
+        x = log_f0 - (per_pair(log_f0) / count)[pair]
+        y = log_f0_ref - (per_pair(log_f0_ref) / count)[pair]
+        correlation = per_pair(x * y) / np.sqrt(per_pair(x * x) * per_pair(y * y))
+    # correlation is undefined for less than two frames or a flat track
+    defined = np.isfinite(correlation)
+    return {
+        # 0.05 < diff < 0.2
+        "fine_errors_sum": per_pair(((diff > 0.05) & (diff < 0.2)).astype(float)),
+        # >= 20% threshold for gross errors
+        "gross_errors_sum": per_pair((diff >= 0.2).astype(float)),
+        "correlation_sum": np.where(defined, correlation * count, 0.0),
+        "correlation_count": np.where(defined, count, 0.0),
+        "count": count,
+    }
+
+
+def _aligned_f0(
+    generated: str | np.ndarray, original: str | np.ndarray, alignment: str
+) -> tuple[np.ndarray, np.ndarray]:
     """
-    Process a single audio file and return the f0 accuracy metrics
+    F0 tracks of generated and original audio, aligned as configured.
+    Audio is loaded only if F0 is not precomputed or DTW is needed
     """
-    try:
-        # Load audio
-        y, _ = librosa.load(generated_path, sr=16000)
-        y_ref, _ = librosa.load(original_path, sr=16000)
-
-        # Compute F0 for both signals
-        f0, _, _ = librosa.pyin(y, fmin=50, fmax=500)
-        f0_ref, _, _ = librosa.pyin(y_ref, fmin=50, fmax=500)
-
-        # Remove NaN values and take log
-        valid_idx = ~np.isnan(f0) & ~np.isnan(f0_ref)
-        log_f0 = np.log(f0[valid_idx])
-        log_f0_ref = np.log(f0_ref[valid_idx])
-
-        # Compute f0 errors
-        f0_diff = np.abs(log_f0 - log_f0_ref)
-        if len(f0_diff) == 0:
-            fine_errors = 0
-            gross_errors = 0
-        else:
-            fine_errors = np.sum((f0_diff > 0.05) & (f0_diff < 0.2)) / len(
-                f0_diff
-            )  # 0.05 < diff < 0.2
-            gross_errors = np.sum(f0_diff >= 0.2) / len(
-                f0_diff
-            )  # >= 20% threshold for gross errors
-
-        # Compute correlation
-        correlation, _ = pearsonr(log_f0, log_f0_ref)
-
-        return {
-            "fine_errors": fine_errors,
-            "gross_errors": gross_errors,
-            "correlation": correlation,
-            "count": len(f0_diff),
-        }
-    except Exception as e:
-        if not ignore_errors:
-            raise e
-        return None
+    f0, f0_ref = get_f0(generated), get_f0(original)
+    path = None
+    if alignment == "dtw" and abs(len(f0) - len(f0_ref)) > _max_length_mismatch:
+        path = dtw_path(load_audio(generated), load_audio(original))
+    return align_f0(f0, f0_ref, path)
+
+
+def _process_chunk(
+    chunk: list[tuple[str, str | np.ndarray, str | np.ndarray]],
+    alignment: str = "time",
+    ignore_errors: bool = False,
+) -> list[tuple[str, dict[str, float]]]:
+    """
+    Get F0 accuracy statistics of a chunk of utterances
+    Args:
+        chunk (list[tuple[str, str | np.ndarray, str | np.ndarray]]):
+            ids with generated and original audio
+        alignment (str): how to pair F0 frames, see `alignments`
+        ignore_errors (bool): skip utterances which fail instead of raising
+    Returns:
+        list[tuple[str, dict[str, float]]]: ids with their statistics
+    """
+    names, pairs = [], []
+    for name, generated, original in chunk:
+        try:
+            pairs.append(_aligned_f0(generated, original, alignment))
+            names.append(name)
+        except Exception as e:
+            if not ignore_errors:
+                raise e
+            logging.warning(f"Error computing F0 accuracy of {name}: {e}")
+    if not pairs:
+        return []
+    stats = accuracy_stats(pairs)
+    return [
+        (name, {key: float(values[i]) for key, values in stats.items()})
+        for i, name in enumerate(names)
+    ]
 
 
 class F0AccuracyEvaluator(evaluator.Evaluator):
@@ -72,7 +160,12 @@ class F0AccuracyEvaluator(evaluator.Evaluator):
     - f0_correlation
     """
 
-    _njobs = 8
+    inputs = ("generated", "original")
+    features = ("f0",)
+    # 2: frames are aligned, correlation is counted only where it is defined
+    version = 2
+    rtf = 0.01
+    lower_is_better = ("f0_fine_errors", "f0_gross_errors")
 
     def __init__(
         self,
@@ -80,14 +173,31 @@ class F0AccuracyEvaluator(evaluator.Evaluator):
         generated_audio: str,
         original_audio: str,
         ignore_errors: bool = True,
+        f0_alignment: str | None = None,
         **kwargs,
     ):
+        """
+        Args:
+            f0_alignment (str | None): how to pair frames of generated and reference
+                F0 tracks: "time" (frames at the same time, default) or "dtw"
+                (DTW alignment of tracks which lengths differ, i.e. of resampled speech)
+        """
         self._ids = ids
         self._generated = generated_audio
         self._original = original_audio
         if self._original is None:
             raise ValueError("original_audio is required for F0 accuracy evaluation")
         self._ignore_errors = ignore_errors
+        self._alignment = f0_alignment or "time"
+        if self._alignment not in alignments:
+            raise ValueError(f"Unknown F0 alignment {self._alignment}")
+
+    @classmethod
+    def cache_settings(cls, f0_alignment: str | None = None, **kwargs):
+        """
+        Statistics depend on the alignment of F0 frames
+        """
+        return {"f0_alignment": f0_alignment or "time"}
 
     def get_info(self):
         """
@@ -97,36 +207,49 @@ class F0AccuracyEvaluator(evaluator.Evaluator):
         """
         return "F0 accuracy evaluation"
 
-    def get_metric(self):
+    def get_utterance_stats(self):
         """
-        Get the metrics computed on all audio files
+        Get F0 error counts and count-weighted correlation for each of the utterances
+        Returns:
+            dict[str, dict[str, float]]: utterance id -> statistics name -> value
         """
-        # Get paired paths for generated and original audio
-        gen_paths = get_audio_paths(self._generated, self._ids)
-        orig_paths = get_audio_paths(self._original, self._ids)
-        paired_paths = list(zip(gen_paths, orig_paths))
-
-        # Create a process pool
-        with Pool(self._njobs) as pool:
-            # Process files in parallel
-            process_func = partial(
-                _process_single_file, ignore_errors=self._ignore_errors
-            )
-            results = pool.starmap(process_func, paired_paths)
-
-        # Filter out None results (from errors) and combine stats
-        results = [r for r in results if r is not None]
-
-        # Compute weighted averages based on number of valid F0 points
-        total_count = sum(r["count"] for r in results)
-        fine_errors = sum(r["fine_errors"] * r["count"] for r in results) / total_count
-        gross_errors = (
-            sum(r["gross_errors"] * r["count"] for r in results) / total_count
-        )
-        correlation = sum(r["correlation"] * r["count"] for r in results) / total_count
+        # Get paired generated and original audio
+        paired_audio = []
+        for name, _ in self._ids:
+            generated = get_audio_item(self._generated, name)
+            original = get_audio_item(self._original, name)
+            if generated is not None and original is not None:
+                paired_audio.append((name, generated, original))
+        chunks = [
+            paired_audio[i : i + _chunk_size]
+            for i in range(0, len(paired_audio), _chunk_size)
+        ]
 
+        # Workers decode audio and extract features, chunks are collected
+        # as soon as they are done, so only statistics are kept in memory
+        utterance_stats = {}
+        with profiling.stage("feature_extraction", items=len(paired_audio)):
+            with Pool(
+                threads.pool_size(len(chunks)), initializer=threads.init_worker
+            ) as pool:
+                process_func = partial(
+                    _process_chunk,
+                    alignment=self._alignment,
+                    ignore_errors=self._ignore_errors,
+                )
+                for results in monitoring.progress(
+                    pool.imap_unordered(process_func, chunks), items=len
+                ):
+                    utterance_stats.update(results)
+        return utterance_stats
+
+    @classmethod
+    def metrics_from_stats(cls, stats):
+        """
+        Compute error rates and correlation weighted by the number of valid F0 points
+        """
         return [
-            ("f0_fine_errors", float(fine_errors)),
-            ("f0_gross_errors", float(gross_errors)),
-            ("f0_correlation", float(correlation)),
+            ("f0_fine_errors", stats["fine_errors_sum"] / stats["count"]),
+            ("f0_gross_errors", stats["gross_errors_sum"] / stats["count"]),
+            ("f0_correlation", stats["correlation_sum"] / stats["correlation_count"]),
         ]
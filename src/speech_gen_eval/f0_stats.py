@@ -10,20 +10,23 @@ from multiprocessing import Pool
 import librosa
 import numpy as np
 
-from speech_gen_eval import evaluator
-from speech_gen_eval.audio_dir import get_audio_paths
+from speech_gen_eval import evaluator, monitoring, profiling, threads
+from speech_gen_eval.audio_dir import get_audio_items
+from speech_gen_eval.features import get_f0
 
 
-def _process_single_file(path: str, ignore_errors: bool = False) -> dict[str, float]:
+def _process_single_file(
+    audio: str | np.ndarray, ignore_errors: bool = False
+) -> dict[str, float]:
     """
     Process a single audio file and return the f0 and rms statistics
     """
     try:
-        # Load audio
-        y, _ = librosa.load(path, sr=16000)
+        # Load audio, unless it is already in memory
+        y = librosa.load(audio, sr=16000)[0] if isinstance(audio, str) else audio
 
         # Compute F0
-        f0, _, _ = librosa.pyin(y, fmin=50, fmax=500)
+        f0 = get_f0(audio, y)
         log_f0 = np.log(f0[~np.isnan(f0)])
 
         # Compute f0 stats
@@ -44,14 +47,14 @@ def _process_single_file(path: str, ignore_errors: bool = False) -> dict[str, fl
         loudness_count = len(loudness)
 
         return {
-            "f0_sum": f0_sum,
-            "f0_sq_sum": f0_sq_sum,
+            "f0_sum": float(f0_sum),
+            "f0_sq_sum": float(f0_sq_sum),
             "f0_count": f0_count,
-            "f0_delta_sum": f0_delta_sum,
-            "f0_delta_sq_sum": f0_delta_sq_sum,
+            "f0_delta_sum": float(f0_delta_sum),
+            "f0_delta_sq_sum": float(f0_delta_sq_sum),
             "f0_delta_count": f0_delta_count,
-            "loudness_sum": loudness_sum,
-            "loudness_sq_sum": loudness_sq_sum,
+            "loudness_sum": float(loudness_sum),
+            "loudness_sq_sum": float(loudness_sq_sum),
             "loudness_count": loudness_count,
         }
     except Exception as e:
@@ -69,7 +72,8 @@ class F0StatsEvaluator(evaluator.Evaluator):
     - loudness_std: Standard deviation of the rms.
     """
 
-    _njobs = 8
+    features = ("f0",)
+    rtf = 0.01
 
     def __init__(
         self,
@@ -90,45 +94,58 @@ class F0StatsEvaluator(evaluator.Evaluator):
         """
         return "F0 and RMS statistics as expessivity evaluation"
 
-    def get_metric(self):
+    def get_utterance_stats(self):
         """
-        Get the metrics computed on all audio files
+        Get F0, F0 delta and loudness sums, squared sums and counts for each of the utterances
+        Returns:
+            dict[str, dict[str, float]]: utterance id -> statistics name -> value
+        """
+        items = get_audio_items(self._audio_dir, self._ids)
+        # Create a process pool, workers decode audio and extract features
+        with profiling.stage("feature_extraction", items=len(items)):
+            njobs = threads.pool_size(len(items))
+            with Pool(njobs, initializer=threads.init_worker) as pool:
+                # Process files in parallel, in order, chunked as by `pool.map`
+                process_func = partial(
+                    _process_single_file, ignore_errors=self._ignore_errors
+                )
+                results = list(
+                    monitoring.progress(
+                        pool.imap(
+                            process_func,
+                            [audio for _, audio in items],
+                            chunksize=max(1, len(items) // (4 * njobs)),
+                        )
+                    )
+                )
+
+        # Filter out None results (from errors)
+        return {
+            name: result
+            for (name, _), result in zip(items, results)
+            if result is not None
+        }
+
+    @classmethod
+    def metrics_from_stats(cls, stats):
+        """
+        Compute overall standard deviations from the summed accumulators
         """
-        audio_paths = get_audio_paths(self._audio_dir, self._ids)
-        # Create a process pool
-        with Pool(self._njobs) as pool:
-            # Process files in parallel
-            process_func = partial(
-                _process_single_file, ignore_errors=self._ignore_errors
-            )
-            results = pool.map(process_func, audio_paths)
-
-        # Filter out None results (from errors) and combine stats
-        results = [r for r in results if r is not None]
-
-        # Sum up all the accumulators
-        f0_sum = sum(r["f0_sum"] for r in results)
-        f0_sq_sum = sum(r["f0_sq_sum"] for r in results)
-        f0_count = sum(r["f0_count"] for r in results)
-        f0_delta_sum = sum(r["f0_delta_sum"] for r in results)
-        f0_delta_sq_sum = sum(r["f0_delta_sq_sum"] for r in results)
-        f0_delta_count = sum(r["f0_delta_count"] for r in results)
-        loudness_sum = sum(r["loudness_sum"] for r in results)
-        loudness_sq_sum = sum(r["loudness_sq_sum"] for r in results)
-        loudness_count = sum(r["loudness_count"] for r in results)
-
-        # Compute overall statistics
-        f0_mean = f0_sum / f0_count
-        f0_std = np.sqrt(f0_sq_sum / f0_count - f0_mean**2)
-
-        f0_delta_mean = f0_delta_sum / f0_delta_count
-        f0_delta_std = np.sqrt(f0_delta_sq_sum / f0_delta_count - f0_delta_mean**2)
-
-        loudness_mean = loudness_sum / loudness_count
-        loudness_std = np.sqrt(loudness_sq_sum / loudness_count - loudness_mean**2)
+        f0_mean = stats["f0_sum"] / stats["f0_count"]
+        f0_std = np.sqrt(stats["f0_sq_sum"] / stats["f0_count"] - f0_mean**2)
+
+        f0_delta_mean = stats["f0_delta_sum"] / stats["f0_delta_count"]
+        f0_delta_std = np.sqrt(
+            stats["f0_delta_sq_sum"] / stats["f0_delta_count"] - f0_delta_mean**2
+        )
+
+        loudness_mean = stats["loudness_sum"] / stats["loudness_count"]
+        loudness_std = np.sqrt(
+            stats["loudness_sq_sum"] / stats["loudness_count"] - loudness_mean**2
+        )
 
         return [
-            ("log_f0_std", float(f0_std)),
-            ("log_f0_delta_std", float(f0_delta_std)),
-            ("loudness_std", float(loudness_std)),
+            ("log_f0_std", f0_std),
+            ("log_f0_delta_std", f0_delta_std),
+            ("loudness_std", loudness_std),
         ]
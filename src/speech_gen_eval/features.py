@@ -0,0 +1,82 @@
+"""
+Copyright 2025 Balacoon
+
+Features - features shared between evaluators, computed once per audio
+"""
+
+import logging
+import os
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+
+from speech_gen_eval import threads
+
+
+def compute_f0(y: np.ndarray) -> np.ndarray:
+    """
+    Compute F0 track of a 16kHz waveform, NaN in unvoiced frames
+    """
+    # librosa is slow to import (numba, scipy), import only if needed
+    import librosa
+
+    f0, _, _ = librosa.pyin(y, fmin=50, fmax=500)
+    return f0
+
+
+def f0_cache_path(audio_path: str) -> str:
+    """
+    Get the path where F0 track of the audio file is cached, next to the audio
+    """
+    return os.path.splitext(audio_path)[0] + ".f0.npy"
+
+
+def get_f0(audio: str | np.ndarray, y: np.ndarray | None = None) -> np.ndarray:
+    """
+    Get F0 track of an audio item, precomputed one if available
+    Args:
+        audio (str | np.ndarray): path to the audio file or an in-memory waveform
+        y (np.ndarray | None): 16kHz waveform of the audio item,
+            loaded only if F0 is not precomputed when not given
+    Returns:
+        np.ndarray: F0 track
+    """
+    if isinstance(audio, str) and os.path.isfile(f0_cache_path(audio)):
+        return np.load(f0_cache_path(audio))
+    if y is None:
+        import librosa
+
+        y = librosa.load(audio, sr=16000)[0] if isinstance(audio, str) else audio
+    return compute_f0(y)
+
+
+def _cache_f0(path: str, ignore_errors: bool = True) -> bool:
+    """
+    Compute F0 track of the audio file and save it next to the audio
+    """
+    import librosa
+
+    try:
+        y, _ = librosa.load(path, sr=16000)
+        np.save(f0_cache_path(path), compute_f0(y))
+        return True
+    except Exception as e:
+        if not ignore_errors:
+            raise e
+        logging.warning(f"Error computing F0 of {path}: {e}")
+        return False
+
+
+def precompute_f0(paths: list[str], ignore_errors: bool = True):
+    """
+    Compute F0 tracks of the audio files in parallel and cache them next to the audio,
+    so evaluators using F0 don't compute it again
+    """
+    with Pool(threads.pool_size(len(paths)), initializer=threads.init_worker) as pool:
+        pool.map(partial(_cache_f0, ignore_errors=ignore_errors), paths)
+
+
+# features that are computed once for all the evaluators using them.
+# others (i.e. speaker embeddings, which depend on the model) are computed by evaluators.
+shared_features = {"f0": precompute_f0}
@@ -4,13 +4,62 @@ Copyright 2025 Balacoon
 IDs - utilities for reading and mapping IDs
 """
 
+import hashlib
 import logging
 import re
 from typing import Optional
 
-import soundfile as sf
+from speech_gen_eval.audio_dir import get_audio_source
+from speech_gen_eval.manifest import Manifest
 
-from speech_gen_eval.audio_dir import get_audio_path
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+    Parse shard specification
+    Args:
+        shard (str): shard in format "i/N", where 0 <= i < N
+    Returns:
+        tuple[int, int]: shard index and number of shards
+    """
+    match = re.fullmatch(r"(\d+)/(\d+)", shard.strip())
+    if match is None:
+        raise ValueError(f"Invalid shard {shard}, expected format is i/N")
+    index, num_shards = int(match.group(1)), int(match.group(2))
+    if num_shards < 1 or index >= num_shards:
+        raise ValueError(f"Invalid shard {shard}, expected 0 <= i < N")
+    return index, num_shards
+
+
+def in_shard(name: str, shard: tuple[int, int]) -> bool:
+    """
+    Check if the id belongs to the shard. Partitioning depends only on the id itself,
+    so it is the same on every node regardless of the order or subset of ids.
+    Args:
+        name (str): id of the utterance
+        shard (tuple[int, int]): shard index and number of shards
+    Returns:
+        bool: whether the id belongs to the shard
+    """
+    index, num_shards = shard
+    digest = hashlib.md5(name.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") % num_shards == index
+
+
+def read_speakers(speakers_path: str) -> dict[str, str]:
+    """
+    Read a file with an id and a speaker on each line
+    Args:
+        speakers_path (str): The path to the speakers file
+    Returns:
+        dict[str, str]: id -> speaker
+    """
+    speakers = {}
+    with open(speakers_path, "r") as fp:
+        for line in fp:
+            if line.strip():
+                name, speaker = line.strip().split()
+                speakers[name] = speaker
+    return speakers
 
 
 def _is_audio_good(
@@ -19,15 +68,30 @@ def _is_audio_good(
     """
     Check if an audio file is good
     """
-    path = get_audio_path(directory, name)
-    if path is None:
+    source = get_audio_source(directory)
+    if source.find(name) is None:
         msg = f"Skipping {name} because it is missing from {directory}"
         if not ignore_missing:
             raise ValueError(msg)
         logging.warning(msg)
         return False
-    info = sf.info(path)
-    duration = info.frames / info.samplerate
+    try:
+        duration = source.duration(name)
+    except RuntimeError as e:
+        msg = f"Skipping {name} because it can't be read from {directory}: {e}"
+        if not ignore_missing:
+            raise ValueError(msg) from e
+        logging.warning(msg)
+        return False
+    return _is_duration_good(name, duration, ignore_missing, min_dur, max_dur)
+
+
+def _is_duration_good(
+    name: str, duration: float, ignore_missing: bool, min_dur: float, max_dur: float
+) -> bool:
+    """
+    Check if the duration of an audio file is within the limits
+    """
     if duration < min_dur or duration > max_dur:
         msg = f"Skipping {name} because of duration {duration} (min: {min_dur}, max: {max_dur})"
         if not ignore_missing:
@@ -37,40 +101,70 @@ def _is_audio_good(
     return True
 
 
-def read_txt_and_mapping(  # noqa: C901
-    txt_path: str,
+def read_txt(
+    txt_path: str, shard: Optional[tuple[int, int]] = None
+) -> list[tuple[str, str]]:
+    """
+    Read ids and texts of the utterances, a line of the text file is `id text`
+    Args:
+        txt_path (str): The path to the text file
+        shard (Optional[tuple[int, int]]): Only read ids of the given shard (index, number of shards).
+    Returns:
+        list[tuple[str, str]]: ids and texts of the utterances
+    """
+    txt = []
+    with open(txt_path, "r", encoding="utf-8") as fp:
+        for line in fp:
+            name, utterance = re.split(r"\s+", line.strip(), maxsplit=1)
+            if shard is not None and not in_shard(name, shard):
+                continue
+            txt.append((name, utterance))
+    return txt
+
+
+def read_mapping(mapping_path: str) -> dict[str, str]:
+    """
+    Read mapping of generated ids to reference ids, a line of the file is `id reference_id`
+    """
+    mapping = {}
+    with open(mapping_path, "r") as fp:
+        for line in fp:
+            name, ref = line.strip().split()
+            mapping[name] = ref
+    return mapping
+
+
+def filter_ids(
+    txt: list[tuple[str, str]],
     generated_audio: str,
-    mapping_path: Optional[str] = None,
+    mapping: Optional[dict[str, str]] = None,
     original_audio: Optional[str] = None,
     ignore_missing: bool = True,
     min_dur: float = 0.3,
     max_dur: float = 40.0,
-) -> tuple[list[tuple[str, str]], dict[str, str]]:
+) -> tuple[list[tuple[str, str]], Optional[dict[str, str]]]:
     """
-    Read a text file and a mapping file, and return a list of tuples,
-    where each tuple contains a name and an utterance, and a dictionary,
-    where each key is a name and each value is a reference name
+    Keep utterances which generated audio (and original audio of the same id,
+    or of the reference id if there is a mapping) exists and is within duration limits
     Args:
-        txt_path (str): The path to the text file
-        generated_audio (str): The directory to search for the audio files
-        mapping_path (Optional[str]): The path to the mapping file
-        original_audio (Optional[str]): The directory to search for the original audio files
+        txt (list[tuple[str, str]]): ids and texts of the utterances
+        generated_audio (str): The directory or tar/zip archives to search for the audio files
+        mapping (Optional[dict[str, str]]): generated id -> reference id
+        original_audio (Optional[str]): The directory or archives to search for the original audio files
         ignore_missing (bool): Whether to ignore missing files
         min_dur (float): The minimum duration of the audio files to consider (default: 0.3s).
         max_dur (float): The maximum duration of the audio files to consider (default: 40.0s).
     Returns:
-        tuple[list[tuple[str, str]], dict[str, str]]: A tuple containing a list of tuples,
-        where each tuple contains a name and an utterance, and a dictionary,
-        where each key is a name and each value is a reference name
+        tuple[list[tuple[str, str]], Optional[dict[str, str]]]: kept ids and texts,
+        mapping of the kept ids (None if there is no mapping)
     """
-    txt = []
-    with open(txt_path, "r", encoding="utf-8") as fp:
-        for line in fp:
-            name, utterance = re.split(r"\s+", line.strip(), maxsplit=1)
-            if _is_audio_good(generated_audio, name, ignore_missing, min_dur, max_dur):
-                txt.append((name, utterance))
+    txt = [
+        (name, utterance)
+        for name, utterance in txt
+        if _is_audio_good(generated_audio, name, ignore_missing, min_dur, max_dur)
+    ]
 
-    if mapping_path is None:
+    if mapping is None:
         # no mapping file, if original audio provided, filter ids by original audio too
         if original_audio is not None:
             filt_txt = []
@@ -82,21 +176,12 @@ def read_txt_and_mapping(  # noqa: C901
             return filt_txt, None
         else:
             return txt, None
-    else:
-        if original_audio is None:
-            raise ValueError("original_audio is required when mapping_path is provided")
-    # read mapping file
-    mapping = {}
-    with open(mapping_path, "r") as fp:
-        for line in fp:
-            name, ref = line.strip().split()
-            mapping[name] = ref
 
     filt_txt = []
     filt_mapping = {}
     for name, utterance in txt:
         if name not in mapping:
-            msg = f"mapping for {name} is missing from {mapping_path}"
+            msg = f"mapping for {name} is missing"
             if ignore_missing:
                 logging.warning(msg)
                 continue
@@ -107,3 +192,83 @@ def read_txt_and_mapping(  # noqa: C901
             filt_txt.append((name, utterance))
             filt_mapping[name] = ref_name
     return filt_txt, filt_mapping
+
+
+def read_txt_and_mapping(
+    txt_path: str,
+    generated_audio: str,
+    mapping_path: Optional[str] = None,
+    original_audio: Optional[str] = None,
+    ignore_missing: bool = True,
+    min_dur: float = 0.3,
+    max_dur: float = 40.0,
+    shard: Optional[tuple[int, int]] = None,
+) -> tuple[list[tuple[str, str]], dict[str, str]]:
+    """
+    Read a text file and a mapping file, and return a list of tuples,
+    where each tuple contains a name and an utterance, and a dictionary,
+    where each key is a name and each value is a reference name
+    Args:
+        txt_path (str): The path to the text file
+        generated_audio (str): The directory or tar/zip archives to search for the audio files
+        mapping_path (Optional[str]): The path to the mapping file
+        original_audio (Optional[str]): The directory or archives to search for the original audio files
+        ignore_missing (bool): Whether to ignore missing files
+        min_dur (float): The minimum duration of the audio files to consider (default: 0.3s).
+        max_dur (float): The maximum duration of the audio files to consider (default: 40.0s).
+        shard (Optional[tuple[int, int]]): Only read ids of the given shard (index, number of shards).
+    Returns:
+        tuple[list[tuple[str, str]], dict[str, str]]: A tuple containing a list of tuples,
+        where each tuple contains a name and an utterance, and a dictionary,
+        where each key is a name and each value is a reference name
+    """
+    if mapping_path is not None and original_audio is None:
+        raise ValueError("original_audio is required when mapping_path is provided")
+    return filter_ids(
+        read_txt(txt_path, shard=shard),
+        generated_audio,
+        mapping=read_mapping(mapping_path) if mapping_path else None,
+        original_audio=original_audio,
+        ignore_missing=ignore_missing,
+        min_dur=min_dur,
+        max_dur=max_dur,
+    )
+
+
+def read_manifest_ids(
+    manifest: Manifest,
+    ignore_missing: bool = True,
+    min_dur: float = 0.3,
+    max_dur: float = 40.0,
+    shard: Optional[tuple[int, int]] = None,
+) -> tuple[list[tuple[str, str]], Optional[dict[str, str]]]:
+    """
+    Counterpart of `read_txt_and_mapping` for a manifest: utterances are filtered
+    by the durations from the manifest, audio files are not probed
+    Args:
+        manifest (Manifest): manifest of the test set, see `manifest.read_manifest`
+        ignore_missing (bool): Whether to skip utterances out of duration limits
+        min_dur (float): The minimum duration of the audio files to consider (default: 0.3s).
+        max_dur (float): The maximum duration of the audio files to consider (default: 40.0s).
+        shard (Optional[tuple[int, int]]): Only read ids of the given shard (index, number of shards).
+    Returns:
+        tuple[list[tuple[str, str]], Optional[dict[str, str]]]: ids with texts,
+        mapping to reference ids if the manifest has them
+    """
+    txt, mapping = [], {}
+    for row in manifest.rows:
+        name = row["id"]
+        if shard is not None and not in_shard(name, shard):
+            continue
+        durations = [row["duration"]]
+        if row.get("reference_duration") is not None:
+            durations.append(row["reference_duration"])
+        if all(
+            _is_duration_good(name, x, ignore_missing, min_dur, max_dur)
+            for x in durations
+        ):
+            txt.append((name, row["text"]))
+            if manifest.has_mapping:
+                # rows without a reference are compared to audio of the same id
+                mapping[name] = row.get("reference") or name
+    return txt, mapping if manifest.has_mapping else None
@@ -5,10 +5,26 @@ Main - entry point for speech generation evaluation
 """
 
 import argparse
+import importlib
 import logging
+import sys
 
+# heavy imports (torch, evaluators) are deferred, so --help and argument errors are fast
+from speech_gen_eval import threads
 from speech_gen_eval.combined_evaluator import evaluator_names
-from speech_gen_eval.evaluation import speech_gen_eval
+
+# sub-commands, "module" implementing the command with `main(argv)`
+# or "module:function" if a module implements multiple commands
+_commands = {
+    "bench": "speech_gen_eval.bench",
+    "compare": "speech_gen_eval.results_store:compare_main",
+    "drift": "speech_gen_eval.precision",
+    "fetch-models": "speech_gen_eval.model_store",
+    "index": "speech_gen_eval.manifest",
+    "merge": "speech_gen_eval.merge",
+    "watch": "speech_gen_eval.watch",
+    "worst": "speech_gen_eval.results_store:worst_main",
+}
 
 
 def parse_args():
@@ -20,13 +36,19 @@ def parse_args():
     ap = argparse.ArgumentParser(description="Runs speech generation evaluation")
     ap.add_argument(
         "--generated-audio",
-        required=True,
-        help="Directory with generated audio to eval",
+        help="Directory with generated audio to eval, or tar/zip archives "
+        "(a path or a glob of shards, i.e. 'shards/test-*.tar')",
+    )
+    ap.add_argument(
+        "--original-audio", help="Original audio, a directory or tar/zip archives"
     )
-    ap.add_argument("--original-audio", help="Original audio")
     ap.add_argument("--mapping", help="Maps audio ids to reference ids")
+    ap.add_argument("--txt", help="Text file with ids and text to run eval on")
     ap.add_argument(
-        "--txt", required=True, help="Text file with ids and text to run eval on"
+        "--manifest",
+        help="JSONL/Parquet manifest with ids, texts, audio paths and durations "
+        "(see `speech-gen-eval index`), replaces --txt, --generated-audio, "
+        "--original-audio and --mapping",
     )
     ap.add_argument(
         "--type",
@@ -45,17 +67,203 @@ def parse_args():
         action="store_true",
         help="Ignore when some id is missing or failed to process",
     )
+    ap.add_argument(
+        "--speakers",
+        help="Maps original audio ids to speakers, for speaker similarity centroids and EER",
+    )
+    ap.add_argument(
+        "--secs-modes",
+        nargs="+",
+        choices=["centroid", "matrix"],
+        help="Additional speaker similarity modes: similarity to speaker centroids, "
+        "or all generated x reference similarities (EER, nearest speaker accuracy)",
+    )
+    ap.add_argument(
+        "--transcript-cache",
+        nargs="?",
+        const="",
+        metavar="FILE",
+        help="Cache ASR transcripts by audio content and decoding config in this SQLite file, "
+        "only new or changed audio is transcribed. Without a file, the cache is kept in "
+        "~/.cache/speech_gen_eval/transcripts.sqlite (or SPEECH_GEN_EVAL_TRANSCRIPTS)",
+    )
+    ap.add_argument(
+        "--asr-language",
+        help="Language of the generated speech, i.e. en. Skips ASR language detection",
+    )
+    ap.add_argument(
+        "--asr-task",
+        choices=["transcribe", "translate"],
+        help="Force the ASR task instead of the model default",
+    )
+    ap.add_argument(
+        "--asr-bounded",
+        action="store_true",
+        help="Greedy ASR decoding with new tokens capped from the reference text length, "
+        "bounds the latency on babbling audio",
+    )
+    ap.add_argument(
+        "--f0-alignment",
+        choices=["time", "dtw"],
+        default="time",
+        help="How F0 accuracy pairs generated and reference frames: at the same time, "
+        "or by DTW for outputs which length differs from the reference",
+    )
+    ap.add_argument(
+        "--incremental",
+        metavar="STATS_DB",
+        help="Incremental mode: per-utterance statistics are cached in this sqlite file "
+        "by content of the audio and evaluator version, "
+        "only new or changed utterances are evaluated",
+    )
+    ap.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Evaluate utterances with identical audio once and copy the results "
+        "to all of them, all the audio is hashed first",
+    )
     ap.add_argument("--out", help="Output file to save metrics")
+    ap.add_argument(
+        "--results-db",
+        help="SQLite results store to save the run with per-utterance scores to, "
+        "query it with `speech-gen-eval compare` and `speech-gen-eval worst`",
+    )
+    ap.add_argument(
+        "--system",
+        help="Name of the evaluated system (i.e. checkpoint) in the results store, "
+        "name of the generated audio directory by default",
+    )
+    ap.add_argument(
+        "--bootstrap",
+        type=int,
+        metavar="RESAMPLES",
+        help="Save bootstrap confidence intervals of the metrics with this many resamples, "
+        "as well as per-utterance statistics, to the output file",
+    )
+    ap.add_argument(
+        "--confidence",
+        type=float,
+        default=0.95,
+        help="Confidence level of the bootstrap intervals",
+    )
+    ap.add_argument(
+        "--early-stop",
+        type=float,
+        metavar="TOLERANCE",
+        help="Evaluate a random stream of utterances and stop each evaluator once "
+        "half-widths of the bootstrap confidence intervals of its metrics "
+        "are within the tolerance. For quick triage of checkpoints",
+    )
+    ap.add_argument(
+        "--metric-tolerance",
+        nargs="+",
+        metavar="METRIC=TOLERANCE",
+        help="Per-metric tolerances of --early-stop, i.e. whisperv3_cer=0.005 utmos_mos=0.05",
+    )
+    ap.add_argument(
+        "--time-budget",
+        type=float,
+        metavar="SECONDS",
+        help="Stop --early-stop evaluation after this many seconds, "
+        "even if the metrics are not within the tolerance",
+    )
+    ap.add_argument(
+        "--baseline",
+        help="Output file of a run with --bootstrap to compare with: "
+        "metric deltas with paired bootstrap intervals and p-values",
+    )
+    ap.add_argument(
+        "--shard",
+        help="Evaluate only a shard of ids, i/N. Merge shard outputs with `speech-gen-eval merge`",
+    )
+    ap.add_argument(
+        "--offline",
+        action="store_true",
+        help="Use only models already in the store (see `fetch-models`), never go to network",
+    )
+    ap.add_argument(
+        "--cpus",
+        type=int,
+        help="CPU budget shared by process pools, torch, BLAS and ffmpeg threads. "
+        "All available CPUs (honoring cgroup limits) by default",
+    )
+    ap.add_argument(
+        "--backend",
+        nargs="+",
+        metavar="EVALUATOR=BACKEND",
+        help="Execution backend per evaluator, i.e. utmos=onnx ecapa_secs=onnx. "
+        "onnx runs TorchScript models with onnxruntime on CPU",
+    )
+    ap.add_argument(
+        "--precision",
+        nargs="+",
+        metavar="EVALUATOR=PRECISION",
+        help="CPU inference precision per evaluator, i.e. cer=int8 aesthetics=bf16. "
+        "Check the metric drift with `speech-gen-eval drift`",
+    )
+    ap.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the evaluation plan with the estimated cost and exit",
+    )
+    ap.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record per-evaluator and per-stage timings into the output file",
+    )
+    ap.add_argument(
+        "--trace",
+        help="Save profiling spans: Chrome trace (.json) or OpenTelemetry-style spans (.jsonl)",
+    )
+    ap.add_argument(
+        "--no-progress",
+        action="store_true",
+        help="Don't show the progress of conversion and evaluators",
+    )
+    ap.add_argument(
+        "--metrics-textfile",
+        help="Keep live counters of the run (items done/failed, throughput, RTF, "
+        "queue depths, memory) in this file, for the node_exporter textfile collector (.prom)",
+    )
+    ap.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve live counters of the run at http://127.0.0.1:PORT/metrics",
+    )
+    ap.add_argument("--cprofile", help="Dump cProfile stats of the run to this file")
+    ap.add_argument(
+        "--torch-profile", help="Export torch.profiler chrome trace to this file"
+    )
     args = ap.parse_args()
 
     # Conditional argument checks
-    if args.type in ["zero-tts", "zero-vc", "vocoder"] and not args.original_audio:
-        ap.error(
-            "--original-audio is required when type is 'zero-tts', 'zero-vc', or 'vocoder'."
-        )
+    _check_inputs(ap, args)
+    _parse_execution_args(ap, args)
+    _check_statistics_args(ap, args)
+    _check_run_args(ap, args)
+    return args
+
+
+def _check_inputs(ap: argparse.ArgumentParser, args: argparse.Namespace):
+    """
+    Check that inputs the type of evaluation needs are given
+    """
+    if args.manifest:
+        if args.txt or args.generated_audio or args.original_audio or args.mapping:
+            ap.error(
+                "--manifest replaces --txt, --generated-audio, --original-audio and --mapping"
+            )
+    else:
+        if not args.txt or not args.generated_audio:
+            ap.error("--txt and --generated-audio are required without --manifest.")
 
-    if args.type in ["zero-tts", "zero-vc"] and not args.mapping:
-        ap.error("--mapping is required when type is 'zero-tts' or 'zero-vc'.")
+        if args.type in ["zero-tts", "zero-vc", "vocoder"] and not args.original_audio:
+            ap.error(
+                "--original-audio is required when type is 'zero-tts', 'zero-vc', or 'vocoder'."
+            )
+
+        if args.type in ["zero-tts", "zero-vc"] and not args.mapping:
+            ap.error("--mapping is required when type is 'zero-tts' or 'zero-vc'.")
 
     if args.type != "custom" and args.evaluators:
         ap.error("--evaluators is only allowed when type is 'custom'.")
@@ -63,7 +271,91 @@ def parse_args():
     if args.type == "custom" and not args.evaluators:
         ap.error("--evaluators is required when type is 'custom'.")
 
-    return args
+
+def _parse_execution_args(ap: argparse.ArgumentParser, args: argparse.Namespace):
+    """
+    Parse per-evaluator backends and precisions, check the CPU budget
+    """
+    args.backends = {}
+    if args.backend:
+        from speech_gen_eval.onnx_backend import backends
+
+        args.backends = _parse_per_evaluator(ap, "--backend", args.backend, backends)
+
+    args.precisions = {}
+    if args.precision:
+        from speech_gen_eval.precision import precisions
+
+        args.precisions = _parse_per_evaluator(
+            ap, "--precision", args.precision, precisions
+        )
+
+    if args.cpus is not None and args.cpus < 1:
+        ap.error("--cpus should be positive")
+
+
+def _check_statistics_args(ap: argparse.ArgumentParser, args: argparse.Namespace):
+    """
+    Check bootstrap and early-stopping arguments, parse per-metric tolerances
+    """
+    if args.bootstrap is not None and args.bootstrap < 1:
+        ap.error("--bootstrap should be positive")
+
+    if not 0 < args.confidence < 1:
+        ap.error("--confidence should be between 0 and 1")
+
+    if args.baseline and not args.bootstrap:
+        ap.error("--baseline requires --bootstrap")
+
+    args.metric_tolerances = {}
+    for spec in args.metric_tolerance or []:
+        metric, _, value = spec.partition("=")
+        try:
+            args.metric_tolerances[metric] = float(value)
+        except ValueError:
+            ap.error(f"Invalid --metric-tolerance {spec}, expected METRIC=TOLERANCE")
+
+    if args.early_stop is None and (args.metric_tolerance or args.time_budget):
+        ap.error("--metric-tolerance and --time-budget require --early-stop")
+
+    if args.early_stop is not None and (args.incremental or args.secs_modes):
+        ap.error("--early-stop can't be combined with --incremental or --secs-modes")
+
+
+def _check_run_args(ap: argparse.ArgumentParser, args: argparse.Namespace):
+    """
+    Check sharding and monitoring arguments
+    """
+    if args.metrics_port is not None and not 0 < args.metrics_port < 65536:
+        ap.error("--metrics-port should be between 1 and 65535")
+
+    if args.shard and args.secs_modes:
+        ap.error(
+            "--secs-modes compare utterances across the whole set, can't be sharded"
+        )
+
+    if args.shard:
+        from speech_gen_eval.ids import parse_shard
+
+        try:
+            parse_shard(args.shard)
+        except ValueError as e:
+            ap.error(str(e))
+
+
+def _parse_per_evaluator(
+    ap: argparse.ArgumentParser, flag: str, specs: list[str], choices: list[str]
+) -> dict[str, str]:
+    """
+    Parse per-evaluator settings in format EVALUATOR=VALUE
+    """
+    values = {}
+    for spec in specs:
+        name, _, value = spec.partition("=")
+        if name not in evaluator_names or value not in choices:
+            ap.error(f"Invalid {flag} {spec}, expected EVALUATOR={'|'.join(choices)}")
+        values[name] = value
+    return values
 
 
 def main():
@@ -71,14 +363,62 @@ def main():
     Main function
     """
     logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] in _commands:
+        module_name, _, function = _commands[sys.argv[1]].partition(":")
+        command = importlib.import_module(module_name)
+        return getattr(command, function or "main")(sys.argv[2:])
     args = parse_args()
+    # before torch is imported, so it picks up the thread count
+    threads.set_cpus(args.cpus)
+    if args.offline:
+        from speech_gen_eval import model_store
+
+        model_store.set_offline()
+    from speech_gen_eval import transcript_cache
+    from speech_gen_eval.evaluation import speech_gen_eval
+
+    transcripts_path = None
+    if args.transcript_cache is not None:
+        transcripts_path = args.transcript_cache or transcript_cache.default_path()
+
     speech_gen_eval(
         txt_path=args.txt,
         generated_audio=args.generated_audio,
         eval_type=args.type,
         original_audio=args.original_audio,
         mapping_path=args.mapping,
+        speakers_path=args.speakers,
+        secs_modes=args.secs_modes,
         evaluators=args.evaluators,
         ignore_missing=args.ignore_missing,
         out_path=args.out,
+        profile=args.profile,
+        trace_path=args.trace,
+        cprofile_path=args.cprofile,
+        torch_profile_path=args.torch_profile,
+        shard=args.shard,
+        dry_run=args.dry_run,
+        backends=args.backends,
+        precisions=args.precisions,
+        transcript_cache=transcripts_path,
+        asr_decoding={
+            "language": args.asr_language,
+            "task": args.asr_task,
+            "bounded": args.asr_bounded,
+        },
+        f0_alignment=args.f0_alignment,
+        stats_cache=args.incremental,
+        dedup=args.dedup,
+        manifest_path=args.manifest,
+        bootstrap=args.bootstrap,
+        confidence=args.confidence,
+        baseline_path=args.baseline,
+        early_stop=args.early_stop,
+        metric_tolerances=args.metric_tolerances,
+        time_budget=args.time_budget,
+        results_db=args.results_db,
+        system=args.system,
+        progress=not args.no_progress,
+        metrics_textfile=args.metrics_textfile,
+        metrics_port=args.metrics_port,
     )
@@ -0,0 +1,210 @@
+"""
+Copyright 2025 Balacoon
+
+Manifest - single JSONL/Parquet file with ids, texts, audio paths, durations
+and sample rates, so evaluation starts without discovering and probing audio files
+"""
+
+import argparse
+import json
+import logging
+import os
+from typing import Optional
+
+from speech_gen_eval.audio_dir import ManifestSource, get_audio_source
+
+# columns of the manifest, reference ones are optional
+columns = [
+    "id",
+    "text",
+    "path",
+    "duration",
+    "sample_rate",
+    "reference",
+    "reference_path",
+    "reference_duration",
+    "reference_sample_rate",
+]
+
+
+class Manifest:
+    """
+    Utterances of a manifest with the sources of their generated and reference audio.
+    If rows have no "reference" id, reference audio is of the same id (i.e. vocoder).
+    """
+
+    def __init__(self, rows: list[dict]):
+        """
+        Args:
+            rows (list[dict]): rows of the manifest, see `columns`
+        """
+        self.rows = rows
+        self.generated = ManifestSource(
+            {
+                row["id"]: {
+                    "path": row["path"],
+                    "duration": float(row["duration"]),
+                    "sample_rate": int(row["sample_rate"]),
+                }
+                for row in rows
+            }
+        )
+        self.has_mapping = any(row.get("reference") for row in rows)
+        references = {}
+        for row in rows:
+            if row.get("reference_path"):
+                references[row.get("reference") or row["id"]] = {
+                    "path": row["reference_path"],
+                    "duration": float(row["reference_duration"]),
+                    "sample_rate": int(row["reference_sample_rate"]),
+                }
+        self.original = ManifestSource(references) if references else None
+
+
+def read_manifest(path: str) -> Manifest:
+    """
+    Read a JSONL or Parquet manifest, relative audio paths are resolved
+    against the directory of the manifest
+    Args:
+        path (str): manifest file, ".parquet" or JSON lines
+    Returns:
+        Manifest: utterances and sources of their audio
+    """
+    if path.endswith(".parquet"):
+        rows = _read_parquet(path)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    root = os.path.dirname(os.path.abspath(path))
+    for row in rows:
+        for key in ["path", "reference_path"]:
+            if row.get(key):
+                row[key] = os.path.join(root, row[key])
+    return Manifest(rows)
+
+
+def _read_parquet(path: str) -> list[dict]:
+    try:
+        import pandas as pd
+    except ImportError as e:
+        raise ImportError("Parquet manifests require pandas and pyarrow") from e
+    frame = pd.read_parquet(path)
+    # missing values of optional columns are NaN/None, drop them from the rows
+    return [
+        {k: v for k, v in row.items() if v is not None and v == v}
+        for row in frame.to_dict("records")
+    ]
+
+
+def write_manifest(rows: list[dict], path: str):
+    """
+    Write a manifest, Parquet if the path ends with ".parquet", JSON lines otherwise
+    """
+    if path.endswith(".parquet"):
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError("Parquet manifests require pandas and pyarrow") from e
+        pd.DataFrame(rows).to_parquet(path, index=False)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def build_manifest(
+    txt_path: str,
+    generated_audio: str,
+    original_audio: Optional[str] = None,
+    mapping_path: Optional[str] = None,
+    ignore_missing: bool = False,
+) -> list[dict]:
+    """
+    Discover and probe the audio of the utterances once, to build the manifest rows
+    Args:
+        txt_path (str): Text file with ids and texts
+        generated_audio (str): Directory with generated audio
+        original_audio (Optional[str]): Directory with original audio
+        mapping_path (Optional[str]): Maps generated ids to reference ids
+        ignore_missing (bool): Whether to skip utterances with missing audio
+    Returns:
+        list[dict]: rows of the manifest, see `columns`
+    """
+    from speech_gen_eval.ids import read_txt_and_mapping
+
+    txt, mapping = read_txt_and_mapping(
+        txt_path,
+        generated_audio,
+        mapping_path=mapping_path,
+        original_audio=original_audio,
+        ignore_missing=ignore_missing,
+    )
+    generated = get_audio_source(generated_audio)
+    original = get_audio_source(original_audio) if original_audio else None
+    rows = []
+    for name, text in txt:
+        row = {"id": name, "text": text, **_audio_columns(generated, name, "")}
+        if original is not None:
+            reference = mapping[name] if mapping else name
+            if mapping:
+                row["reference"] = reference
+            row.update(_audio_columns(original, reference, "reference_"))
+        rows.append(row)
+    return rows
+
+
+def _audio_columns(source, name: str, prefix: str) -> dict:
+    path = source.path(name)
+    if path is None:
+        raise ValueError(f"{source.find(name)} is not a file, index only directories")
+    info = source.info(name)
+    return {
+        f"{prefix}path": os.path.abspath(path),
+        f"{prefix}duration": info.duration,
+        f"{prefix}sample_rate": info.samplerate,
+    }
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """
+    Parse command line arguments of the `index` command
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    ap = argparse.ArgumentParser(
+        prog="speech-gen-eval index",
+        description="Builds a manifest of the test set, to evaluate with --manifest",
+    )
+    ap.add_argument("--txt", required=True, help="Text file with ids and text")
+    ap.add_argument(
+        "--generated-audio", required=True, help="Directory with generated audio"
+    )
+    ap.add_argument("--original-audio", help="Directory with original audio")
+    ap.add_argument("--mapping", help="Maps audio ids to reference ids")
+    ap.add_argument(
+        "--ignore-missing",
+        action="store_true",
+        help="Skip ids with missing audio instead of failing",
+    )
+    ap.add_argument(
+        "--out",
+        required=True,
+        help="Manifest to write: .jsonl, or .parquet (requires pandas and pyarrow)",
+    )
+    return ap.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None):
+    """
+    Entry point of the `index` command
+    """
+    args = parse_args(argv)
+    rows = build_manifest(
+        args.txt,
+        args.generated_audio,
+        original_audio=args.original_audio,
+        mapping_path=args.mapping,
+        ignore_missing=args.ignore_missing,
+    )
+    write_manifest(rows, args.out)
+    logging.info(f"Indexed {len(rows)} utterances to {args.out}")
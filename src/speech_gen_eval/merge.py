@@ -0,0 +1,98 @@
+"""
+Copyright 2025 Balacoon
+
+Merge - combine outputs of sharded evaluation into final metrics
+"""
+
+import argparse
+import logging
+from typing import Optional
+
+import yaml
+
+from speech_gen_eval.combined_evaluator import metrics_from_stats
+from speech_gen_eval.evaluator import sum_stats
+from speech_gen_eval.ids import parse_shard
+
+
+def merge_shards(shard_paths: list[str]) -> dict:
+    """
+    Merge outputs of sharded runs, summing sufficient statistics of each evaluator.
+    Metrics are recomputed from the merged statistics,
+    so they are the same as of a single-node run. Speaker similarity modes
+    (centroids, similarity matrix) compare utterances across the whole set,
+    so they are not sharded.
+    Args:
+        shard_paths (list[str]): yaml outputs of runs with `--shard`
+    Returns:
+        dict: merged output with "metrics" and "stats", as well as extra fields shards agree on
+    """
+    shards = []
+    for path in shard_paths:
+        with open(path, "r") as f:
+            shard = yaml.safe_load(f)
+        if "stats" not in shard or "shard" not in shard:
+            raise ValueError(f"{path} is not an output of a sharded run")
+        shards.append(shard)
+
+    # check that shards form a complete partition
+    indices = [parse_shard(x["shard"]) for x in shards]
+    num_shards = {n for _, n in indices}
+    if len(num_shards) != 1:
+        raise ValueError(f"Shards have different number of shards: {num_shards}")
+    num_shards = num_shards.pop()
+    present = sorted(i for i, _ in indices)
+    if len(set(present)) != len(present):
+        raise ValueError(f"Some shards are given multiple times: {present}")
+    missing = sorted(set(range(num_shards)) - set(present))
+    if missing:
+        logging.warning(f"Shards {missing} of {num_shards} are missing")
+
+    evaluator_names = []
+    for shard in shards:
+        for name in shard["stats"]:
+            if name not in evaluator_names:
+                evaluator_names.append(name)
+    stats = {
+        name: sum_stats([x["stats"][name] for x in shards if name in x["stats"]])
+        for name in evaluator_names
+    }
+
+    # extra fields (model name, dataset, ...) are kept if all the shards agree
+    merged = {
+        key: value
+        for key, value in shards[0].items()
+        if key not in ["metrics", "stats", "shard", "profile"]
+        and all(x.get(key) == value for x in shards)
+    }
+    merged["metrics"] = dict(metrics_from_stats(stats))
+    merged["stats"] = stats
+    merged["merged_shards"] = f"{len(present)}/{num_shards}"
+    return merged
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """
+    Parse command line arguments of the `merge` command
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    ap = argparse.ArgumentParser(
+        prog="speech-gen-eval merge",
+        description="Merges outputs of sharded evaluation (runs with --shard i/N)",
+    )
+    ap.add_argument("shards", nargs="+", help="Output yaml files of the shards")
+    ap.add_argument("--out", required=True, help="Output file to save merged metrics")
+    return ap.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None):
+    """
+    Entry point of the `merge` command
+    """
+    args = parse_args(argv)
+    merged = merge_shards(args.shards)
+    for name, value in merged["metrics"].items():
+        logging.info(f"{name}: {value:.4f}")
+    with open(args.out, "w") as f:
+        yaml.dump(merged, f, default_flow_style=False)
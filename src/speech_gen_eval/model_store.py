@@ -0,0 +1,395 @@
+"""
+Copyright 2025 Balacoon
+
+Model store - single local place for all the model artifacts evaluators use,
+with integrity checks and an offline mode that never touches the network
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from typing import Optional
+
+# artifacts evaluators use. "path" is relative to the store directory.
+_artifacts = {
+    "utmos": {
+        "kind": "hf_file",
+        "repo_id": "balacoon/utmos",
+        "filename": "utmos.jit",
+        "path": "utmos/utmos.jit",
+    },
+    "ecapa": {
+        "kind": "hf_file",
+        "repo_id": "balacoon/ecapa",
+        "filename": "ecapa.jit",
+        "path": "ecapa/ecapa.jit",
+    },
+    "ecapa2": {
+        "kind": "hf_file",
+        "repo_id": "Jenthe/ECAPA2",
+        "filename": "ecapa2.pt",
+        "path": "ecapa2/ecapa2.pt",
+    },
+    "whisper": {
+        "kind": "hf_snapshot",
+        "repo_id": "openai/whisper-large-v3-turbo",
+        "allow_patterns": ["*.json", "*.safetensors", "*.txt"],
+        "path": "whisper-large-v3-turbo",
+    },
+    "redimnet": {
+        "kind": "torch_hub",
+        "repo": "IDRnD/ReDimNet",
+        "model": "ReDimNet",
+        "kwargs": {"model_name": "b6", "train_type": "ft_lm", "dataset": "vox2"},
+        "path": "redimnet",
+    },
+    "aesthetics": {
+        "kind": "aesthetics",
+        "path": "aesthetics/audiobox_aesthetics.pth",
+    },
+    "utmosv2": {
+        # checkpoint of the default configuration, passed to `utmosv2.create_model`
+        "kind": "hf_file",
+        "repo_id": "sarulab-speech/UTMOSv2",
+        "filename": "fusion_stage3/fold0_s42_best_model.pth",
+        "path": "utmosv2/fusion_stage3/fold0_s42_best_model.pth",
+    },
+}
+model_names = sorted(_artifacts.keys())
+
+_manifest_name = "manifest.json"
+_offline = os.environ.get("SPEECH_GEN_EVAL_OFFLINE", "0") == "1"
+
+
+def store_dir() -> str:
+    """
+    Get the directory of the model store, `SPEECH_GEN_EVAL_MODELS` environment variable
+    overrides the default location
+    """
+    return os.environ.get(
+        "SPEECH_GEN_EVAL_MODELS",
+        os.path.expanduser("~/.cache/speech_gen_eval/models"),
+    )
+
+
+def set_offline(offline: bool = True):
+    """
+    Switch the local-only mode: models are loaded from the store only,
+    hugging face libraries are switched to offline mode too.
+    """
+    global _offline
+    _offline = offline
+    if offline:
+        os.environ["SPEECH_GEN_EVAL_OFFLINE"] = "1"
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+
+def is_offline() -> bool:
+    return _offline
+
+
+def _read_manifest() -> dict:
+    path = os.path.join(store_dir(), _manifest_name)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest: dict):
+    os.makedirs(store_dir(), exist_ok=True)
+    path = os.path.join(store_dir(), _manifest_name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _describe_files(path: str) -> dict[str, dict]:
+    """
+    Size and checksum of every file of an artifact (which is a file or a directory)
+    """
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = []
+        for root, dirs, names in os.walk(path):
+            # skip download metadata, such as .cache/huggingface
+            dirs[:] = [x for x in dirs if not x.startswith(".")]
+            files.extend(os.path.join(root, name) for name in names)
+    return {
+        os.path.relpath(x, store_dir()): {
+            "size": os.path.getsize(x),
+            "sha256": _sha256(x),
+        }
+        for x in sorted(files)
+    }
+
+
+def _fetch_hf_file(spec: dict, path: str):
+    from huggingface_hub import hf_hub_download
+
+    # the file is put under its path in the repo
+    if not path.endswith(spec["filename"]):
+        raise ValueError(f"Store path {path} doesn't end with {spec['filename']}")
+    hf_hub_download(
+        repo_id=spec["repo_id"],
+        filename=spec["filename"],
+        local_dir=path[: -len(spec["filename"])],
+    )
+
+
+def _fetch_hf_snapshot(spec: dict, path: str):
+    from huggingface_hub import snapshot_download
+
+    snapshot_download(
+        repo_id=spec["repo_id"],
+        allow_patterns=spec["allow_patterns"],
+        local_dir=path,
+    )
+
+
+def _fetch_torch_hub(spec: dict, path: str):
+    """
+    Load the model from torch hub and store it pre-serialized: as TorchScript if
+    the model can be scripted, otherwise as a pickled module next to a copy of its code.
+    Both load without touching github.
+    """
+    import inspect
+
+    import torch
+
+    model = torch.hub.load(
+        spec["repo"], spec["model"], trust_repo=True, **spec["kwargs"]
+    )
+    model.eval()
+    os.makedirs(path, exist_ok=True)
+    try:
+        scripted = torch.jit.script(model)
+        scripted.save(os.path.join(path, "model.jit"))
+        return
+    except Exception as e:
+        logging.warning(f"Can't script {spec['repo']}, storing pickled module: {e}")
+    # checkout of the repo is named after the resolved branch, find it from the code
+    hub_dir = os.path.abspath(torch.hub.get_dir())
+    rel_path = os.path.relpath(os.path.abspath(inspect.getfile(type(model))), hub_dir)
+    if rel_path.startswith(os.pardir):
+        raise RuntimeError(f"Code of {spec['repo']} is not in the hub dir {hub_dir}")
+    repo_dir = os.path.join(hub_dir, rel_path.split(os.sep)[0])
+    shutil.copytree(
+        repo_dir,
+        os.path.join(path, "code"),
+        dirs_exist_ok=True,
+        ignore=shutil.ignore_patterns(".git"),
+    )
+    torch.save(model, os.path.join(path, "model.pt"))
+
+
+def _fetch_aesthetics(spec: dict, path: str):
+    from audiobox_aesthetics.cli import DEFAULT_CKPT_URL, download_file
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    download_file(DEFAULT_CKPT_URL, path)
+
+
+_fetchers = {
+    "hf_file": _fetch_hf_file,
+    "hf_snapshot": _fetch_hf_snapshot,
+    "torch_hub": _fetch_torch_hub,
+    "aesthetics": _fetch_aesthetics,
+}
+
+
+def fetch_model(name: str) -> str:
+    """
+    Download the model into the store and record its checksums
+    Args:
+        name (str): name of the model, one of `model_names`
+    Returns:
+        str: path to the model artifact (file or directory)
+    """
+    if _offline:
+        raise RuntimeError(f"Can't fetch {name} in offline mode")
+    spec = _artifacts[name]
+    path = os.path.join(store_dir(), spec["path"])
+    start = time.time()
+    _fetchers[spec["kind"]](spec, path)
+    manifest = _read_manifest()
+    manifest[name] = {
+        "kind": spec["kind"],
+        "fetched": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "files": _describe_files(path),
+    }
+    _write_manifest(manifest)
+    logging.info(f"Fetched {name} to {path} in {time.time() - start:.1f}s")
+    return path
+
+
+def verify_model(name: str, checksum: bool = False) -> list[str]:
+    """
+    Check the stored model against the manifest
+    Args:
+        name (str): name of the model
+        checksum (bool): whether to verify sha256, otherwise only presence and sizes are checked
+    Returns:
+        list[str]: problems found, empty if the model is intact
+    """
+    entry = _read_manifest().get(name)
+    if entry is None:
+        return [f"{name} is not in the store {store_dir()}"]
+    if not entry["files"]:
+        return [f"{name} has no files in the store {store_dir()}"]
+    problems = []
+    for rel_path, expected in entry["files"].items():
+        path = os.path.join(store_dir(), rel_path)
+        if not os.path.isfile(path):
+            problems.append(f"{rel_path} is missing")
+        elif os.path.getsize(path) != expected["size"]:
+            problems.append(f"{rel_path} has unexpected size")
+        elif checksum and _sha256(path) != expected["sha256"]:
+            problems.append(f"{rel_path} has unexpected checksum")
+    return problems
+
+
+def get_model_path(name: str) -> str:
+    """
+    Get the local path of the model, fetching it if it is not in the store yet.
+    In offline mode, a missing or corrupted model is an error.
+    Args:
+        name (str): name of the model, one of `model_names`
+    Returns:
+        str: path to the model artifact (file or directory)
+    """
+    path = os.path.join(store_dir(), _artifacts[name]["path"])
+    problems = verify_model(name)
+    if not problems:
+        return path
+    if _offline:
+        raise FileNotFoundError(
+            f"Model {name} is not available in offline mode: {'; '.join(problems)}. "
+            "Run `speech-gen-eval fetch-models` on a machine with network access "
+            "and copy the store over."
+        )
+    return fetch_model(name)
+
+
+def load_torch_hub_model(name: str, device: str):
+    """
+    Load a pre-serialized torch hub model from the store
+    Args:
+        name (str): name of the model
+        device (str): device to map the model to
+    """
+    import torch
+
+    path = get_model_path(name)
+    jit_path = os.path.join(path, "model.jit")
+    if os.path.isfile(jit_path):
+        return torch.jit.load(jit_path, map_location=device)
+    # code of the hub repo should be importable to unpickle the model
+    code_dir = os.path.join(path, "code")
+    if code_dir not in sys.path:
+        sys.path.insert(0, code_dir)
+    return torch.load(
+        os.path.join(path, "model.pt"), map_location=device, weights_only=False
+    )
+
+
+def _export_onnx(name: str, verify: bool = False) -> bool:
+    """
+    Export the model to ONNX (unless only verifying) and check its parity
+    with the outputs of the torch model saved with the export
+    Returns:
+        bool: whether the export is fine, True for models without an ONNX export
+    """
+    from speech_gen_eval import onnx_backend
+
+    if name not in onnx_backend.model_names:
+        return True
+    if not verify:
+        onnx_backend.export_model(name)
+    try:
+        onnx_backend.check_parity(name)
+    except (AssertionError, OSError) as e:
+        logging.error(f"{name} ONNX export: {e}")
+        return False
+    logging.info(f"{name} ONNX export: ok")
+    return True
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """
+    Parse command line arguments of the `fetch-models` command
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    ap = argparse.ArgumentParser(
+        prog="speech-gen-eval fetch-models",
+        description="Downloads models into the local store, for offline evaluation",
+    )
+    ap.add_argument(
+        "--models",
+        nargs="+",
+        choices=model_names,
+        default=model_names,
+        help="Models to fetch, all by default",
+    )
+    ap.add_argument(
+        "--store", help="Store directory, overrides SPEECH_GEN_EVAL_MODELS env var"
+    )
+    ap.add_argument(
+        "--verify",
+        action="store_true",
+        help="Only verify checksums of already fetched models",
+    )
+    ap.add_argument(
+        "--force", action="store_true", help="Re-fetch models which are in the store"
+    )
+    ap.add_argument(
+        "--onnx",
+        action="store_true",
+        help="Also export models to ONNX for `--backend <evaluator>=onnx` and check "
+        "their parity with the torch ones, with --verify only check the parity on CPU. "
+        "Models traced on GPU have to be exported on a GPU machine",
+    )
+    return ap.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None):
+    """
+    Entry point of the `fetch-models` command
+    """
+    args = parse_args(argv)
+    if args.store:
+        os.environ["SPEECH_GEN_EVAL_MODELS"] = args.store
+    os.makedirs(store_dir(), exist_ok=True)
+    failed = False
+    for name in args.models:
+        if args.verify:
+            problems = verify_model(name, checksum=True)
+            for problem in problems:
+                logging.error(problem)
+            failed = failed or bool(problems)
+            logging.info(f"{name}: {'corrupted' if problems else 'ok'}")
+        elif args.force or verify_model(name):
+            fetch_model(name)
+        else:
+            logging.info(f"{name} is already in the store")
+        if args.onnx:
+            failed = not _export_onnx(name, verify=args.verify) or failed
+    if failed:
+        sys.exit(1)
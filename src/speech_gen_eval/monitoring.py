@@ -0,0 +1,489 @@
+"""
+Copyright 2025 Balacoon
+
+Monitoring - live counters of a run (items done and failed per task, throughput,
+real-time factor, queue depths, memory) exposed in Prometheus text format
+through a textfile-collector file and/or a local HTTP endpoint,
+and a progress display with ETA across conversion and all the evaluators
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from speech_gen_eval.profiling import peak_rss_mb
+
+# prefix of the exported metrics
+_prefix = "speech_gen_eval"
+# seconds between progress lines when stderr is not a terminal
+_log_interval = 60.0
+
+
+def rss_bytes() -> int:
+    """
+    Current resident set size of this process, the peak one if /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return int(peak_rss_mb()["self"] * 1024 * 1024)
+
+
+def _format_time(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class Monitor:
+    """
+    Live counters of the tasks of a run: audio conversion, shared features
+    and evaluators. Items are counted to the current task, from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._task = "main"
+        self._tasks: dict[str, dict[str, float]] = {}
+        # running task -> time it was entered
+        self._running: dict[str, float] = {}
+        self._queues: dict[str, int] = {}
+        # task -> relative cost, i.e. estimated by the plan
+        self._weights: dict[str, float] = {}
+        # port the counters are served at, see `monitor_run`
+        self.port: Optional[int] = None
+
+    def set_weights(self, weights: dict[str, float]):
+        """
+        Set relative costs of the tasks (see `EvaluationPlan.estimate`) the overall
+        progress is weighted with. Tasks which are not started yet count as not done.
+        Without weights, overall progress is the fraction of done items of started tasks.
+        """
+        with self._lock:
+            self._weights = {k: v for k, v in weights.items() if v > 0}
+
+    @contextmanager
+    def task(self, name: str, total: int):
+        """
+        Count items processed within the context to the given task.
+        Entering a task again (i.e. for another chunk of utterances) adds to its total.
+        Yields a dict, "evaluated" can be set within the context: utterances
+        without statistics are counted as failed when the task is over.
+        The task is complete only if the context exits normally, if it raises
+        the items which are not done yet are counted as failed.
+        """
+        with self._lock:
+            record = self._tasks.setdefault(
+                name,
+                {
+                    "total": 0,
+                    "done": 0,
+                    "failed": 0,
+                    "audio_seconds": 0.0,
+                    "wall_time": 0.0,
+                },
+            )
+            record["total"] += total
+            failed_before = record["failed"]
+            prev_task, self._task = self._task, name
+            self._running[name] = time.time()
+        info = {}
+        completed = False
+        try:
+            yield info
+            completed = True
+        finally:
+            with self._lock:
+                record["wall_time"] += time.time() - self._running.pop(name)
+                if completed:
+                    record["done"] = record["total"]
+                    if "evaluated" in info:
+                        missing = total - info["evaluated"]
+                        record["failed"] = max(
+                            record["failed"], failed_before + missing
+                        )
+                else:
+                    record["failed"] += record["total"] - record["done"]
+                self._queues.pop(name, None)
+                self._task = prev_task
+
+    @property
+    def current_task(self) -> str:
+        """
+        Task items are counted to, "main" outside of the tasks
+        """
+        with self._lock:
+            return self._task
+
+    def expect(self, items: int):
+        """
+        Add items to the total of the current task, i.e. of work which
+        is not per utterance (embeddings of the references)
+        """
+        with self._lock:
+            if self._task in self._tasks:
+                self._tasks[self._task]["total"] += items
+
+    def advance(self, items: int = 1, failed: int = 0, seconds: float = 0.0):
+        """
+        Count processed items to the current task
+        Args:
+            items (int): number of processed items, including failed ones
+            failed (int): number of the items which failed
+            seconds (float): duration of the processed audio
+        """
+        with self._lock:
+            record = self._tasks.get(self._task)
+            if record is None:
+                return
+            record["done"] = min(record["done"] + items, record["total"])
+            record["failed"] += failed
+            record["audio_seconds"] += seconds
+
+    def set_queue_depth(self, name: str, depth: int):
+        """
+        Set the number of items waiting in a queue, i.e. submitted to a pool
+        """
+        with self._lock:
+            self._queues[name] = depth
+
+    def snapshot(self) -> dict:
+        """
+        Get the current state of the counters
+        Returns:
+            dict: "tasks" (task -> counters and rates), "queues" (queue -> depth),
+                "current" task, overall "progress" (0..1), "elapsed" and "eta" seconds,
+                "rss" bytes
+        """
+        now = time.time()
+        with self._lock:
+            tasks = {name: dict(record) for name, record in self._tasks.items()}
+            for name, entered in self._running.items():
+                tasks[name]["wall_time"] += now - entered
+            queues = dict(self._queues)
+            weights = dict(self._weights)
+            current = self._task
+        for record in tasks.values():
+            wall_time = record["wall_time"]
+            record["items_per_second"] = (
+                record["done"] / wall_time if wall_time else 0.0
+            )
+            record["rtf"] = (
+                wall_time / record["audio_seconds"] if record["audio_seconds"] else None
+            )
+        if weights:
+            fractions = {
+                name: x["done"] / x["total"] if x["total"] else 1.0
+                for name, x in tasks.items()
+            }
+            progress = sum(
+                weight * fractions.get(name, 0.0) for name, weight in weights.items()
+            ) / sum(weights.values())
+        else:
+            total = sum(x["total"] for x in tasks.values())
+            progress = sum(x["done"] for x in tasks.values()) / total if total else 0.0
+        elapsed = now - self._start
+        return {
+            "tasks": tasks,
+            "queues": queues,
+            "current": current,
+            "progress": progress,
+            "elapsed": elapsed,
+            "eta": elapsed * (1 - progress) / progress if progress > 0 else None,
+            "rss": rss_bytes(),
+        }
+
+    def exposition(self) -> str:
+        """
+        Counters in the Prometheus text exposition format
+        """
+        state = self.snapshot()
+        lines = []
+
+        def add(name: str, kind: str, doc: str, samples: list[tuple[str, float]]):
+            lines.append(f"# HELP {_prefix}_{name} {doc}")
+            lines.append(f"# TYPE {_prefix}_{name} {kind}")
+            lines.extend(
+                f"{_prefix}_{name}{labels} {value}" for labels, value in samples
+            )
+
+        for name, kind, key, doc in [
+            ("items", "gauge", "total", "Items to process"),
+            (
+                "items_done_total",
+                "counter",
+                "done",
+                "Processed items, including failed",
+            ),
+            ("items_failed_total", "counter", "failed", "Failed items"),
+            ("audio_seconds_total", "counter", "audio_seconds", "Processed audio"),
+            ("wall_seconds_total", "counter", "wall_time", "Time spent in the task"),
+            ("items_per_second", "gauge", "items_per_second", "Throughput"),
+            ("real_time_factor", "gauge", "rtf", "Wall time per second of audio"),
+        ]:
+            add(
+                name,
+                kind,
+                doc,
+                [
+                    (f'{{task="{task}"}}', record[key])
+                    for task, record in state["tasks"].items()
+                    if record[key] is not None
+                ],
+            )
+        add(
+            "queue_depth",
+            "gauge",
+            "Items waiting in a queue",
+            [(f'{{queue="{x}"}}', depth) for x, depth in state["queues"].items()],
+        )
+        add("progress_ratio", "gauge", "Progress of the run", [("", state["progress"])])
+        if state["eta"] is not None:
+            add("eta_seconds", "gauge", "Estimated time left", [("", state["eta"])])
+        add(
+            "elapsed_seconds", "gauge", "Time since the start", [("", state["elapsed"])]
+        )
+        add("resident_memory_bytes", "gauge", "Resident set size", [("", state["rss"])])
+        add(
+            "peak_resident_memory_bytes",
+            "gauge",
+            "Peak resident set size, of the finished processes for children",
+            [(f'{{process="{k}"}}', v * 1024 * 1024) for k, v in peak_rss_mb().items()],
+        )
+        return "\n".join(lines) + "\n"
+
+    def progress_line(self) -> str:
+        """
+        One-line progress of the run: counters and throughput of the current task,
+        overall progress with ETA, memory
+        """
+        state = self.snapshot()
+        parts = []
+        record = state["tasks"].get(state["current"])
+        if record is not None:
+            task = f"{state['current']} {record['done']}/{record['total']}"
+            if record["failed"]:
+                task += f" ({record['failed']} failed)"
+            task += f" {record['items_per_second']:.1f} it/s"
+            if record["rtf"] is not None:
+                task += f" RTF {record['rtf']:.3f}"
+            parts.append(task)
+        overall = (
+            f"total {state['progress'] * 100:.1f}% {_format_time(state['elapsed'])}"
+        )
+        if state["eta"] is not None:
+            overall += f" ETA {_format_time(state['eta'])}"
+        parts.append(overall)
+        parts.append(f"RSS {state['rss'] / 1024**3:.2f}GB")
+        return " | ".join(parts)
+
+    def write_textfile(self, path: str):
+        """
+        Write the counters for the node_exporter textfile collector (a ".prom" file).
+        Written to a temporary file and renamed, so the collector never reads a partial one
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.exposition())
+        os.replace(tmp_path, path)
+
+
+def _serve(monitor: Monitor, port: int) -> ThreadingHTTPServer:
+    """
+    Serve the counters of the monitor on localhost, at /metrics
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ["/", "/metrics"]:
+                self.send_error(404)
+                return
+            body = monitor.exposition().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # scrapes are not worth logging
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# monitor of the current run, items are not counted if there is none
+_active: Optional[Monitor] = None
+
+
+@contextmanager
+def monitor_run(
+    textfile: Optional[str] = None,
+    port: Optional[int] = None,
+    display: bool = True,
+    interval: float = 5.0,
+):
+    """
+    Activate a monitor for the run, so conversion and evaluators count their items
+    Args:
+        textfile (Optional[str]): file to write the counters to every interval,
+            for the node_exporter textfile collector
+        port (Optional[int]): serve the counters at http://127.0.0.1:<port>/metrics,
+            0 picks a free port (see the "port" of the yielded monitor)
+        display (bool): show the progress on stderr, refreshed every interval
+            on a terminal and logged every minute otherwise
+        interval (float): seconds between updates of the textfile and the display
+    Yields:
+        Monitor: the active monitor
+    """
+    global _active
+    prev = _active
+    monitor = _active = Monitor()
+    server = _start_server(monitor, port) if port is not None else None
+    writers = [lambda final: monitor.write_textfile(textfile)] if textfile else []
+    if display:
+        writers.append(_progress_display(monitor))
+
+    def report(final: bool = False):
+        for write in writers:
+            write(final)
+
+    stop = threading.Event()
+    reporter = threading.Thread(
+        target=_report_loop, args=(report, stop, interval), daemon=True
+    )
+    reporter.start()
+    try:
+        yield monitor
+    finally:
+        stop.set()
+        reporter.join()
+        report(final=True)
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        _active = prev
+
+
+def _start_server(monitor: Monitor, port: int) -> ThreadingHTTPServer:
+    """
+    Serve the counters of the monitor, the picked port is stored in the monitor
+    """
+    server = _serve(monitor, port)
+    monitor.port = server.server_address[1]
+    logging.info(f"Serving live counters at http://127.0.0.1:{monitor.port}/metrics")
+    return server
+
+
+def _progress_display(monitor: Monitor) -> Callable[[bool], None]:
+    """
+    Show the progress line on stderr: rewritten in place on a terminal,
+    logged every `_log_interval` seconds otherwise. The final line is always shown
+    """
+    tty = sys.stderr.isatty()
+    last_log = time.time()
+
+    def show(final: bool):
+        nonlocal last_log
+        if tty:
+            sys.stderr.write(
+                f"\r{monitor.progress_line()}\033[K" + ("\n" if final else "")
+            )
+            sys.stderr.flush()
+        elif final or time.time() - last_log >= _log_interval:
+            logging.info(monitor.progress_line())
+            last_log = time.time()
+
+    return show
+
+
+def _report_loop(report: Callable, stop: threading.Event, interval: float):
+    """
+    Report every interval until stopped, failures are logged and don't stop the run
+    """
+    while not stop.wait(interval):
+        try:
+            report()
+        except Exception as e:
+            logging.warning(f"Failed to report the progress: {e}")
+
+
+@contextmanager
+def task(name: str, total: int):
+    """
+    Count items within the context to the given task, no-op if monitoring is off.
+    Yields a dict, see `Monitor.task`
+    """
+    if _active is None:
+        yield {}
+    else:
+        with _active.task(name, total) as info:
+            yield info
+
+
+def set_weights(weights: dict[str, float]):
+    """
+    Set relative costs of the tasks, no-op if monitoring is off. See `Monitor.set_weights`
+    """
+    if _active is not None:
+        _active.set_weights(weights)
+
+
+def expect(items: int):
+    """
+    Add items to the total of the current task, no-op if monitoring is off
+    """
+    if _active is not None:
+        _active.expect(items)
+
+
+def advance(items: int = 1, failed: int = 0, seconds: float = 0.0):
+    """
+    Count processed items to the current task, no-op if monitoring is off.
+    See `Monitor.advance`
+    """
+    if _active is not None:
+        _active.advance(items, failed=failed, seconds=seconds)
+
+
+def set_queue_depth(name: str, depth: int):
+    """
+    Set the number of items waiting in a queue, no-op if monitoring is off
+    """
+    if _active is not None:
+        _active.set_queue_depth(name, depth)
+
+
+def progress(
+    iterable: Iterable, items: Callable = lambda x: 1, queue: Optional[str] = None
+) -> Iterator:
+    """
+    Iterate and count each element as processed once the next one is requested,
+    replaces a tqdm progress bar. Remaining elements are reported as the queue depth.
+    Args:
+        iterable (Iterable): elements, i.e. batches
+        items (Callable): number of items in an element, i.e. `len` for batches
+        queue (Optional[str]): name of the queue, the current task by default
+    """
+    if _active is None:
+        yield from iterable
+        return
+    queue = queue or _active.current_task
+    remaining = len(iterable) if hasattr(iterable, "__len__") else None
+    for x in iterable:
+        if remaining is not None:
+            remaining -= 1
+            _active.set_queue_depth(queue, remaining)
+        yield x
+        _active.advance(items(x))
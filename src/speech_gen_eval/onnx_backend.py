@@ -0,0 +1,217 @@
+"""
+Copyright 2025 Balacoon
+
+ONNX backend - exports TorchScript evaluator models to ONNX with dynamic sequence axes
+(an explicit step, see `fetch-models --onnx`) and runs them with onnxruntime on CPU
+"""
+
+import logging
+import os
+from typing import Optional
+
+from speech_gen_eval import model_store, threads
+
+backends = ["torch", "onnx"]
+
+# how to export each of the models: example inputs (dtype, shape) and axes that vary
+_export_specs = {
+    "utmos": {
+        "inputs": {"wav": ("int16", (2, 32000))},
+        "outputs": ["mos"],
+        "dynamic_axes": {"wav": {0: "batch", 1: "time"}, "mos": {0: "batch"}},
+    },
+    "ecapa": {
+        "inputs": {"wav": ("int16", (1, 32000)), "wav_len": ("int64", (1,))},
+        "outputs": ["embedding"],
+        "dynamic_axes": {"wav": {1: "time"}},
+    },
+    "ecapa2": {
+        "inputs": {"wav": ("float32", (1, 32000))},
+        "outputs": ["embedding"],
+        "dynamic_axes": {"wav": {1: "time"}},
+    },
+    "redimnet": {
+        "inputs": {"wav": ("float32", (1, 32000))},
+        "outputs": ["embedding"],
+        "dynamic_axes": {"wav": {1: "time"}},
+    },
+}
+model_names = sorted(_export_specs.keys())
+# waveform lengths of the reference outputs saved with the export
+_reference_lengths = [16000, 80000]
+
+
+def onnx_model_path(name: str) -> str:
+    """
+    Get the path of the ONNX export of the model in the store
+    """
+    return os.path.join(model_store.store_dir(), "onnx", f"{name}.onnx")
+
+
+def reference_path(name: str) -> str:
+    """
+    Get the path of the reference outputs of the torch model, saved with the export
+    """
+    return os.path.join(model_store.store_dir(), "onnx", f"{name}.reference.npz")
+
+
+def example_inputs(
+    name: str, device: str = "cpu", length: Optional[int] = None
+) -> tuple:
+    """
+    Create example inputs of the model, i.e. to export it or to check parity
+    Args:
+        name (str): name of the model
+        device (str): device to put the inputs to
+        length (Optional[int]): number of samples in the waveforms, default of the spec if None
+    """
+    import torch
+
+    inputs = []
+    for dtype, shape in _export_specs[name]["inputs"].values():
+        if length is not None and len(shape) == 2:
+            shape = (shape[0], length)
+        if dtype == "int16":
+            x = torch.randint(-3000, 3000, shape, dtype=torch.int16)
+        elif dtype == "int64":
+            # lengths of the example waveforms
+            x = torch.full(shape, inputs[0].shape[1], dtype=torch.int64)
+        else:
+            x = 0.1 * torch.randn(shape)
+        inputs.append(x.to(device))
+    return tuple(inputs)
+
+
+def load_torch_model(name: str, device: str):
+    """
+    Load the original TorchScript model from the store
+    """
+    import torch
+
+    if name == "redimnet":
+        model = model_store.load_torch_hub_model(name, device)
+        model.eval()
+        return model
+    return torch.jit.load(model_store.get_model_path(name), map_location=device)
+
+
+def export_model(name: str) -> str:
+    """
+    Export the model to ONNX. Some TorchScript models are traced on GPU,
+    those have to be exported on a GPU machine, the exported model runs on CPU.
+    Outputs of the torch model on example inputs are saved next to the export,
+    so parity can be checked on CPU (see `check_parity`)
+    Args:
+        name (str): name of the model, one of `model_names`
+    Returns:
+        str: path to the exported model
+    """
+    import numpy as np
+    import torch
+
+    spec = _export_specs[name]
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    model = load_torch_model(name, device)
+    path = onnx_model_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            example_inputs(name, device),
+            tmp_path,
+            input_names=list(spec["inputs"]),
+            output_names=spec["outputs"],
+            dynamic_axes=spec["dynamic_axes"],
+            opset_version=17,
+            dynamo=False,
+        )
+    os.replace(tmp_path, path)
+    references = {}
+    with torch.no_grad():
+        for length in _reference_lengths:
+            inputs = example_inputs(name, device, length=length)
+            for i, x in enumerate(inputs):
+                references[f"{length}_input_{i}"] = x.cpu().numpy()
+            output = model(*inputs).float().cpu().numpy()
+            references[f"{length}_output"] = output
+    np.savez(reference_path(name), **references)
+    logging.info(f"Exported {name} to {path}")
+    return path
+
+
+def check_parity(name: str, rtol: float = 1e-3, atol: float = 1e-4):
+    """
+    Check outputs of the ONNX model against the ones of the torch model
+    saved with the export, runs on CPU
+    Args:
+        name (str): name of the model, one of `model_names`
+    Raises:
+        AssertionError: if outputs differ
+    """
+    import numpy as np
+    import torch
+
+    model = load_onnx_model(name)
+    with np.load(reference_path(name)) as references:
+        for length in _reference_lengths:
+            inputs = [
+                torch.from_numpy(references[f"{length}_input_{i}"])
+                for i in range(len(_export_specs[name]["inputs"]))
+            ]
+            np.testing.assert_allclose(
+                model(*inputs).float().numpy(),
+                references[f"{length}_output"],
+                rtol=rtol,
+                atol=atol,
+                err_msg=f"{name} ONNX outputs differ from the torch ones",
+            )
+
+
+class OnnxModel:
+    """
+    Runs an ONNX model with onnxruntime on CPU.
+    Called with torch tensors and returns a torch tensor, same as the torch model it replaces.
+    """
+
+    def __init__(self, path: str, num_threads: Optional[int] = None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                "onnx backend requires onnxruntime: pip install onnxruntime"
+            ) from e
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [x.name for x in self._session.get_inputs()]
+
+    def __call__(self, *inputs):
+        import torch
+
+        feed = {
+            name: x.detach().cpu().numpy() for name, x in zip(self._input_names, inputs)
+        }
+        return torch.from_numpy(self._session.run(None, feed)[0])
+
+
+def load_onnx_model(name: str) -> OnnxModel:
+    """
+    Load the ONNX export of the model from the store
+    Args:
+        name (str): name of the model, one of `model_names`
+    """
+    path = onnx_model_path(name)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(
+            f"ONNX export of {name} is not in the store {model_store.store_dir()}. "
+            "Run `speech-gen-eval fetch-models --onnx` (on a GPU machine for "
+            "utmos and ecapa) and copy the store over."
+        )
+    return OnnxModel(path, num_threads=threads.get_cpus())
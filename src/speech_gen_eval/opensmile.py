@@ -4,31 +4,36 @@ Copyright 2025, Balacoon
 This evaluator computes opensmile features: jitter and shimmer.
 """
 
+import os
 from functools import partial
 from multiprocessing import Pool
 
 import numpy as np
 import opensmile
 
-from speech_gen_eval import evaluator
-from speech_gen_eval.audio_dir import get_audio_paths
+from speech_gen_eval import evaluator, monitoring, profiling, threads
+from speech_gen_eval.audio_dir import get_audio_items
+
+# reduced eGeMAPSv02: only the components jitter and shimmer depend on,
+# values are the same as of the full set, which computes 88 functionals
+_config_path = os.path.join(os.path.dirname(__file__), "jitter_shimmer.conf")
 
 
 def _process_fold(
-    paths: list[str], ignore_errors: bool = False
-) -> list[tuple[float, float]]:
-    """Process a fold of audio files and return jitter/shimmer values"""
-    smile = opensmile.Smile(
-        feature_set=opensmile.FeatureSet.eGeMAPSv02,
-        feature_level=opensmile.FeatureLevel.Functionals,
-    )
+    items: list[tuple[str, str | np.ndarray]], ignore_errors: bool = False
+) -> list[tuple[str, float, float]]:
+    """Process a fold of audio files and return ids with jitter/shimmer values"""
+    smile = opensmile.Smile(feature_set=_config_path, feature_level="func")
     results = []
-    for path in paths:
+    for name, audio in items:
         try:
-            features = smile.process_file(path)
+            if isinstance(audio, str):
+                features = smile.process_file(audio)
+            else:
+                features = smile.process_signal(audio, 16000)
             jitter = float(features["jitterLocal_sma3nz_amean"].iloc[0])
             shimmer = float(features["shimmerLocaldB_sma3nz_amean"].iloc[0])
-            results.append((jitter, shimmer))
+            results.append((name, jitter, shimmer))
         except Exception as e:
             if not ignore_errors:
                 raise e
@@ -42,7 +47,8 @@ class OpenSmileEvaluator(evaluator.Evaluator):
     which correlate with the quality of the speech signal.
     """
 
-    _njobs = 8
+    rtf = 0.02
+    lower_is_better = ("jitter", "shimmer")
 
     def __init__(
         self,
@@ -63,35 +69,56 @@ class OpenSmileEvaluator(evaluator.Evaluator):
         """
         return "Jitter and Shimmer evaluation"
 
-    def get_metric(self):
+    def get_utterance_stats(self):
         """
-        Get the metrics computed on all audio files
+        Get jitter and shimmer for each of the utterances
+        Returns:
+            dict[str, dict[str, float]]: utterance id -> statistics name -> value
         """
-        audio_paths = get_audio_paths(self._audio_dir, self._ids)
-
-        # Split paths into folds for parallel processing
-        fold_size = len(audio_paths) // self._njobs
-        folds = [
-            audio_paths[i : i + fold_size]
-            for i in range(0, len(audio_paths), fold_size)
-        ]
-
-        # Process folds in parallel
-        with Pool(self._njobs) as pool:
-            fold_results = pool.map(
-                partial(_process_fold, ignore_errors=self._ignore_errors), folds
-            )
+        items = get_audio_items(self._audio_dir, self._ids)
+
+        # Split items into folds for parallel processing
+        njobs = threads.pool_size(len(items))
+        fold_size = max(1, len(items) // njobs)
+        folds = [items[i : i + fold_size] for i in range(0, len(items), fold_size)]
+
+        # Process folds in parallel, workers decode audio and extract features
+        with profiling.stage("feature_extraction", items=len(items)):
+            with Pool(njobs, initializer=threads.init_worker) as pool:
+                fold_results = list(
+                    monitoring.progress(
+                        pool.imap(
+                            partial(_process_fold, ignore_errors=self._ignore_errors),
+                            folds,
+                        ),
+                        items=len,
+                    )
+                )
 
         # Combine results from all folds
-        all_results = []
+        utterance_stats = {}
         for fold in fold_results:
-            all_results.extend(fold)
-
-        # Calculate mean jitter and shimmer
-        if len(all_results) > 0:
-            jitters, shimmers = zip(*all_results)
-            return [
-                ("jitter", float(np.mean(jitters))),
-                ("shimmer", float(np.mean(shimmers))),
-            ]
+            for name, jitter, shimmer in fold:
+                utterance_stats[name] = {
+                    "jitter_sum": jitter,
+                    "shimmer_sum": shimmer,
+                    "count": 1,
+                }
+        return utterance_stats
+
+    @classmethod
+    def metrics_from_stats(cls, stats):
+        """
+        Get mean jitter and shimmer from the summed statistics
+        """
+        return [
+            ("jitter", stats["jitter_sum"] / stats["count"]),
+            ("shimmer", stats["shimmer_sum"] / stats["count"]),
+        ]
+
+    @classmethod
+    def metrics_without_stats(cls):
+        """
+        Jitter and shimmer are reported as zeros if no utterance yields them
+        """
         return [("jitter", 0.0), ("shimmer", 0.0)]
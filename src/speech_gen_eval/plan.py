@@ -0,0 +1,175 @@
+"""
+Copyright 2025 Balacoon
+
+Plan - derives the minimal work of an evaluation run from evaluators' declared inputs
+"""
+
+from typing import Optional
+
+import yaml
+
+from speech_gen_eval import monitoring, profiling
+from speech_gen_eval.audio_dir import get_audio_path, get_audio_source
+from speech_gen_eval.combined_evaluator import name2evaluator
+from speech_gen_eval.features import shared_features
+
+# rough CPU processing time per second of audio of conversion and shared features
+_convert_rtf = 0.02
+_feature_rtf = {"f0": 0.15}
+
+
+class EvaluationPlan:
+    """
+    Work set of an evaluation run: which generated and original files to convert,
+    which features to compute once and share between evaluators.
+    """
+
+    def __init__(
+        self,
+        eval_names: list[str],
+        ids: list[tuple[str, str]],
+        mapping: Optional[dict[str, str]] = None,
+    ):
+        """
+        Args:
+            eval_names (list[str]): Names of the evaluators to run
+            ids (list[tuple[str, str]]): ids and texts of the utterances to evaluate
+            mapping (Optional[dict[str, str]]): generated id -> reference id
+        """
+        self.evaluators = list(eval_names)
+        names = [name for name, _ in ids]
+        # ids of audio each of the inputs resolves to
+        sources = {
+            "generated": names,
+            "original": names,
+            "reference": sorted({mapping[x] for x in names}) if mapping else names,
+        }
+        self._sources = sources
+        self.inputs = {}
+        features: dict[str, dict[str, set]] = {}
+        for eval_name in eval_names:
+            evaluator_cls = name2evaluator[eval_name]
+            self.inputs[eval_name] = list(evaluator_cls.inputs)
+            for feature in evaluator_cls.features:
+                for source in evaluator_cls.inputs:
+                    directory = "generated" if source == "generated" else "original"
+                    feature_ids = features.setdefault(feature, {})
+                    feature_ids.setdefault(directory, set()).update(sources[source])
+
+        used = {x for inputs in self.inputs.values() for x in inputs}
+        self.generated = names if "generated" in used else []
+        original = set()
+        for source in ["original", "reference"]:
+            if source in used:
+                original.update(sources[source])
+        self.original = sorted(original)
+        # feature -> "generated"/"original" -> ids to compute the feature for
+        self.features = {
+            feature: {directory: sorted(ids) for directory, ids in per_dir.items()}
+            for feature, per_dir in features.items()
+        }
+
+    def compute_shared_features(
+        self,
+        generated_dir: Optional[str],
+        original_dir: Optional[str],
+        ignore_errors: bool = True,
+    ):
+        """
+        Compute shared features (see `features.shared_features`) of the converted audio once,
+        they are cached next to the audio where evaluators pick them up
+        """
+        dirs = {"generated": generated_dir, "original": original_dir}
+        for feature, per_dir in self.features.items():
+            if feature not in shared_features:
+                continue
+            paths = []
+            for directory, names in per_dir.items():
+                for name in names:
+                    path = get_audio_path(dirs[directory], name)
+                    if path is not None:
+                        paths.append(path)
+            if not paths:
+                continue
+            with profiling.evaluator("features"), profiling.stage(
+                "feature_extraction", items=len(paths)
+            ), monitoring.task("features", len(paths)):
+                shared_features[feature](paths, ignore_errors=ignore_errors)
+
+    def estimate(
+        self, generated_audio: str, original_audio: Optional[str] = None
+    ) -> dict[str, float]:
+        """
+        Estimate CPU time of each stage of the plan from audio durations
+        and per-evaluator real-time factors
+        Args:
+            generated_audio (str): directory with generated audio (not converted)
+            original_audio (Optional[str]): directory with original audio
+        Returns:
+            dict[str, float]: stage -> estimated CPU seconds
+        """
+        dirs = {"generated": generated_audio, "original": original_audio}
+        durations = {
+            source: _total_duration(
+                dirs["generated" if source == "generated" else "original"], names
+            )
+            for source, names in self._sources.items()
+        }
+        converted = _total_duration(generated_audio, self.generated)
+        converted += _total_duration(original_audio, self.original)
+        cost = {"convert_audio_dir": _convert_rtf * converted}
+        for feature, per_dir in self.features.items():
+            if feature in shared_features:
+                cost[feature] = _feature_rtf.get(feature, 0.1) * sum(
+                    _total_duration(dirs[x], names) for x, names in per_dir.items()
+                )
+        for eval_name in self.evaluators:
+            cost[eval_name] = name2evaluator[eval_name].rtf * sum(
+                durations[x] for x in self.inputs[eval_name]
+            )
+        return {stage: round(seconds, 1) for stage, seconds in cost.items()}
+
+    def describe(
+        self, generated_audio: str, original_audio: Optional[str] = None
+    ) -> str:
+        """
+        Human-readable plan with the estimated cost, printed with `--dry-run`
+        """
+        estimate = self.estimate(generated_audio, original_audio)
+        plan = {
+            "convert": {
+                "generated": len(self.generated),
+                "original": len(self.original),
+            },
+            "shared_features": {
+                feature: {x: len(names) for x, names in per_dir.items()}
+                for feature, per_dir in self.features.items()
+                if feature in shared_features
+            },
+            "evaluators": {
+                x: {
+                    "inputs": self.inputs[x],
+                    "features": list(name2evaluator[x].features),
+                }
+                for x in self.evaluators
+            },
+            "estimated_cpu_seconds": {
+                **estimate,
+                "total": round(sum(estimate.values()), 1),
+            },
+        }
+        return yaml.dump(plan, default_flow_style=False, sort_keys=False)
+
+
+def _total_duration(directory: Optional[str], names: list[str]) -> float:
+    """
+    Total duration of the audio files in seconds
+    """
+    total = 0.0
+    if directory is None:
+        return total
+    source = get_audio_source(directory)
+    for name in names:
+        if source.find(name) is not None:
+            total += source.duration(name)
+    return total
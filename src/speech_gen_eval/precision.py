@@ -0,0 +1,171 @@
+"""
+Copyright 2025 Balacoon
+
+Precision - CPU low-precision inference (bf16 autocast, dynamic int8 quantization)
+and a drift check of the metrics against the fp32 baseline
+"""
+
+import argparse
+import logging
+import sys
+import time
+from contextlib import nullcontext
+from typing import Optional
+
+import numpy as np
+import yaml
+
+precisions = ["fp32", "bf16", "int8"]
+
+
+def quantize_int8(model):
+    """
+    Dynamically quantize linear layers of the model to int8, for CPU inference
+    """
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def autocast(precision: str):
+    """
+    Context to run CPU inference in, autocasts to bfloat16 if precision is "bf16"
+    """
+    import torch
+
+    if precision == "bf16":
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return nullcontext()
+
+
+def check_drift(
+    txt_path: str,
+    generated_audio: str,
+    evaluators: list[str],
+    precision: str,
+    num_utterances: int = 20,
+    seed: int = 0,
+) -> dict:
+    """
+    Evaluate a calibration subset with fp32 and with the given precision,
+    to see how much the metrics drift and how much faster it is
+    Args:
+        txt_path (str): Path to text file with ids and text
+        generated_audio (str): Directory with generated audio
+        evaluators (list[str]): Evaluators to check, should support the precision
+        precision (str): "bf16" or "int8"
+        num_utterances (int): Size of the calibration subset
+        seed (int): Random seed of the subset selection
+    Returns:
+        dict: metrics of both runs, their deltas, and timings
+    """
+    from speech_gen_eval.audio_dir import convert_audio_dir
+    from speech_gen_eval.combined_evaluator import CombinedEvaluator
+    from speech_gen_eval.ids import read_txt_and_mapping
+
+    ids, _ = read_txt_and_mapping(txt_path, generated_audio, ignore_missing=True)
+    rng = np.random.default_rng(seed)
+    subset = rng.choice(len(ids), min(num_utterances, len(ids)), replace=False)
+    ids = [ids[i] for i in sorted(subset)]
+
+    metrics, timings = {}, {}
+    with convert_audio_dir(generated_audio, ids, sample_rate=16000) as generated_16khz:
+        for run_precision in ["fp32", precision]:
+            # models are loaded within the timed run, as they are quantized on load
+            start = time.perf_counter()
+            evaluator = CombinedEvaluator(
+                evaluators,
+                ids=ids,
+                generated_audio=generated_16khz,
+                ignore_errors=True,
+                precisions={name: run_precision for name in evaluators},
+            )
+            metrics[run_precision] = dict(evaluator.get_metric())
+            timings[run_precision] = round(time.perf_counter() - start, 3)
+
+    baseline, low = metrics["fp32"], metrics[precision]
+    return {
+        "precision": precision,
+        "utterances": len(ids),
+        "metrics": {
+            name: {
+                "fp32": baseline[name],
+                precision: low[name],
+                "delta": low[name] - baseline[name],
+            }
+            for name in baseline
+            if name in low
+        },
+        "time": {**timings, "speedup": round(timings["fp32"] / timings[precision], 2)},
+    }
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """
+    Parse command line arguments of the `drift` command
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    ap = argparse.ArgumentParser(
+        prog="speech-gen-eval drift",
+        description="Reports metric deltas of a low-precision mode vs fp32 on a calibration subset",
+    )
+    ap.add_argument("--txt", required=True, help="Text file with ids and text")
+    ap.add_argument(
+        "--generated-audio", required=True, help="Directory with generated audio"
+    )
+    ap.add_argument(
+        "--evaluators",
+        nargs="+",
+        default=["cer", "aesthetics"],
+        help="Evaluators to check",
+    )
+    ap.add_argument(
+        "--precision",
+        choices=[x for x in precisions if x != "fp32"],
+        required=True,
+        help="Low precision mode to compare with fp32",
+    )
+    ap.add_argument(
+        "--num-utterances", type=int, default=20, help="Size of the calibration subset"
+    )
+    ap.add_argument("--seed", type=int, default=0, help="Random seed of the subset")
+    ap.add_argument(
+        "--tolerance",
+        type=float,
+        help="Exit with an error if any metric drifts by more than this",
+    )
+    ap.add_argument("--out", help="YAML file to save the report, stdout by default")
+    return ap.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None):
+    """
+    Entry point of the `drift` command
+    """
+    args = parse_args(argv)
+    report = check_drift(
+        args.txt,
+        args.generated_audio,
+        args.evaluators,
+        args.precision,
+        num_utterances=args.num_utterances,
+        seed=args.seed,
+    )
+    report_str = yaml.dump(report, default_flow_style=False, sort_keys=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report_str)
+    else:
+        print(report_str, end="")
+    if args.tolerance is not None:
+        drifted = [
+            name
+            for name, record in report["metrics"].items()
+            if abs(record["delta"]) > args.tolerance
+        ]
+        if drifted:
+            logging.error(f"Metrics drifted beyond {args.tolerance}: {drifted}")
+            sys.exit(1)
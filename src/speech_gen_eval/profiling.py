@@ -0,0 +1,320 @@
+"""
+Copyright 2025 Balacoon
+
+Profiling - per-evaluator and per-stage timing instrumentation
+"""
+
+import cProfile
+import json
+import logging
+import os
+import platform
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# stages evaluators report, others are allowed too
+STAGES = ["model_load", "decode", "feature_extraction", "inference", "aggregation"]
+
+# raw spans are kept for the trace file, summary statistics are kept regardless
+_max_spans = 200000
+
+
+def cpu_time() -> float:
+    """
+    CPU time of this process (all threads) and of its finished children (pool workers, ffmpeg)
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def peak_rss_mb() -> dict[str, float]:
+    """
+    Peak resident set size of this process and of its (finished) children in MB
+    """
+    # ru_maxrss is in kilobytes on linux, in bytes on macos
+    scale = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return {"self": round(own, 1), "children": round(children, 1)}
+
+
+class Profiler:
+    """
+    Records wall time, CPU time, items processed and queue wait
+    per evaluator and per stage. Stages can be recorded from multiple threads,
+    the current evaluator is kept per thread (see `propagate` for worker threads).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # evaluator and its span of the thread
+        self._local = threading.local()
+        self._summary: dict[str, dict[str, dict[str, float]]] = {}
+        self._spans: list[dict] = []
+        self._next_span_id = 1
+
+    @property
+    def context(self) -> tuple[str, Optional[int]]:
+        """
+        Evaluator stages of the current thread are attributed to, and its span id
+        """
+        return getattr(self._local, "context", ("main", None))
+
+    @contextmanager
+    def bind(self, context: tuple[str, Optional[int]]):
+        """
+        Attribute stages of the current thread to the context of another one
+        """
+        prev = self.context
+        self._local.context = context
+        try:
+            yield
+        finally:
+            self._local.context = prev
+
+    def _add_span(self, span: dict):
+        with self._lock:
+            evaluator_summary = self._summary.setdefault(span["evaluator"], {})
+            record = evaluator_summary.setdefault(
+                span["stage"],
+                {
+                    "wall_time": 0.0,
+                    "cpu_time": 0.0,
+                    "items": 0,
+                    "calls": 0,
+                    "queue_wait": 0.0,
+                },
+            )
+            record["wall_time"] += span["wall_time"]
+            record["cpu_time"] += span["cpu_time"]
+            record["items"] += span["items"]
+            record["calls"] += 1
+            record["queue_wait"] += span["queue_wait"]
+            if len(self._spans) < _max_spans:
+                self._spans.append(span)
+            elif len(self._spans) == _max_spans:
+                logging.warning(f"More than {_max_spans} spans, trace is truncated")
+                self._spans.append(None)
+
+    def _new_span_id(self) -> int:
+        with self._lock:
+            span_id = self._next_span_id
+            self._next_span_id += 1
+        return span_id
+
+    @contextmanager
+    def _span(self, evaluator: str, stage: str, items: int, queue_wait: float):
+        span = {
+            "evaluator": evaluator,
+            "stage": stage,
+            "items": items,
+            "queue_wait": queue_wait,
+            "span_id": self._new_span_id(),
+            "parent_span_id": self.context[1],
+            "thread_id": threading.get_ident(),
+            "start_ns": time.time_ns(),
+        }
+        wall_start = time.perf_counter()
+        # spans of worker threads run concurrently, they count CPU time of their thread.
+        # Process-wide CPU time (with children) is counted on the main thread
+        main = threading.current_thread() is threading.main_thread()
+        get_cpu_time = cpu_time if main else time.thread_time
+        cpu_start = get_cpu_time()
+        try:
+            yield span
+        finally:
+            span["wall_time"] = time.perf_counter() - wall_start
+            span["cpu_time"] = get_cpu_time() - cpu_start
+            self._add_span(span)
+
+    @contextmanager
+    def evaluator(self, name: str):
+        """
+        Attribute all the stages recorded within the context to the given evaluator
+        """
+        with self._span(name, "total", 0, 0.0) as span:
+            with self.bind((name, span["span_id"])):
+                yield span
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0, queue_wait: float = 0.0):
+        """
+        Record a stage of the current evaluator.
+        Yields a span dict, "items" can be updated within the context
+        """
+        with self._span(self.context[0], name, items, queue_wait) as span:
+            yield span
+
+    def summary(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        Get the aggregated statistics
+        Returns:
+            dict: evaluator -> stage -> {wall_time, cpu_time, items, calls, queue_wait}
+        """
+        with self._lock:
+            return {
+                evaluator: {
+                    stage: {
+                        k: round(v, 4) if isinstance(v, float) else v
+                        for k, v in record.items()
+                    }
+                    for stage, record in stages.items()
+                }
+                for evaluator, stages in self._summary.items()
+            }
+
+    def save_trace(self, path: str):
+        """
+        Save recorded spans. Files with ".jsonl" extension get one OpenTelemetry-style span
+        per line, otherwise a Chrome trace (chrome://tracing, perfetto) is written.
+        """
+        spans = [x for x in self._spans if x is not None]
+        if path.endswith(".jsonl"):
+            trace_id = os.urandom(16).hex()
+            with open(path, "w") as f:
+                for span in spans:
+                    otel_span = {
+                        "trace_id": trace_id,
+                        "span_id": f"{span['span_id']:016x}",
+                        "parent_span_id": (
+                            f"{span['parent_span_id']:016x}"
+                            if span["parent_span_id"]
+                            else None
+                        ),
+                        "name": f"{span['evaluator']}.{span['stage']}",
+                        "start_time_unix_nano": span["start_ns"],
+                        "end_time_unix_nano": span["start_ns"]
+                        + int(span["wall_time"] * 1e9),
+                        "attributes": {
+                            "evaluator": span["evaluator"],
+                            "stage": span["stage"],
+                            "items": span["items"],
+                            "cpu_time": span["cpu_time"],
+                            "queue_wait": span["queue_wait"],
+                        },
+                    }
+                    f.write(json.dumps(otel_span) + "\n")
+        else:
+            pid = os.getpid()
+            events = [
+                {
+                    "name": span["stage"],
+                    "cat": span["evaluator"],
+                    "ph": "X",
+                    "ts": span["start_ns"] / 1000,
+                    "dur": span["wall_time"] * 1e6,
+                    "pid": pid,
+                    "tid": span["thread_id"],
+                    "args": {
+                        "evaluator": span["evaluator"],
+                        "items": span["items"],
+                        "cpu_time": span["cpu_time"],
+                        "queue_wait": span["queue_wait"],
+                    },
+                }
+                for span in spans
+            ]
+            with open(path, "w") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# profiler of the current run, stages are not recorded if there is none
+_active: Optional[Profiler] = None
+
+
+@contextmanager
+def profile_run():
+    """
+    Activate a profiler for the run, so evaluators' stages are recorded
+    Yields:
+        Profiler: the active profiler
+    """
+    global _active
+    prev = _active
+    _active = Profiler()
+    try:
+        yield _active
+    finally:
+        _active = prev
+
+
+@contextmanager
+def evaluator(name: str):
+    """
+    Attribute stages within the context to the given evaluator, no-op if profiling is off
+    """
+    if _active is None:
+        yield {}
+    else:
+        with _active.evaluator(name) as span:
+            yield span
+
+
+def propagate(fn: Callable) -> Callable:
+    """
+    Wrap a function submitted to a worker thread, so the stages it records
+    are attributed to the evaluator of the submitting thread
+    """
+    if _active is None:
+        return fn
+    profiler, context = _active, _active.context
+
+    def run(*args, **kwargs):
+        with profiler.bind(context):
+            return fn(*args, **kwargs)
+
+    return run
+
+
+@contextmanager
+def stage(name: str, items: int = 0, queue_wait: float = 0.0):
+    """
+    Record a stage (see `STAGES`) of the current evaluator, no-op if profiling is off.
+    Yields a span dict, "items" can be updated within the context
+    """
+    if _active is None:
+        yield {"items": items}
+    else:
+        with _active.stage(name, items=items, queue_wait=queue_wait) as span:
+            yield span
+
+
+@contextmanager
+def hot_path_profiler(
+    cprofile_path: Optional[str] = None, torch_profile_path: Optional[str] = None
+):
+    """
+    Opt-in hot-path analysis of everything within the context.
+    Args:
+        cprofile_path (Optional[str]): where to dump cProfile stats (inspect with `pstats`/snakeviz)
+        torch_profile_path (Optional[str]): where to export torch.profiler chrome trace
+    """
+    profiler = None
+    if cprofile_path:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    torch_profiler = None
+    if torch_profile_path:
+        import torch
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        torch_profiler = torch.profiler.profile(
+            activities=activities, record_shapes=True
+        )
+        torch_profiler.__enter__()
+    try:
+        yield
+    finally:
+        if torch_profiler is not None:
+            torch_profiler.__exit__(None, None, None)
+            torch_profiler.export_chrome_trace(torch_profile_path)
+            logging.info(f"Saved torch profiler trace to {torch_profile_path}")
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+            logging.info(f"Saved cProfile stats to {cprofile_path}")
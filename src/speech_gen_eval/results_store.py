@@ -0,0 +1,337 @@
+"""
+Copyright 2025 Balacoon
+
+Results store - SQLite database of evaluation runs with per-utterance scores,
+for queries across runs and finding utterances which regressed between them
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+import yaml
+
+_schema = """
+CREATE TABLE IF NOT EXISTS systems (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    system_id INTEGER NOT NULL REFERENCES systems(id),
+    created REAL NOT NULL,
+    config TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    metric TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (run_id, metric)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    metric TEXT NOT NULL,
+    utterance TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (run_id, metric, utterance)
+);
+CREATE INDEX IF NOT EXISTS scores_utterance ON scores (utterance);
+CREATE INDEX IF NOT EXISTS scores_metric ON scores (metric);
+CREATE TABLE IF NOT EXISTS metric_directions (
+    metric TEXT PRIMARY KEY,
+    lower_is_better INTEGER NOT NULL
+);
+"""
+
+
+def utterance_scores(
+    utterance_stats: dict[str, dict[str, dict[str, float]]],
+) -> dict[str, dict[str, float]]:
+    """
+    Metrics of each of the utterances, computed from its statistics.
+    Metrics which are not per-utterance (i.e. EER) are skipped.
+    Args:
+        utterance_stats (dict[str, dict[str, dict[str, float]]]): evaluator name
+            -> utterance id -> statistics name -> value
+    Returns:
+        dict[str, dict[str, float]]: metric name -> utterance id -> value
+    """
+    from speech_gen_eval.bootstrap import row_metrics, stats_matrix
+
+    scores = {}
+    for eval_name, stats in utterance_stats.items():
+        if not stats:
+            continue
+        ids = list(stats)
+        keys = sorted({key for x in stats.values() for key in x})
+        rows = stats_matrix(stats, ids, keys)
+        for metric, values in row_metrics(eval_name, keys, rows).items():
+            scores[metric] = {
+                name: float(value)
+                for name, value in zip(ids, values)
+                if np.isfinite(value)
+            }
+    return scores
+
+
+class ResultsStore:
+    """
+    SQLite store of evaluation runs: runs of the systems, their corpus metrics
+    and per-utterance scores, indexed by utterance id and metric
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): sqlite file, created if it doesn't exist
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_schema)
+        self._conn.commit()
+
+    def add_run(
+        self,
+        system: str,
+        metrics: list[tuple[str, float]],
+        utterance_stats: dict[str, dict[str, dict[str, float]]],
+        config: Optional[dict] = None,
+    ) -> int:
+        """
+        Store a run
+        Args:
+            system (str): name of the evaluated system, i.e. model checkpoint
+            metrics (list[tuple[str, float]]): corpus metrics of the run
+            utterance_stats (dict[str, dict[str, dict[str, float]]]): evaluator name
+                -> utterance id -> statistics, per-utterance scores are computed from them
+            config (Optional[dict]): settings of the run
+        Returns:
+            int: id of the run
+        """
+        from speech_gen_eval.combined_evaluator import name2evaluator
+
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO systems (name) VALUES (?)", (system,)
+            )
+            (system_id,) = self._conn.execute(
+                "SELECT id FROM systems WHERE name = ?", (system,)
+            ).fetchone()
+            run_id = self._conn.execute(
+                "INSERT INTO runs (system_id, created, config) VALUES (?, ?, ?)",
+                (system_id, time.time(), json.dumps(config or {}, default=str)),
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO run_metrics (run_id, metric, value) VALUES (?, ?, ?)",
+                [(run_id, metric, float(value)) for metric, value in metrics],
+            )
+            self._conn.executemany(
+                "INSERT INTO scores (run_id, metric, utterance, value) VALUES (?, ?, ?, ?)",
+                [
+                    (run_id, metric, name, value)
+                    for metric, values in utterance_scores(utterance_stats).items()
+                    for name, value in values.items()
+                ],
+            )
+            lower = {
+                metric
+                for name in utterance_stats
+                for metric in name2evaluator[name].lower_is_better
+            }
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metric_directions VALUES (?, ?)",
+                [(metric, int(metric in lower)) for metric, _ in metrics],
+            )
+        return run_id
+
+    def resolve_run(self, run: str) -> int:
+        """
+        Get id of a run: the id itself, or the name of a system for its latest run
+        """
+        if run.isdigit():
+            row = self._conn.execute("SELECT id FROM runs WHERE id = ?", (int(run),))
+        else:
+            row = self._conn.execute(
+                "SELECT runs.id FROM runs JOIN systems ON systems.id = runs.system_id "
+                "WHERE systems.name = ? ORDER BY runs.id DESC LIMIT 1",
+                (run,),
+            )
+        row = row.fetchone()
+        if row is None:
+            raise ValueError(f"No run {run} in the results store")
+        return row[0]
+
+    def _run_metrics(self, run_id: int) -> dict[str, float]:
+        return dict(
+            self._conn.execute(
+                "SELECT metric, value FROM run_metrics WHERE run_id = ?", (run_id,)
+            )
+        )
+
+    def _metrics(self, run_ids: list[int], metric: Optional[str]) -> list[str]:
+        """
+        Metrics with per-utterance scores in all the runs, or the given one
+        """
+        metrics = None
+        for run_id in run_ids:
+            names = {
+                x
+                for (x,) in self._conn.execute(
+                    "SELECT DISTINCT metric FROM scores WHERE run_id = ?", (run_id,)
+                )
+            }
+            metrics = names if metrics is None else metrics & names
+        if metric is not None:
+            if metric not in metrics:
+                raise ValueError(f"{metric} is not scored in runs {run_ids}")
+            return [metric]
+        return sorted(metrics)
+
+    def _worse_sign(self, metric: str) -> int:
+        """
+        1 if higher values of the metric are worse, -1 otherwise
+        """
+        row = self._conn.execute(
+            "SELECT lower_is_better FROM metric_directions WHERE metric = ?", (metric,)
+        ).fetchone()
+        return 1 if row and row[0] else -1
+
+    def compare(
+        self, run_a: int, run_b: int, metric: Optional[str] = None, top: int = 10
+    ) -> dict[str, dict]:
+        """
+        Compare two runs on the utterances both of them have scored
+        Args:
+            run_a (int): id of the baseline run
+            run_b (int): id of the new run
+            metric (Optional[str]): metric to compare, all the common ones if None
+            top (int): number of the most regressed utterances to report
+        Returns:
+            dict[str, dict]: metric name -> corpus metrics of both runs, their delta
+                (new minus baseline) and the utterances which regressed most
+        """
+        metrics_a, metrics_b = self._run_metrics(run_a), self._run_metrics(run_b)
+        comparison = {}
+        for name in self._metrics([run_a, run_b], metric):
+            sign = self._worse_sign(name)
+            rows = self._conn.execute(
+                "SELECT a.utterance, a.value, b.value FROM scores a JOIN scores b "
+                "ON b.run_id = ? AND b.metric = a.metric AND b.utterance = a.utterance "
+                "WHERE a.run_id = ? AND a.metric = ? "
+                "ORDER BY (b.value - a.value) * ? DESC LIMIT ?",
+                (run_b, run_a, name, sign, top),
+            )
+            comparison[name] = {
+                "baseline": metrics_a.get(name),
+                "new": metrics_b.get(name),
+                "delta": (
+                    metrics_b[name] - metrics_a[name]
+                    if name in metrics_a and name in metrics_b
+                    else None
+                ),
+                "regressed": [
+                    {"utterance": x, "baseline": a, "new": b, "delta": b - a}
+                    for x, a, b in rows
+                    if (b - a) * sign > 0
+                ],
+            }
+        return comparison
+
+    def worst(
+        self, run: int, metric: Optional[str] = None, top: int = 10
+    ) -> dict[str, list[dict]]:
+        """
+        Find the worst scored utterances of a run
+        Args:
+            run (int): id of the run
+            metric (Optional[str]): metric to look at, all the scored ones if None
+            top (int): number of the utterances to report
+        Returns:
+            dict[str, list[dict]]: metric name -> the worst utterances with their scores
+        """
+        worst = {}
+        for name in self._metrics([run], metric):
+            rows = self._conn.execute(
+                "SELECT utterance, value FROM scores WHERE run_id = ? AND metric = ? "
+                "ORDER BY value * ? DESC LIMIT ?",
+                (run, name, self._worse_sign(name), top),
+            )
+            worst[name] = [{"utterance": x, "value": value} for x, value in rows]
+        return worst
+
+    def close(self):
+        self._conn.close()
+
+
+def _parse_args(prog: str, description: str, argv: Optional[list[str]]):
+    ap = argparse.ArgumentParser(
+        prog=f"speech-gen-eval {prog}", description=description
+    )
+    ap.add_argument("--db", required=True, help="Results store, see --results-db")
+    if prog == "compare":
+        ap.add_argument(
+            "baseline", help="Baseline run: run id or system name (latest run)"
+        )
+        ap.add_argument("new", help="New run: run id or system name (latest run)")
+    elif prog == "worst":
+        ap.add_argument("run", help="Run id or system name (latest run)")
+    ap.add_argument(
+        "--metric", help="Metric to look at, all the scored ones by default"
+    )
+    ap.add_argument(
+        "--top", type=int, default=10, help="Number of utterances to report"
+    )
+    ap.add_argument(
+        "--out", help="Save the report to this yaml file instead of printing"
+    )
+    return ap.parse_args(argv)
+
+
+def _report(report: dict, out_path: Optional[str]):
+    if out_path:
+        with open(out_path, "w") as f:
+            yaml.dump(report, f, default_flow_style=False, sort_keys=False)
+    else:
+        yaml.dump(report, sys.stdout, default_flow_style=False, sort_keys=False)
+
+
+def compare_main(argv: Optional[list[str]] = None):
+    """
+    Entry point of the `compare` command
+    """
+    args = _parse_args(
+        "compare",
+        "Compares two runs of the results store, "
+        "reporting the utterances which regressed most",
+        argv,
+    )
+    store = ResultsStore(args.db)
+    try:
+        run_a, run_b = store.resolve_run(args.baseline), store.resolve_run(args.new)
+        logging.info(f"Comparing run {run_b} to the baseline run {run_a}")
+        report = store.compare(run_a, run_b, metric=args.metric, top=args.top)
+    finally:
+        store.close()
+    _report(report, args.out)
+
+
+def worst_main(argv: Optional[list[str]] = None):
+    """
+    Entry point of the `worst` command
+    """
+    args = _parse_args("worst", "Reports the worst scored utterances of a run", argv)
+    store = ResultsStore(args.db)
+    try:
+        report = store.worst(
+            store.resolve_run(args.run), metric=args.metric, top=args.top
+        )
+    finally:
+        store.close()
+    _report(report, args.out)
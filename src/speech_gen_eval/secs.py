@@ -7,14 +7,105 @@ Evaluate similarity between reference and generated audio using ECAPA/ECAPA2/ReD
 import logging
 
 import numpy as np
-import soundfile as sf
 import torch
-import torchaudio
-import tqdm
-from huggingface_hub import hf_hub_download
 
-from speech_gen_eval import evaluator
-from speech_gen_eval.audio_dir import get_audio_path
+from speech_gen_eval import (
+    evaluator,
+    model_store,
+    monitoring,
+    onnx_backend,
+    profiling,
+)
+from speech_gen_eval.audio_dir import audio_hash, get_audio_item, load_audio
+
+# cosine similarity histogram bins over [-1, 1], for the EER
+_num_bins = 1000
+# number of generated x reference scores computed at once
+_block_elements = 1 << 24
+
+
+def pair_similarity(
+    gen: np.ndarray, ref: np.ndarray, gen_ref: np.ndarray
+) -> np.ndarray:
+    """
+    Cosine similarity of each generated embedding to its reference
+    Args:
+        gen (np.ndarray): normalized generated embeddings, [N, D]
+        ref (np.ndarray): normalized reference embeddings, [R, D]
+        gen_ref (np.ndarray): index of the reference of each generated embedding, [N]
+    Returns:
+        np.ndarray: similarities, [N]
+    """
+    return np.einsum("nd,nd->n", gen, ref[gen_ref])
+
+
+def speaker_centroids(
+    ref: np.ndarray, ref_speaker: np.ndarray, num_speakers: int
+) -> np.ndarray:
+    """
+    Normalized mean embedding of each speaker over its references
+    Args:
+        ref (np.ndarray): normalized reference embeddings, [R, D]
+        ref_speaker (np.ndarray): speaker index of each reference, [R]
+        num_speakers (int): number of speakers
+    Returns:
+        np.ndarray: speaker centroids, [S, D]
+    """
+    centroids = np.zeros((num_speakers, ref.shape[1]), dtype=ref.dtype)
+    np.add.at(centroids, ref_speaker, ref)
+    return centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+
+def similarity_matrix_stats(
+    gen: np.ndarray,
+    ref: np.ndarray,
+    gen_speaker: np.ndarray,
+    ref_speaker: np.ndarray,
+    block_elements: int = _block_elements,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compare every generated embedding to every reference, block of generated rows at a time,
+    so memory doesn't depend on the number of generated utterances
+    Args:
+        gen (np.ndarray): normalized generated embeddings, [N, D]
+        ref (np.ndarray): normalized reference embeddings, [R, D]
+        gen_speaker (np.ndarray): speaker index of each generated embedding, [N]
+        ref_speaker (np.ndarray): speaker index of each reference, [R]
+        block_elements (int): max number of scores computed at once
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: whether the nearest reference is
+            of the same speaker, [N]; histograms of same-speaker (target)
+            and other-speaker (non-target) scores, [_num_bins] each
+    """
+    nearest_correct = np.zeros(len(gen))
+    target_hist = np.zeros(_num_bins)
+    nontarget_hist = np.zeros(_num_bins)
+    block_size = max(1, block_elements // len(ref))
+    for start in range(0, len(gen), block_size):
+        end = min(start + block_size, len(gen))
+        scores = gen[start:end] @ ref.T
+        is_target = gen_speaker[start:end, None] == ref_speaker[None, :]
+        nearest = ref_speaker[np.argmax(scores, axis=1)]
+        nearest_correct[start:end] = nearest == gen_speaker[start:end]
+        bins = np.clip(
+            ((scores + 1) / 2 * _num_bins).astype(np.int64), 0, _num_bins - 1
+        )
+        target_hist += np.bincount(bins[is_target], minlength=_num_bins)
+        nontarget_hist += np.bincount(bins[~is_target], minlength=_num_bins)
+    return nearest_correct, target_hist, nontarget_hist
+
+
+def eer_from_histograms(target_hist: np.ndarray, nontarget_hist: np.ndarray) -> float:
+    """
+    Equal error rate from histograms of target and non-target scores
+    """
+    # rates when accepting scores from each of the bin edges upwards
+    frr = np.concatenate([[0.0], np.cumsum(target_hist)]) / np.sum(target_hist)
+    far = 1.0 - np.concatenate([[0.0], np.cumsum(nontarget_hist)]) / np.sum(
+        nontarget_hist
+    )
+    i = np.argmin(np.abs(far - frr))
+    return float((far[i] + frr[i]) / 2)
 
 
 class ECAPASECSEvaluator(evaluator.Evaluator):
@@ -23,6 +114,11 @@ class ECAPASECSEvaluator(evaluator.Evaluator):
     """
 
     _model_name = "ecapa"
+    lower_is_better = ("ecapa_eer",)
+    inputs = ("generated", "reference")
+    features = ("speaker_embedding",)
+    rtf = 0.02
+    supported_backends = ("torch", "onnx")
 
     def __init__(
         self,
@@ -31,9 +127,28 @@ class ECAPASECSEvaluator(evaluator.Evaluator):
         original_audio: str,
         mapping: dict[str, str] | None = None,
         ignore_errors: bool = True,
+        speakers: dict[str, str] | None = None,
+        secs_modes: list[str] | None = None,
+        dedup: bool = False,
         **kwargs,
     ):
+        """
+        Args:
+            speakers (dict[str, str] | None): reference id -> speaker,
+                each reference is a speaker of its own if not provided
+            secs_modes (list[str] | None): additional modes: "centroid" compares to
+                the centroid of the speaker's references, "matrix" compares every
+                generated utterance to every reference (EER, nearest speaker accuracy)
+            dedup (bool): embed audio with the same content once,
+                otherwise the audio is not hashed and each utterance is embedded
+        """
         self._ids = ids
+        self._dedup = dedup
+        # embeddings by content of the audio, identical audio is embedded once
+        self._content_embeddings: dict[str, np.ndarray] = {}
+        self._speakers = speakers or {}
+        self._modes = secs_modes or []
+        self._score_hists = None
         if mapping is None:
             # compare to itself if mapping is not provided.
             mapping = {x: x for x, _ in self._ids}
@@ -47,80 +162,194 @@ class ECAPASECSEvaluator(evaluator.Evaluator):
         self._ignore_errors = ignore_errors
         self._device = "cuda:0" if torch.cuda.is_available() else "cpu"
 
+    @classmethod
+    def cache_settings(cls, secs_modes: list[str] | None = None, **kwargs):
+        """
+        Centroids and the similarity matrix depend on all the utterances,
+        so statistics are cached only without additional modes
+        """
+        return None if secs_modes else {}
+
     def _load_model(self):
         if self._device == "cpu":
-            logging.warning("ECAPA model is not available on CPU")
+            logging.warning("ECAPA model is not available on CPU, use onnx backend")
             return None
-        model_file = hf_hub_download(
-            repo_id="balacoon/ecapa", filename="ecapa.jit", cache_dir=None
-        )
+        model_file = model_store.get_model_path("ecapa")
         model = torch.jit.load(model_file).to(torch.device(self._device))
         return model
 
     def get_info(self):
         return f"Similarity evaluation with {self._model_name}"
 
-    def _extract_embedding(self, model, path: str) -> np.ndarray:
-        wav, sr = sf.read(path, dtype="int16")
-        assert sr == 16000
+    def _extract_embedding(self, model, audio) -> np.ndarray:
+        with profiling.stage("decode", items=1):
+            wav = load_audio(audio, dtype="int16")
         # run inference
-        x = torch.tensor(wav).unsqueeze(0).cuda()
-        x_len = torch.tensor([x.shape[1]], device=x.device)
-        emb = model(x, x_len)
-        emb = torch.nn.functional.normalize(emb, p=2, dim=1).cpu().detach()
+        with profiling.stage("inference", items=1):
+            x = torch.tensor(wav).unsqueeze(0).to(self._device)
+            x_len = torch.tensor([x.shape[1]], device=x.device)
+            emb = model(x, x_len)
+            emb = torch.nn.functional.normalize(emb, p=2, dim=1).cpu().detach()
         return emb
 
-    def get_metric(self):
+    def _embedding(self, model, audio) -> np.ndarray:
+        return self._extract_embedding(model, audio).float().numpy().reshape(-1)
+
+    def get_utterance_stats(self):
         """
-        Get the metric for the evaluator
+        Get the similarity sum and count for each of the utterances
         Returns:
-            list[tuple[str, float]]: A list of tuples, where each tuple contains a metric name and a value
+            dict[str, dict[str, float]]: utterance id -> statistics name -> value
         """
-        model = self._load_model()
+        with profiling.stage("model_load"):
+            if self.backend == "onnx":
+                # runs on CPU, inputs are moved there by the onnx model
+                model = self._get_model(
+                    f"{self._model_name}:onnx",
+                    lambda: onnx_backend.load_onnx_model(self._model_name),
+                )
+            else:
+                model = self._get_model(
+                    f"{self._model_name}:{self._device}", self._load_model
+                )
         if model is None:
             logging.warning("ECAPA model is not available, SECS is not measured")
-            return []
+            return {}
         # first extract the embeddings for reference audio
-        ref_embeddings: dict[str, torch.Tensor] = {}
-        for name, _ in tqdm.tqdm(self._ids):
-            ref_name = self._mapping[name]
-            if ref_name in ref_embeddings:
+        ref_names = sorted({self._mapping[name] for name, _ in self._ids})
+        # references are a part of the work on top of the evaluated utterances
+        monitoring.expect(len(ref_names))
+        ref_embeddings = self._extract_embeddings(
+            model, ref_names, self._original, "reference"
+        )
+
+        # now extract embeddings for generated audio, which has a reference
+        names = []
+        for name, _ in self._ids:
+            if self._mapping[name] in ref_embeddings:
+                names.append(name)
                 continue
-            ref_path = get_audio_path(self._original, ref_name)
-            try:
-                ref_embeddings[ref_name] = self._extract_embedding(model, ref_path)
-            except Exception as e:
-                logging.error(
-                    f"Error exgracting reference spkr embedding for {ref_name}: {ref_path}"
+            msg = f"Reference spkr embedding for {self._mapping[name]} not found"
+            if not self._ignore_errors:
+                raise ValueError(msg)
+            logging.error(msg)
+        gen_embeddings = self._extract_embeddings(
+            model, names, self._generated, "generated"
+        )
+        if not gen_embeddings:
+            return {}
+
+        # compare all the embeddings at once
+        with profiling.stage("aggregation", items=len(gen_embeddings)):
+            names = list(gen_embeddings)
+            ref_names = list(ref_embeddings)
+            gen = np.stack([gen_embeddings[x] for x in names])
+            ref = np.stack([ref_embeddings[x] for x in ref_names])
+            ref_index = {x: i for i, x in enumerate(ref_names)}
+            gen_ref = np.array([ref_index[self._mapping[x]] for x in names])
+            # speaker of each reference, each reference is a speaker of its own by default
+            speaker_names = sorted({self._speakers.get(x, x) for x in ref_names})
+            speaker_index = {x: i for i, x in enumerate(speaker_names)}
+            ref_speaker = np.array(
+                [speaker_index[self._speakers.get(x, x)] for x in ref_names]
+            )
+
+            stats = {"secs_sum": pair_similarity(gen, ref, gen_ref)}
+            stats["count"] = np.ones(len(names))
+            if "centroid" in self._modes:
+                centroids = speaker_centroids(ref, ref_speaker, len(speaker_names))
+                stats["centroid_secs_sum"] = pair_similarity(
+                    gen, centroids, ref_speaker[gen_ref]
                 )
-                if not self._ignore_errors:
-                    raise e
+            if "matrix" in self._modes:
+                nearest_correct, target_hist, nontarget_hist = similarity_matrix_stats(
+                    gen, ref, ref_speaker[gen_ref], ref_speaker
+                )
+                stats["nearest_correct"] = nearest_correct
+                # score distributions are not per-utterance, they are added to summed stats
+                self._score_hists = {"target": target_hist, "nontarget": nontarget_hist}
 
-        # now extract embeddings for generated audio and compare to reference
-        secs_lst = []
-        for name, _ in tqdm.tqdm(self._ids):
-            ref_name = self._mapping[name]
-            path = get_audio_path(self._generated, name)
+        return {
+            name: {key: float(values[i]) for key, values in stats.items()}
+            for i, name in enumerate(names)
+        }
+
+    def _extract_embeddings(
+        self, model, names: list[str], directory, desc: str
+    ) -> dict[str, np.ndarray]:
+        """
+        Extract normalized speaker embeddings of the utterances, skipping failed ones.
+        With dedup, audio with the same content as of an already embedded utterance
+        reuses its embedding
+        """
+        embeddings = {}
+        for name in monitoring.progress(names):
+            audio = get_audio_item(directory, name)
             try:
-                gen_emb = self._extract_embedding(model, path)
+                if self._dedup:
+                    key = audio_hash(audio)
+                    if key not in self._content_embeddings:
+                        self._content_embeddings[key] = self._embedding(model, audio)
+                    embeddings[name] = self._content_embeddings[key]
+                else:
+                    embeddings[name] = self._embedding(model, audio)
             except Exception as e:
                 if not self._ignore_errors:
                     raise e
-                logging.error(
-                    f"Error exgracting generated spkr embedding for {name}: {path}"
-                )
-                continue
-            ref_emb = ref_embeddings.get(ref_name, None)
-            if ref_emb is None:
-                msg = f"Reference spkr embedding for {ref_name} not found"
-                if not self._ignore_errors:
-                    raise ValueError(msg)
-                logging.error(msg)
-                continue
-            secs = torch.nn.functional.cosine_similarity(ref_emb, gen_emb).item()
-            secs_lst.append(secs)
+                monitoring.advance(0, failed=1)
+                logging.error(f"Error exgracting {desc} spkr embedding for {name}")
+        return embeddings
 
-        return [(f"{self._model_name}_secs", float(np.mean(secs_lst)))]
+    def get_stats(self):
+        """
+        Sum the per-utterance statistics and add the distributions
+        of target and non-target scores (as sparse histograms) of the "matrix" mode
+        """
+        self._score_hists = None
+        stats = super().get_stats()
+        if self._score_hists is not None:
+            for kind, hist in self._score_hists.items():
+                for i in np.flatnonzero(hist):
+                    stats[f"{kind}_hist_{i:04d}"] = float(hist[i])
+        return stats
+
+    @classmethod
+    def metrics_from_stats(cls, stats):
+        """
+        Get the mean similarity from the summed statistics, for the "centroid" mode
+        also mean similarity to speaker centroids, for the "matrix" mode
+        speaker verification EER and nearest speaker accuracy
+        """
+        metrics = [(f"{cls._model_name}_secs", stats["secs_sum"] / stats["count"])]
+        if "centroid_secs_sum" in stats:
+            metrics.append(
+                (
+                    f"{cls._model_name}_centroid_secs",
+                    stats["centroid_secs_sum"] / stats["count"],
+                )
+            )
+        if "nearest_correct" in stats:
+            metrics.append(
+                (
+                    f"{cls._model_name}_nearest_speaker_acc",
+                    stats["nearest_correct"] / stats["count"],
+                )
+            )
+        target_hist = np.zeros(_num_bins)
+        nontarget_hist = np.zeros(_num_bins)
+        for key, value in stats.items():
+            if key.startswith("target_hist_"):
+                target_hist[int(key[len("target_hist_") :])] = value
+            elif key.startswith("nontarget_hist_"):
+                nontarget_hist[int(key[len("nontarget_hist_") :])] = value
+        if target_hist.sum() > 0 and nontarget_hist.sum() > 0:
+            metrics.append(
+                (
+                    f"{cls._model_name}_eer",
+                    eer_from_histograms(target_hist, nontarget_hist),
+                )
+            )
+        return metrics
 
 
 class ECAPA2SECSEvaluator(ECAPASECSEvaluator):
@@ -129,21 +358,23 @@ class ECAPA2SECSEvaluator(ECAPASECSEvaluator):
     """
 
     _model_name = "ecapa2"
+    lower_is_better = ("ecapa2_eer",)
+    rtf = 0.05
 
     def _load_model(self):
-        model_file = hf_hub_download(
-            repo_id="Jenthe/ECAPA2", filename="ecapa2.pt", cache_dir=None
-        )
+        model_file = model_store.get_model_path("ecapa2")
         model = torch.jit.load(model_file, map_location=self._device)
         if self._device == "cuda:0":
             model.half()
         return model
 
-    def _extract_embedding(self, model, path: str) -> np.ndarray:
-        arr, _ = torchaudio.load(path)
-        arr = arr.to(torch.device(self._device))
-        emb = model(arr)
-        emb = torch.nn.functional.normalize(emb, p=2, dim=1)
+    def _extract_embedding(self, model, audio) -> np.ndarray:
+        with profiling.stage("decode", items=1):
+            wav = load_audio(audio, dtype="float32")
+        with profiling.stage("inference", items=1):
+            arr = torch.from_numpy(wav).unsqueeze(0).to(torch.device(self._device))
+            emb = model(arr)
+            emb = torch.nn.functional.normalize(emb, p=2, dim=1)
         return emb.cpu().detach()
 
 
@@ -153,25 +384,21 @@ class ReDimNetSECSEvaluator(ECAPASECSEvaluator):
     """
 
     _model_name = "redimnet"
+    lower_is_better = ("redimnet_eer",)
+    rtf = 0.05
 
     def _load_model(self):
-        model = torch.hub.load(
-            "IDRnD/ReDimNet",
-            "ReDimNet",
-            model_name="b6",
-            train_type="ft_lm",
-            dataset="vox2",
-        )
-        if self._device == "cuda:0":
-            model.cuda()
+        # pre-serialized in the store, so loading doesn't go to github
+        model = model_store.load_torch_hub_model("redimnet", self._device)
         model.eval()
         return model
 
-    def _extract_embedding(self, model, path: str) -> np.ndarray:
-        wav, sr = sf.read(path, dtype="float32")
-        assert sr == 16000
-        arr = torch.tensor(wav).unsqueeze(0)
-        arr = arr.to(torch.device(self._device))
-        emb = model(arr)
-        emb = torch.nn.functional.normalize(emb, p=2, dim=1)
+    def _extract_embedding(self, model, audio) -> np.ndarray:
+        with profiling.stage("decode", items=1):
+            wav = load_audio(audio, dtype="float32")
+        with profiling.stage("inference", items=1):
+            arr = torch.tensor(wav).unsqueeze(0)
+            arr = arr.to(torch.device(self._device))
+            emb = model(arr)
+            emb = torch.nn.functional.normalize(emb, p=2, dim=1)
         return emb.cpu().detach()
@@ -0,0 +1,106 @@
+"""
+Copyright 2025 Balacoon
+
+Session - in-memory evaluation API, models stay loaded between evaluations
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from speech_gen_eval import profiling
+from speech_gen_eval.audio_dir import prepare_waveform
+from speech_gen_eval.combined_evaluator import CombinedEvaluator, name2evaluator
+
+
+class EvaluationSession:
+    """
+    Evaluates waveforms held in memory, i.e. from a training loop or a serving stack.
+    Nothing is written to disk, models are loaded on the first evaluation
+    and reused by the following ones.
+
+    Example:
+        session = EvaluationSession(["utmos", "cer"])
+        metrics = session.evaluate({"utt1": wav}, 24000, texts={"utt1": "hello"})
+    """
+
+    def __init__(
+        self,
+        evaluators: list[str],
+        ignore_errors: bool = True,
+        backends: Optional[dict[str, str]] = None,
+        precisions: Optional[dict[str, str]] = None,
+        asr_decoding: Optional[dict] = None,
+    ):
+        """
+        Args:
+            evaluators (list[str]): Names of the evaluators to run
+            ignore_errors (bool): Whether to skip utterances evaluators fail on
+            backends (Optional[dict[str, str]]): Execution backend per evaluator,
+                i.e. {"utmos": "onnx"}
+            precisions (Optional[dict[str, str]]): CPU inference precision per evaluator,
+                i.e. {"cer": "int8"}
+            asr_decoding (Optional[dict]): ASR decoding options: forced "language"
+                and "task", "bounded" for greedy decoding with capped new tokens
+        """
+        unknown = [x for x in evaluators if x not in name2evaluator]
+        if unknown:
+            raise ValueError(f"Unknown evaluators: {unknown}")
+        self._evaluators = evaluators
+        self._ignore_errors = ignore_errors
+        self._backends = backends
+        self._precisions = precisions
+        self._asr_decoding = asr_decoding
+        self._models: dict = {}
+
+    def evaluate(
+        self,
+        generated: dict[str, np.ndarray],
+        sample_rate: int,
+        texts: Optional[dict[str, str]] = None,
+        references: Optional[dict[str, np.ndarray]] = None,
+        mapping: Optional[dict[str, str]] = None,
+        normalize: bool = True,
+    ) -> list[tuple[str, float]]:
+        """
+        Evaluate a batch of generated utterances
+        Args:
+            generated (dict[str, np.ndarray]): id -> mono float waveform
+            sample_rate (int): sample rate of the generated and reference waveforms
+            texts (Optional[dict[str, str]]): id -> text, required for "cer"
+            references (Optional[dict[str, np.ndarray]]): reference id -> waveform,
+                required for evaluators comparing to original audio
+            mapping (Optional[dict[str, str]]): generated id -> reference id,
+                ids match if not provided
+            normalize (bool): whether to apply loudness normalization, as the CLI does
+        Returns:
+            list[tuple[str, float]]: A list of tuples, where each tuple contains a metric name and a value
+        """
+        if "cer" in self._evaluators and texts is None:
+            raise ValueError("texts are required for intelligibility evaluation")
+        texts = texts or {}
+        ids = [(name, texts.get(name, "")) for name in generated]
+        with profiling.stage("decode", items=len(generated)):
+            generated_16khz = {
+                name: prepare_waveform(wav, sample_rate, normalize=normalize)
+                for name, wav in generated.items()
+            }
+            references_16khz = None
+            if references is not None:
+                references_16khz = {
+                    name: prepare_waveform(wav, sample_rate, normalize=normalize)
+                    for name, wav in references.items()
+                }
+        evaluator = CombinedEvaluator(
+            self._evaluators,
+            ids=ids,
+            generated_audio=generated_16khz,
+            original_audio=references_16khz,
+            mapping=mapping,
+            ignore_errors=self._ignore_errors,
+            model_cache=self._models,
+            backends=self._backends,
+            precisions=self._precisions,
+            asr_decoding=self._asr_decoding,
+        )
+        return evaluator.get_metric()
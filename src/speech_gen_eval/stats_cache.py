@@ -0,0 +1,133 @@
+"""
+Copyright 2025 Balacoon
+
+Stats cache - per-utterance sufficient statistics keyed by content of the audio,
+evaluator version and settings, for incremental re-evaluation of changed utterances
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Optional
+
+from speech_gen_eval.combined_evaluator import name2evaluator
+
+
+def evaluator_settings(
+    eval_name: str, backend: str, precision: str, **kwargs
+) -> Optional[dict]:
+    """
+    Settings the per-utterance statistics of the evaluator depend on,
+    None if they can't be cached (see `Evaluator.cache_settings`)
+    """
+    evaluator_cls = name2evaluator[eval_name]
+    settings = evaluator_cls.cache_settings(**kwargs)
+    if settings is None:
+        return None
+    return {
+        "evaluator": eval_name,
+        "version": evaluator_cls.version,
+        "backend": backend,
+        "precision": precision,
+        **settings,
+    }
+
+
+def utterance_keys(
+    eval_name: str,
+    settings: dict,
+    ids: list[tuple[str, str]],
+    generated_hashes: dict[str, str],
+    original_hashes: dict[str, str],
+    mapping: Optional[dict[str, str]] = None,
+) -> dict[str, str]:
+    """
+    Keys the per-utterance statistics of the evaluator are cached with:
+    hash of the audio the evaluator reads, its text if the evaluator uses it,
+    and the evaluator settings
+    Args:
+        eval_name (str): name of the evaluator
+        settings (dict): evaluator settings, see `evaluator_settings`
+        ids (list[tuple[str, str]]): ids and texts of the utterances
+        generated_hashes (dict[str, str]): generated id -> hash of the audio
+        original_hashes (dict[str, str]): original id -> hash of the audio
+        mapping (Optional[dict[str, str]]): generated id -> reference id
+    Returns:
+        dict[str, str]: utterance id -> key. Utterances with missing audio are skipped
+    """
+    evaluator_cls = name2evaluator[eval_name]
+    keys = {}
+    for name, text in ids:
+        hashes = {"generated": generated_hashes.get(name)}
+        if "original" in evaluator_cls.inputs:
+            hashes["original"] = original_hashes.get(name)
+        if "reference" in evaluator_cls.inputs:
+            reference = mapping.get(name) if mapping else name
+            hashes["reference"] = original_hashes.get(reference)
+        if None in hashes.values():
+            continue
+        key = {"settings": settings, "audio": hashes}
+        if evaluator_cls.uses_text:
+            key["text"] = text
+        keys[name] = hashlib.sha256(
+            json.dumps(key, sort_keys=True).encode()
+        ).hexdigest()
+    return keys
+
+
+class StatsCache:
+    """
+    SQLite store of per-utterance statistics. Safe to share between processes,
+    i.e. shards evaluated in parallel.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): sqlite file, created if it doesn't exist
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, stats TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, keys: list[str]) -> dict[str, dict[str, float]]:
+        """
+        Get cached statistics
+        Args:
+            keys (list[str]): keys to look up, see `utterance_keys`
+        Returns:
+            dict[str, dict[str, float]]: key -> statistics, for the keys found in the cache
+        """
+        found = {}
+        # sqlite limits the number of query parameters
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            rows = self._conn.execute(
+                f"SELECT key, stats FROM stats WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            found.update((key, json.loads(stats)) for key, stats in rows)
+        return found
+
+    def put(self, stats: dict[str, dict[str, float]]):
+        """
+        Store statistics
+        Args:
+            stats (dict[str, dict[str, float]]): key -> statistics
+        """
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO stats (key, stats) VALUES (?, ?)",
+            [
+                (key, json.dumps({name: float(v) for name, v in x.items()}))
+                for key, x in stats.items()
+            ],
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,113 @@
+"""
+Copyright 2025 Balacoon
+
+Threads - single CPU budget for process pools, torch, BLAS and ffmpeg threads
+"""
+
+import logging
+import math
+import os
+import sys
+from typing import Optional
+
+# thread pools of native libraries, read when the library is loaded
+_thread_env_vars = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+]
+
+# budget of the run, detected from the machine if not set
+_cpus: Optional[int] = None
+
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    """
+    CPU limit of the container from cgroup v2 or v1 quota, None if unlimited
+    """
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus() -> int:
+    """
+    Number of CPUs the process can actually use: CPU affinity and cgroup quota are honored
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
+
+
+def set_cpus(cpus: Optional[int] = None):
+    """
+    Set the CPU budget of the run. Has to be called before torch is imported,
+    so it picks up the thread count from the environment.
+    Args:
+        cpus (Optional[int]): number of CPUs to use, all the available ones if None
+    """
+    global _cpus
+    _cpus = cpus or available_cpus()
+    logging.info(f"Using {_cpus} CPUs")
+    for var in _thread_env_vars:
+        os.environ[var] = str(_cpus)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(_cpus)
+
+
+def get_cpus() -> int:
+    """
+    Get the CPU budget of the run
+    """
+    return _cpus or available_cpus()
+
+
+def pool_size(num_items: Optional[int] = None) -> int:
+    """
+    Number of pool workers: one single-threaded worker per CPU of the budget,
+    but no more than there are items to process
+    """
+    size = get_cpus()
+    if num_items is not None:
+        size = min(size, num_items)
+    return max(1, size)
+
+
+def init_worker():
+    """
+    Initializer of pool workers: parallelism comes from the pool,
+    so native libraries in each of the workers are limited to a single thread
+    """
+    for var in _thread_env_vars:
+        os.environ[var] = "1"
+    try:
+        # limits BLAS/OpenMP pools already loaded, i.e. inherited by a forked worker
+        from threadpoolctl import threadpool_limits
+
+        threadpool_limits(1)
+    except ImportError:
+        pass
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(1)
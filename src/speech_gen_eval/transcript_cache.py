@@ -0,0 +1,88 @@
+"""
+Copyright 2025 Balacoon
+
+Transcript cache - persistent ASR hypotheses keyed by audio content and decoding config,
+so reruns only transcribe new or changed audio
+"""
+
+import json
+import os
+import sqlite3
+
+
+def default_path() -> str:
+    """
+    Get the default location of the cache, `SPEECH_GEN_EVAL_TRANSCRIPTS` environment variable
+    overrides it
+    """
+    return os.environ.get(
+        "SPEECH_GEN_EVAL_TRANSCRIPTS",
+        os.path.expanduser("~/.cache/speech_gen_eval/transcripts.sqlite"),
+    )
+
+
+def config_key(model_id: str, **decoding) -> str:
+    """
+    Key of the model and decoding parameters, transcripts are reused only if all of them match
+    """
+    return json.dumps({"model": model_id, **decoding}, sort_keys=True)
+
+
+class TranscriptCache:
+    """
+    SQLite store of transcripts. Safe to share between processes, i.e. shards
+    evaluated in parallel.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): sqlite file, created if it doesn't exist
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts ("
+            "audio_hash TEXT NOT NULL, config TEXT NOT NULL, text TEXT NOT NULL, "
+            "PRIMARY KEY (audio_hash, config))"
+        )
+        self._conn.commit()
+
+    def get(self, hashes: list[str], config: str) -> dict[str, str]:
+        """
+        Get cached transcripts
+        Args:
+            hashes (list[str]): audio hashes to look up
+            config (str): key of the decoding config, see `config_key`
+        Returns:
+            dict[str, str]: audio hash -> transcript, for the hashes found in the cache
+        """
+        found = {}
+        # sqlite limits the number of query parameters
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i : i + 500]
+            rows = self._conn.execute(
+                "SELECT audio_hash, text FROM transcripts WHERE config = ? "
+                f"AND audio_hash IN ({','.join('?' * len(chunk))})",
+                [config, *chunk],
+            )
+            found.update(rows)
+        return found
+
+    def put(self, transcripts: dict[str, str], config: str):
+        """
+        Store transcripts
+        Args:
+            transcripts (dict[str, str]): audio hash -> transcript
+            config (str): key of the decoding config, see `config_key`
+        """
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO transcripts (audio_hash, config, text) "
+            "VALUES (?, ?, ?)",
+            [(h, config, text) for h, text in transcripts.items()],
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
@@ -6,14 +6,21 @@ UTMOS - evaluate the quality of a speech system
 
 import logging
 
-import numpy as np
-import soundfile as sf
 import torch
-import tqdm
-from huggingface_hub import hf_hub_download
 
-from speech_gen_eval import evaluator
-from speech_gen_eval.audio_dir import get_audio_paths
+from speech_gen_eval import (
+    evaluator,
+    model_store,
+    monitoring,
+    onnx_backend,
+    profiling,
+)
+from speech_gen_eval.audio_dir import (
+    converted_durations,
+    get_audio_items,
+    load_audio,
+)
+from speech_gen_eval.batching import duration_batches
 
 
 class UTMOSQualityEvaluator(evaluator.Evaluator):
@@ -21,7 +28,12 @@ class UTMOSQualityEvaluator(evaluator.Evaluator):
     UTMOSv2 quality evaluator
     """
 
-    _gpu_batch_size = 4
+    # batches of similar duration, more short utterances fit the padded audio budget.
+    # the model has no length input, so scores depend on the zero padding of the batch
+    _gpu_batch_size = 16
+    _batch_seconds = 80.0
+    rtf = 0.05
+    supported_backends = ("torch", "onnx")
 
     def __init__(
         self,
@@ -34,13 +46,7 @@ class UTMOSQualityEvaluator(evaluator.Evaluator):
         self._audio_dir = generated_audio
         self._ignore_errors = ignore_errors
 
-        self._model_path = None
-        if not torch.cuda.is_available():
-            logging.warning("UTMOS is a GPU-only model")
-        else:
-            self._model_path = hf_hub_download(
-                repo_id="balacoon/utmos", filename="utmos.jit"
-            )
+        self._device = "cuda" if torch.cuda.is_available() else "cpu"
 
     def get_info(self):
         """
@@ -50,40 +56,65 @@ class UTMOSQualityEvaluator(evaluator.Evaluator):
         """
         return "Quality evaluation with UTMOS"
 
-    def get_metric(self):
+    def get_utterance_stats(self):
         """
-        Get the metric for the evaluator
+        Get the MOS sum and count for each of the utterances
         Returns:
-            list[tuple[str, float]]: A list of tuples, where each tuple contains a metric name and a value
+            dict[str, dict[str, float]]: utterance id -> statistics name -> value
         """
-        if self._model_path is None:
-            return []
-        model = torch.jit.load(self._model_path)
-
-        audio_paths = get_audio_paths(self._audio_dir, self._ids)
-        all_scores = []
+        with profiling.stage("model_load"):
+            if self.backend == "onnx":
+                # onnx export runs on CPU, inputs are moved there by the onnx model
+                model = self._get_model(
+                    "utmos:onnx", lambda: onnx_backend.load_onnx_model("utmos")
+                )
+            elif self._device == "cpu":
+                logging.warning("UTMOS is a GPU-only model, use onnx backend on CPU")
+                return {}
+            else:
+                model = self._get_model(
+                    "utmos",
+                    lambda: torch.jit.load(model_store.get_model_path("utmos")),
+                )
+
+        items = get_audio_items(self._audio_dir, self._ids)
+        utterance_stats = {}
 
         # Process in batches
-        for i in tqdm.tqdm(range(0, len(audio_paths), self._gpu_batch_size)):
-            batch_paths = audio_paths[i : i + self._gpu_batch_size]
+        batches = duration_batches(
+            items,
+            self._gpu_batch_size,
+            self._batch_seconds,
+            durations=converted_durations(self._audio_dir),
+        )
+        for batch in monitoring.progress(batches, items=len):
+            batch_names, batch_items = zip(*batch)
 
             # Load audio files
-            batch_audio = []
-            for batch_path in batch_paths:
-                audio, sr = sf.read(batch_path, dtype="int16")
-                assert sr == 16000
-                batch_audio.append(torch.from_numpy(audio))
+            with profiling.stage("decode", items=len(batch_items)):
+                batch_audio = []
+                for item in batch_items:
+                    audio = load_audio(item, dtype="int16")
+                    batch_audio.append(torch.from_numpy(audio))
+
+            with profiling.stage("inference", items=len(batch_items)):
+                # Pad batch to max length
+                x = torch.nn.utils.rnn.pad_sequence(batch_audio, batch_first=True)
+                x = x.to(self._device)
 
-            # Pad batch to max length
-            x = torch.nn.utils.rnn.pad_sequence(batch_audio, batch_first=True)
-            x = x.to("cuda")
+                # Get predictions
+                with torch.no_grad():
+                    scores = model(x)
 
-            # Get predictions
-            with torch.no_grad():
-                scores = model(x)
+                # Move back to CPU and collect results
+                for name, score in zip(batch_names, scores.detach().cpu().tolist()):
+                    utterance_stats[name] = {"mos_sum": score, "count": 1}
 
-            # Move back to CPU and collect results
-            all_scores.extend(scores.detach().cpu().tolist())
+        return utterance_stats
 
-        mean_score = float(np.mean(all_scores))
-        return [("utmos_mos", mean_score)]
+    @classmethod
+    def metrics_from_stats(cls, stats):
+        """
+        Get the mean MOS from the summed statistics
+        """
+        return [("utmos_mos", stats["mos_sum"] / stats["count"])]
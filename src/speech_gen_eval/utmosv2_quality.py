@@ -5,12 +5,12 @@ UTMOSv2 - evaluate the quality of a speech system
 """
 
 import os
+from collections.abc import Mapping
 
-import numpy as np
 import torch
 import utmosv2
 
-from speech_gen_eval import evaluator
+from speech_gen_eval import evaluator, model_store, monitoring, profiling
 
 
 class UTMOSv2QualityEvaluator(evaluator.Evaluator):
@@ -19,6 +19,7 @@ class UTMOSv2QualityEvaluator(evaluator.Evaluator):
     """
 
     _gpu_batch_size = 8
+    rtf = 0.5
 
     def __init__(
         self,
@@ -39,21 +40,47 @@ class UTMOSv2QualityEvaluator(evaluator.Evaluator):
         """
         return "Quality evaluation with UTMOSv2"
 
-    def get_metric(self):
+    def _load_model(self):
+        return utmosv2.create_model(
+            pretrained=True, checkpoint_path=model_store.get_model_path("utmosv2")
+        )
+
+    def get_utterance_stats(self):
         """
-        Get the metric for the evaluator
+        Get the MOS sum and count for each of the utterances
         Returns:
-            list[tuple[str, float]]: A list of tuples, where each tuple contains a metric name and a value
+            dict[str, dict[str, float]]: utterance id -> statistics name -> value
         """
-        model = utmosv2.create_model(pretrained=True)
+        with profiling.stage("model_load"):
+            model = self._get_model("utmosv2", self._load_model)
         device = "cuda:0" if torch.cuda.is_available() else "cpu"
         batch_size = self._gpu_batch_size if device == "cuda:0" else 1
-        results = model.predict(
-            input_dir=self._audio_dir, device=device, batch_size=batch_size
-        )
+        if isinstance(self._audio_dir, Mapping):
+            # in-memory waveforms, predicted one by one
+            utterance_stats = {}
+            for name, _ in monitoring.progress(self._ids):
+                with profiling.stage("inference", items=1):
+                    mos = model.predict(
+                        data=self._audio_dir[name], sr=16000, device=device
+                    )
+                utterance_stats[name] = {"mos_sum": float(mos), "count": 1}
+            return utterance_stats
+        with profiling.stage("inference", items=len(self._ids)):
+            results = model.predict(
+                input_dir=self._audio_dir, device=device, batch_size=batch_size
+            )
         mos_dict = {
             os.path.splitext(os.path.basename(x["file_path"]))[0]: x["predicted_mos"]
             for x in results
         }
-        mos_lst = [mos_dict[name] for name, _ in self._ids]
-        return [("utmosv2_mos", np.mean(mos_lst))]
+        return {
+            name: {"mos_sum": float(mos_dict[name]), "count": 1}
+            for name, _ in self._ids
+        }
+
+    @classmethod
+    def metrics_from_stats(cls, stats):
+        """
+        Get the mean MOS from the summed statistics
+        """
+        return [("utmosv2_mos", stats["mos_sum"] / stats["count"])]
@@ -0,0 +1,351 @@
+"""
+Copyright 2025 Balacoon
+
+Watch - evaluate utterances as a synthesis job writes them to the generated audio directory
+"""
+
+import argparse
+import logging
+import os
+import time
+from typing import Optional
+
+import yaml
+
+from speech_gen_eval.audio_dir import audio_extensions
+from speech_gen_eval.combined_evaluator import (
+    CombinedEvaluator,
+    evaluator_names,
+    metrics_from_stats,
+    name2evaluator,
+    type2names,
+)
+from speech_gen_eval.evaluation import converted_audio
+from speech_gen_eval.evaluator import sum_stats
+from speech_gen_eval.ids import filter_ids, read_mapping, read_txt
+from speech_gen_eval.plan import EvaluationPlan
+
+
+class DirectoryWatcher:
+    """
+    Reports audio files of a directory once they are completely written:
+    closed after writing or moved into the directory (inotify events, if `inotify_simple`
+    is installed), or once their size and modification time stop changing between polls.
+    Polling also catches files which events are missed for, i.e. on network filesystems.
+    """
+
+    def __init__(self, directory: str, poll_interval: float = 5.0):
+        """
+        Args:
+            directory (str): directory to watch
+            poll_interval (float): seconds between checks of the directory
+        """
+        self._directory = directory
+        self._poll_interval = poll_interval
+        # id -> (size, modification time) at the last poll
+        self._seen: dict[str, tuple[int, int]] = {}
+        self._completed: set[str] = set()
+        self._inotify = None
+        try:
+            from inotify_simple import INotify, flags
+
+            self._inotify = INotify()
+            self._inotify.add_watch(directory, flags.CLOSE_WRITE | flags.MOVED_TO)
+        except (ImportError, OSError) as e:
+            logging.info(f"Polling {directory} every {poll_interval}s, no inotify: {e}")
+            self._inotify = None
+
+    def wait(self) -> list[str]:
+        """
+        Wait up to the poll interval for files to be completed
+        Returns:
+            list[str]: ids of the audio files completed since the previous call
+        """
+        completed = []
+        if self._inotify is not None:
+            for event in self._inotify.read(timeout=int(self._poll_interval * 1000)):
+                name, ext = os.path.splitext(event.name)
+                if ext in audio_extensions and name not in self._completed:
+                    self._completed.add(name)
+                    completed.append(name)
+        else:
+            time.sleep(self._poll_interval)
+        with os.scandir(self._directory) as entries:
+            for entry in entries:
+                name, ext = os.path.splitext(entry.name)
+                if ext not in audio_extensions or name in self._completed:
+                    continue
+                stat = entry.stat()
+                state = (stat.st_size, stat.st_mtime_ns)
+                if stat.st_size > 0 and self._seen.get(name) == state:
+                    self._completed.add(name)
+                    completed.append(name)
+                self._seen[name] = state
+        return completed
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+
+
+def watch(
+    txt_path: str,
+    generated_audio: str,
+    eval_names: list[str],
+    out_path: str,
+    original_audio: Optional[str] = None,
+    mapping_path: Optional[str] = None,
+    ignore_missing: bool = False,
+    poll_interval: float = 5.0,
+    timeout: Optional[float] = None,
+) -> list[tuple[str, float]]:
+    """
+    Evaluate ids from the text file as soon as their generated audio is written,
+    until all of them are evaluated. Models stay loaded between the batches,
+    statistics are accumulated and running metrics are logged after each batch.
+    Bad files are logged and skipped, metrics of the evaluated ids are always saved.
+    Args:
+        txt_path (str): Text file with ids and texts
+        generated_audio (str): Directory the generated audio is written to
+        eval_names (list[str]): Evaluators to run
+        out_path (str): Output file to save the final metrics
+        original_audio (Optional[str]): Directory with original audio
+        mapping_path (Optional[str]): Maps generated ids to reference ids
+        ignore_missing (bool): Whether ids with bad audio or not written before
+            the timeout are fine, otherwise they raise once the metrics are saved
+        poll_interval (float): Seconds between checks of the directory
+        timeout (Optional[float]): Stop if no new files appear for this many seconds,
+            wait forever if None
+    Returns:
+        list[tuple[str, float]]: A list of tuples, where each tuple contains a metric name and a value
+    """
+    needs_original = _needs_original(eval_names)
+    if needs_original and original_audio is None:
+        raise ValueError(f"original_audio is required by {', '.join(needs_original)}")
+    pending = dict(read_txt(txt_path))
+    total = len(pending)
+    mapping = read_mapping(mapping_path) if mapping_path else None
+    utterance_stats = {name: {} for name in eval_names}
+    failed = []
+    models: dict = {}
+    watcher = DirectoryWatcher(generated_audio, poll_interval)
+    last_file = time.time()
+    try:
+        while pending:
+            ready = [x for x in watcher.wait() if x in pending]
+            if not ready:
+                if timeout is not None and time.time() - last_file > timeout:
+                    break
+                continue
+            last_file = time.time()
+            ready = [(x, pending.pop(x)) for x in ready]
+            # bad files are skipped, so one of them doesn't stop a long watch
+            batch, batch_mapping = filter_ids(
+                ready,
+                generated_audio,
+                mapping=mapping,
+                original_audio=original_audio,
+                ignore_missing=True,
+            )
+            kept = {x for x, _ in batch}
+            failed.extend(x for x, _ in ready if x not in kept)
+            if batch:
+                batch_stats = _evaluate_batch(
+                    eval_names,
+                    batch,
+                    batch_mapping,
+                    generated_audio,
+                    original_audio,
+                    models,
+                )
+                for name, x in batch_stats.items():
+                    utterance_stats[name].update(x)
+            running = ", ".join(
+                f"{k}: {v:.4f}" for k, v in metrics_from_stats(_sum(utterance_stats))
+            )
+            logging.info(f"{total - len(pending)}/{total} ids done. {running}")
+    finally:
+        watcher.close()
+        metrics = _save_metrics(out_path, utterance_stats, pending, failed)
+
+    _check_completed(pending, failed, timeout, ignore_missing)
+    return metrics
+
+
+def _check_completed(
+    pending: dict[str, str],
+    failed: list[str],
+    timeout: Optional[float],
+    ignore_missing: bool,
+):
+    """
+    Report ids which are not written or have bad audio, raise if they are not ignored
+    """
+    problems = []
+    if pending:
+        problems.append(
+            f"{len(pending)} ids are not written after {timeout}s without new files"
+        )
+    if failed:
+        problems.append(f"{len(failed)} ids have missing or bad audio")
+    for msg in problems:
+        if not ignore_missing:
+            raise RuntimeError(f"{msg}, metrics of the evaluated ids are saved")
+        logging.warning(msg)
+
+
+def _needs_original(eval_names: list[str]) -> list[str]:
+    """
+    Evaluators which read original audio, of the same id or of the reference id
+    """
+    return [
+        name
+        for name in eval_names
+        if {"original", "reference"} & set(name2evaluator[name].inputs)
+    ]
+
+
+def _sum(
+    utterance_stats: dict[str, dict[str, dict[str, float]]],
+) -> dict[str, dict[str, float]]:
+    """
+    Statistics of each evaluator summed over the evaluated utterances
+    """
+    return {name: sum_stats(list(x.values())) for name, x in utterance_stats.items()}
+
+
+def _evaluate_batch(
+    eval_names: list[str],
+    batch: list[tuple[str, str]],
+    mapping: Optional[dict[str, str]],
+    generated_audio: str,
+    original_audio: Optional[str],
+    models: dict,
+) -> dict[str, dict[str, dict[str, float]]]:
+    """
+    Evaluate a batch of written utterances, errors of single files are logged
+    Args:
+        models (dict): models kept loaded between the batches
+    Returns:
+        dict[str, dict[str, dict[str, float]]]: evaluator name -> utterance id -> statistics
+    """
+    plan = EvaluationPlan(eval_names, batch, mapping)
+    with converted_audio(plan, batch, generated_audio, original_audio, True) as (
+        generated_16khz,
+        original_16khz,
+    ):
+        evaluator = CombinedEvaluator(
+            eval_names,
+            ids=batch,
+            generated_audio=generated_16khz,
+            original_audio=original_16khz,
+            mapping=mapping,
+            ignore_errors=True,
+            model_cache=models,
+        )
+        return evaluator.get_utterance_stats()
+
+
+def _save_metrics(
+    out_path: str,
+    utterance_stats: dict[str, dict[str, dict[str, float]]],
+    pending: dict[str, str],
+    failed: list[str],
+) -> list[tuple[str, float]]:
+    """
+    Save metrics of the evaluated ids, with ids which are not written or failed
+    Returns:
+        list[tuple[str, float]]: metrics
+    """
+    metrics = metrics_from_stats(_sum(utterance_stats))
+    output = {
+        "metrics": dict(metrics),
+        "evaluated": {name: len(x) for name, x in utterance_stats.items()},
+    }
+    if pending:
+        output["missing"] = sorted(pending)
+    if failed:
+        output["failed"] = sorted(failed)
+    with open(out_path, "w") as f:
+        yaml.dump(output, f, default_flow_style=False)
+    return metrics
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """
+    Parse command line arguments of the `watch` command
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    ap = argparse.ArgumentParser(
+        prog="speech-gen-eval watch",
+        description="Evaluates utterances as they are written to the generated audio directory",
+    )
+    ap.add_argument("--txt", required=True, help="Text file with ids and text")
+    ap.add_argument(
+        "--generated-audio",
+        required=True,
+        help="Directory the generated audio is written to",
+    )
+    ap.add_argument("--original-audio", help="Directory with original audio")
+    ap.add_argument("--mapping", help="Maps audio ids to reference ids")
+    ap.add_argument(
+        "--type",
+        choices=["tts", "zero-tts", "zero-vc", "vocoder", "custom"],
+        default="zero-tts",
+        help="Type of system to evaluate",
+    )
+    ap.add_argument(
+        "--evaluators",
+        nargs="+",
+        choices=evaluator_names,
+        help="If running custom evaluation, specify the evaluators to run",
+    )
+    ap.add_argument(
+        "--ignore-missing",
+        action="store_true",
+        help="Don't fail on ids with bad audio or not written before the timeout "
+        "(metrics of the evaluated ids are saved either way)",
+    )
+    ap.add_argument(
+        "--poll-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between checks of the directory",
+    )
+    ap.add_argument(
+        "--timeout",
+        type=float,
+        help="Stop if no new files appear for this many seconds, wait forever by default",
+    )
+    ap.add_argument("--out", required=True, help="Output file to save metrics")
+    args = ap.parse_args(argv)
+    if args.type == "custom" and not args.evaluators:
+        ap.error("--evaluators is required when type is 'custom'.")
+    if args.type != "custom" and args.evaluators:
+        ap.error("--evaluators is only allowed when type is 'custom'.")
+    if args.mapping and not args.original_audio:
+        ap.error("--original-audio is required with --mapping.")
+    eval_names = args.evaluators if args.type == "custom" else type2names[args.type]
+    needs_original = _needs_original(eval_names)
+    if needs_original and not args.original_audio:
+        ap.error(f"--original-audio is required by {', '.join(needs_original)}.")
+    return args
+
+
+def main(argv: Optional[list[str]] = None):
+    """
+    Entry point of the `watch` command
+    """
+    args = parse_args(argv)
+    watch(
+        args.txt,
+        args.generated_audio,
+        args.evaluators if args.type == "custom" else type2names[args.type],
+        args.out,
+        original_audio=args.original_audio,
+        mapping_path=args.mapping,
+        ignore_missing=args.ignore_missing,
+        poll_interval=args.poll_interval,
+        timeout=args.timeout,
+    )
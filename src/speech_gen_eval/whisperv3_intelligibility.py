@@ -5,13 +5,22 @@ Intelligibility - evaluate the intelligibility of a speech system
 """
 
 import logging
+from collections import defaultdict
+from typing import Optional, Union
 
 import jiwer
+import numpy as np
 import torch
 from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
 
-from speech_gen_eval import evaluator
-from speech_gen_eval.audio_dir import get_audio_paths
+from speech_gen_eval import evaluator, model_store, monitoring, precision, profiling
+from speech_gen_eval.audio_dir import (
+    audio_hash,
+    converted_durations,
+    get_audio_items,
+)
+from speech_gen_eval.batching import duration_batches
+from speech_gen_eval.transcript_cache import TranscriptCache, config_key
 
 
 class WhisperV3IntelligibilityEvaluator(evaluator.Evaluator):
@@ -21,17 +30,49 @@ class WhisperV3IntelligibilityEvaluator(evaluator.Evaluator):
 
     _model_id = "openai/whisper-large-v3-turbo"
     _gpu_batch_size = 8
+    _chunk_length_s = 30
+    # batches are of similar duration, so the decoder doesn't wait for the longest
+    # utterance; budget of padded audio is a batch of full chunks
+    _batch_seconds = _gpu_batch_size * _chunk_length_s
+    # bounded decoding: tokens allowed per reference character, plus a margin.
+    # loose for latin scripts (~4 characters per token), enough for CJK
+    _tokens_per_char = 1.0
+    _extra_tokens = 16
+    # caps are rounded up to a multiple of this, so references of similar length
+    # share the decoding config and are transcribed in the same batches
+    _token_cap_step = 32
+    # decoder has 448 positions, some are taken by the prompt tokens
+    _max_target_tokens = 440
+    rtf = 0.3
+    lower_is_better = ("whisperv3_cer",)
+    uses_text = True
+    supported_precisions = ("fp32", "bf16", "int8")
 
     def __init__(
         self,
         ids: dict[str, str],
         generated_audio: str,
         ignore_errors: bool = True,
+        transcript_cache: Optional[str] = None,
+        asr_decoding: Optional[dict] = None,
         **kwargs,
     ):
+        """
+        Args:
+            transcript_cache (Optional[str]): sqlite file to reuse transcripts from,
+                only new or changed audio is transcribed. Nothing is cached if None
+            asr_decoding (Optional[dict]): decoding options: "language" and "task"
+                are forced instead of detected, "bounded" decodes greedily with
+                new tokens capped from the reference text length
+        """
         self._ids = ids
         self._audio_dir = generated_audio
         self._ignore_errors = ignore_errors
+        self._transcript_cache = transcript_cache
+        asr_decoding = asr_decoding or {}
+        self._language = asr_decoding.get("language")
+        self._task = asr_decoding.get("task")
+        self._bounded = asr_decoding.get("bounded", False)
 
         # uses whisper-large-v3-turbo
         # https://huggingface.co/openai/whisper-large-v3-turbo
@@ -46,57 +87,241 @@ class WhisperV3IntelligibilityEvaluator(evaluator.Evaluator):
         """
         return f"Intelligibility evaluation with {self._model_id}"
 
-    def get_metric(self):
-        """
-        Get the metric for the evaluator
-        Returns:
-            list[tuple[str, float]]: A list of tuples, where each tuple contains a metric name and a value
-        """
-        # create model
+    def _load_pipeline(self):
         torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+        model_path = model_store.get_model_path("whisper")
         model = AutoModelForSpeechSeq2Seq.from_pretrained(
-            self._model_id,
+            model_path,
             torch_dtype=torch_dtype,
             low_cpu_mem_usage=True,
             use_safetensors=True,
         )
         model.to(self._device)
-        processor = AutoProcessor.from_pretrained(self._model_id)
-        pipe = pipeline(
+        if self.precision == "int8":
+            model = precision.quantize_int8(model)
+        processor = AutoProcessor.from_pretrained(model_path)
+        return pipeline(
             "automatic-speech-recognition",
             model=model,
             tokenizer=processor.tokenizer,
             feature_extractor=processor.feature_extractor,
             torch_dtype=torch_dtype,
-            chunk_length_s=30,
+            chunk_length_s=self._chunk_length_s,
             batch_size=self._batch_size,
             device=self._device,
         )
 
-        audio_paths = get_audio_paths(self._audio_dir, self._ids)
-        ref_txt_lst = []
-        hyp_txt_lst = []
-        for i in range(0, len(audio_paths), self._batch_size):
-            batch_audio_paths = audio_paths[i : i + self._batch_size]
-            batch_ids = self._ids[i : i + self._batch_size]
-            try:
-                results = pipe(batch_audio_paths, batch_size=self._batch_size)
-            except Exception as e:
-                if self._ignore_errors:
-                    logging.error(f"Error processing {batch_audio_paths}: {e}")
-                    continue
-                else:
-                    raise e
-            if len(results) != len(batch_ids):
-                msg = f"Number of results ({len(results)}) does not match number of ids ({len(batch_ids)})"
-                if self._ignore_errors:
-                    logging.error(msg)
-                    continue
-                else:
-                    raise ValueError(msg)
-            ref_txt_lst.extend([x[1] for x in batch_ids])
-            hyp_txt_lst.extend([x.get("text", "") for x in results])
-
-        # Calculate CER
-        cer = jiwer.cer(ref_txt_lst, hyp_txt_lst)
-        return [("whisperv3_cer", cer)]
+    def get_utterance_stats(self):
+        """
+        Transcribe the utterances and get character edit counts and reference lengths
+        Returns:
+            dict[str, dict[str, float]]: utterance id -> statistics name -> value
+        """
+        if self.precision != "fp32" and self._device != "cpu":
+            # on GPU the model already runs in float16
+            logging.warning(f"{self.precision} is a CPU mode, running in float16")
+            self.precision = "fp32"
+        items = get_audio_items(self._audio_dir, self._ids)
+        texts = dict(self._ids)
+        hypotheses, hashes = {}, {}
+        cache = None
+        if self._transcript_cache:
+            cache = TranscriptCache(self._transcript_cache)
+            with profiling.stage("cache_lookup", items=len(items)):
+                hashes = {name: audio_hash(audio) for name, audio in items}
+                hypotheses = self._cached_transcripts(cache, hashes, texts)
+            items = [x for x in items if x[0] not in hypotheses]
+            monitoring.advance(len(hypotheses))
+            logging.info(
+                f"{len(hypotheses)} transcripts are cached, transcribing {len(items)}"
+            )
+        if items:
+            with profiling.stage("model_load"):
+                pipe = self._get_model(
+                    f"whisper:{self._device}:{self.precision}", self._load_pipeline
+                )
+            hypotheses.update(self._transcribe(pipe, items, texts, cache, hashes))
+        if cache is not None:
+            cache.close()
+        return {
+            name: self._edit_stats(texts[name], hypothesis)
+            for name, hypothesis in hypotheses.items()
+        }
+
+    def _cached_transcripts(
+        self,
+        cache: TranscriptCache,
+        hashes: dict[str, str],
+        texts: dict[str, str],
+    ) -> dict[str, str]:
+        """
+        Look up transcripts of the audio decoded with the same config
+        Args:
+            hashes (dict[str, str]): id -> hash of the audio
+        Returns:
+            dict[str, str]: id -> transcript, for the ids found in the cache
+        """
+        # with bounded decoding, the token cap is a part of the config
+        by_config = defaultdict(list)
+        for name in hashes:
+            by_config[self._decoding_config(texts[name])].append(name)
+        hypotheses = {}
+        for config, names in by_config.items():
+            cached = cache.get(sorted({hashes[x] for x in names}), config)
+            hypotheses.update(
+                {x: cached[hashes[x]] for x in names if hashes[x] in cached}
+            )
+        return hypotheses
+
+    def _transcribe(
+        self,
+        pipe,
+        items: list[tuple[str, Union[str, np.ndarray]]],
+        texts: dict[str, str],
+        cache: Optional[TranscriptCache] = None,
+        hashes: Optional[dict[str, str]] = None,
+    ) -> dict[str, str]:
+        """
+        Transcribe the audio items in batches of similar duration,
+        storing the transcripts in the cache if given
+        Args:
+            hashes (Optional[dict[str, str]]): id -> hash of the audio, to store transcripts with
+        Returns:
+            dict[str, str]: id -> transcript, failed batches are skipped
+        """
+        # generation parameters are shared by a batch, so batches are made
+        # of utterances with the same decoding config, transcripts are stored under it
+        by_config = defaultdict(list)
+        for name, audio in items:
+            by_config[self._decoding_config(texts[name])].append((name, audio))
+        durations = converted_durations(self._audio_dir)
+        batches = [
+            (config, batch)
+            for config, config_items in by_config.items()
+            for batch in duration_batches(
+                config_items, self._batch_size, self._batch_seconds, durations
+            )
+        ]
+        hypotheses = {}
+        for config, batch in monitoring.progress(batches, items=lambda x: len(x[1])):
+            batch_hypotheses = self._transcribe_batch(pipe, batch, texts[batch[0][0]])
+            hypotheses.update(batch_hypotheses)
+            if cache is not None and batch_hypotheses:
+                # stored per batch, so an interrupted run keeps its progress
+                cache.put(
+                    {hashes[x]: text for x, text in batch_hypotheses.items()}, config
+                )
+        return hypotheses
+
+    def _transcribe_batch(
+        self,
+        pipe,
+        batch: list[tuple[str, Union[str, np.ndarray]]],
+        text: str,
+    ) -> dict[str, str]:
+        """
+        Transcribe a batch of audio items
+        Args:
+            text (str): reference text of any of the utterances, the batch
+                shares its decoding config
+        Returns:
+            dict[str, str]: id -> transcript, empty if the batch failed
+        """
+        batch_names, batch_items = zip(*batch)
+        # pipeline takes paths or raw waveforms with their sample rate
+        inputs = [
+            x if isinstance(x, str) else {"raw": x, "sampling_rate": 16000}
+            for x in batch_items
+        ]
+        try:
+            # decoding and feature extraction happen inside of the pipeline
+            with profiling.stage("inference", items=len(inputs)), precision.autocast(
+                self.precision
+            ):
+                results = pipe(
+                    inputs,
+                    batch_size=self._batch_size,
+                    generate_kwargs=self._generate_kwargs(text),
+                )
+            if len(results) != len(batch_names):
+                raise ValueError(
+                    f"Number of results ({len(results)}) does not match "
+                    f"number of ids ({len(batch_names)})"
+                )
+        except Exception as e:
+            if not self._ignore_errors:
+                raise e
+            logging.error(f"Error processing {batch_names}: {e}")
+            monitoring.advance(0, failed=len(batch_names))
+            return {}
+        return {
+            name: result.get("text", "") for name, result in zip(batch_names, results)
+        }
+
+    @classmethod
+    def cache_settings(cls, asr_decoding: Optional[dict] = None, **kwargs):
+        """
+        Transcripts depend on the decoding options
+        """
+        return {"asr_decoding": asr_decoding or {}}
+
+    def _max_new_tokens(self, text: str) -> int:
+        """
+        Cap of the generated tokens for the reference text, so a hallucination loop
+        on babbling audio can't run until the decoder is out of positions
+        """
+        tokens = int(len(text) * self._tokens_per_char) + self._extra_tokens
+        # rounded up to the step
+        tokens = -(-tokens // self._token_cap_step) * self._token_cap_step
+        return min(self._max_target_tokens, tokens)
+
+    def _generate_kwargs(self, text: str) -> dict:
+        """
+        Generation parameters of the pipeline
+        Args:
+            text (str): reference text, bounds the number of generated tokens
+        """
+        kwargs = {}
+        if self._language:
+            # skips language detection
+            kwargs["language"] = self._language
+        if self._task:
+            kwargs["task"] = self._task
+        if self._bounded:
+            kwargs.update(
+                num_beams=1, do_sample=False, max_new_tokens=self._max_new_tokens(text)
+            )
+        return kwargs
+
+    def _decoding_config(self, text: str) -> str:
+        """
+        Key of the model and decoding parameters transcripts depend on
+        Args:
+            text (str): reference text, bounds the number of generated tokens
+        """
+        return config_key(
+            self._model_id,
+            device_dtype="float16" if self._device != "cpu" else "float32",
+            precision=self.precision,
+            chunk_length_s=self._chunk_length_s,
+            **self._generate_kwargs(text),
+        )
+
+    @staticmethod
+    def _edit_stats(reference: str, hypothesis: str) -> dict[str, float]:
+        """
+        Character edit counts, summed over utterances they give the same CER
+        as `jiwer.cer` over the whole corpus
+        """
+        output = jiwer.process_characters(reference, hypothesis)
+        return {
+            "edits": output.substitutions + output.deletions + output.insertions,
+            "ref_len": output.substitutions + output.deletions + output.hits,
+        }
+
+    @classmethod
+    def metrics_from_stats(cls, stats):
+        """
+        Get the character error rate from the summed edit counts
+        """
+        return [("whisperv3_cer", stats["edits"] / stats["ref_len"])]
@@ -0,0 +1,41 @@
+"""
+Copyright 2025 Balacoon
+
+Fixtures shared between the tests
+"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def assets() -> dict[str, str]:
+    """
+    Paths of the test assets: "txt" with ids and texts, "wav" directory and "mapping"
+    """
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    return {
+        name: os.path.join(test_dir, "assets", name)
+        for name in ["txt", "wav", "mapping"]
+    }
+
+
+@pytest.fixture
+def jitter_stats():
+    """
+    Build per-utterance statistics of the jitter evaluator for ids "utt0", "utt1", ...
+    Shimmer is 0.1 for all the utterances if not given
+    """
+
+    def _jitter_stats(jitter, shimmer=None) -> dict:
+        if shimmer is None:
+            shimmer = [0.1] * len(jitter)
+        return {
+            "jitter": {
+                f"utt{i}": {"jitter_sum": float(j), "shimmer_sum": float(s), "count": 1}
+                for i, (j, s) in enumerate(zip(jitter, shimmer))
+            }
+        }
+
+    return _jitter_stats
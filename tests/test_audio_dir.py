@@ -0,0 +1,77 @@
+"""
+Copyright 2025 Balacoon
+
+Test reading audio from directories and tar/zip archives
+"""
+
+import os
+import tarfile
+import zipfile
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from speech_gen_eval.audio_dir import (
+    DirectorySource,
+    convert_audio_dir,
+    get_audio_source,
+)
+from speech_gen_eval.ids import read_txt_and_mapping
+
+
+def _make_archives(wav_path: str, out_dir) -> dict[str, str]:
+    """
+    Pack the test audio into two tar shards (with non-audio members, as WebDataset has)
+    and a zip archive
+    """
+    files = sorted(os.listdir(wav_path))
+    for i, shard in enumerate([files[:5], files[5:]]):
+        with tarfile.open(out_dir / f"test-{i:03d}.tar", "w") as tar:
+            for name in shard:
+                tar.add(os.path.join(wav_path, name), arcname=name)
+                txt = out_dir / (os.path.splitext(name)[0] + ".txt")
+                txt.write_text("text")
+                tar.add(str(txt), arcname=txt.name)
+    with zipfile.ZipFile(out_dir / "test.zip", "w", zipfile.ZIP_DEFLATED) as f:
+        for name in files:
+            f.write(os.path.join(wav_path, name), arcname=name)
+    return {"tar": str(out_dir / "test-*.tar"), "zip": str(out_dir / "test.zip")}
+
+
+@pytest.mark.parametrize("kind", ["tar", "zip"])
+def test_archive_source(tmp_path, kind, assets):
+    txt_path, wav_path = assets["txt"], assets["wav"]
+    location = _make_archives(wav_path, tmp_path)[kind]
+    source = get_audio_source(location)
+    directory = get_audio_source(wav_path)
+    assert isinstance(directory, DirectorySource)
+
+    ids, _ = read_txt_and_mapping(txt_path, location, ignore_missing=False)
+    assert ids == read_txt_and_mapping(txt_path, wav_path, ignore_missing=False)[0]
+    for name, _ in ids:
+        assert source.path(name) is None
+        assert source.read(name) == directory.read(name)
+        assert source.size(name) == directory.size(name)
+        assert source.info(name).frames == directory.info(name).frames
+    assert source.find("missing") is None
+
+    # archive members are converted the same as the files
+    with convert_audio_dir(location, ids) as from_archive, convert_audio_dir(
+        wav_path, ids
+    ) as from_dir:
+        for name, _ in ids:
+            wav, _ = sf.read(os.path.join(from_archive, name + ".wav"))
+            expected, _ = sf.read(os.path.join(from_dir, name + ".wav"))
+            np.testing.assert_array_equal(wav, expected)
+
+
+def test_compressed_tar(tmp_path, assets):
+    wav_path = assets["wav"]
+    path = tmp_path / "test.tar"
+    with tarfile.open(path, "w:gz") as tar:
+        tar.add(wav_path, arcname="wav")
+    with pytest.raises(ValueError):
+        get_audio_source(str(path))
+    with pytest.raises(FileNotFoundError):
+        get_audio_source(str(tmp_path / "missing-*.tar"))
@@ -0,0 +1,82 @@
+"""
+Copyright 2025 Balacoon
+
+Test duration-based ordering and batching
+"""
+
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from speech_gen_eval.audio_dir import (
+    convert_audio_dir,
+    converted_durations,
+    get_audio_items,
+    sort_ids_by_duration,
+)
+from speech_gen_eval.batching import duration_batches, item_duration
+
+
+def test_sort_ids_by_duration(tmp_path):
+    # longer audio in a smaller file: low sample rate and compressed format
+    sf.write(tmp_path / "long.flac", np.zeros(8000 * 4), 8000)
+    sf.write(tmp_path / "short.wav", np.zeros(48000 * 2), 48000)
+    sf.write(tmp_path / "medium.wav", np.zeros(16000 * 3), 16000)
+    ids = [("short", "a"), ("medium", "b"), ("long", "c")]
+    assert os.path.getsize(tmp_path / "long.flac") < os.path.getsize(
+        tmp_path / "short.wav"
+    )
+    assert [name for name, _ in sort_ids_by_duration(str(tmp_path), ids)] == [
+        "long",
+        "medium",
+        "short",
+    ]
+
+
+def test_duration_batches(tmp_path):
+    durations = [1.0, 10.0, 2.0, 9.0, 1.5, 1.0, 0.5]
+    items = [(f"utt{i}", np.zeros(int(x * 16000))) for i, x in enumerate(durations)]
+    batches = duration_batches(items, max_batch_size=4, max_batch_seconds=20.0)
+    assert [[name for name, _ in batch] for batch in batches] == [
+        ["utt1", "utt3"],
+        ["utt2", "utt4", "utt0", "utt5"],
+        ["utt6"],
+    ]
+    for batch in batches:
+        longest = max(item_duration(audio) for _, audio in batch)
+        assert len(batch) == 1 or len(batch) * longest <= 20.0
+
+    # an utterance longer than the budget is a batch of its own
+    batches = duration_batches(items, max_batch_size=4, max_batch_seconds=5.0)
+    assert [len(batch) for batch in batches[:2]] == [1, 1]
+    assert sorted(name for batch in batches for name, _ in batch) == sorted(
+        name for name, _ in items
+    )
+
+
+def test_item_duration():
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    wav_dir = os.path.join(test_dir, "assets", "wav")
+    ids = [(os.path.splitext(x)[0], "") for x in sorted(os.listdir(wav_dir))]
+    for name, path in get_audio_items(wav_dir, ids):
+        assert item_duration(path) == sf.info(path).duration
+
+
+def test_known_durations(tmp_path):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    wav_dir = os.path.join(test_dir, "assets", "wav")
+    ids = [(os.path.splitext(x)[0], "") for x in sorted(os.listdir(wav_dir))]
+    with convert_audio_dir(wav_dir, ids) as converted:
+        durations = converted_durations(converted)
+        items = get_audio_items(converted, ids)
+        assert sorted(durations) == sorted(name for name, _ in ids)
+        for name, path in items:
+            assert durations[name] == pytest.approx(item_duration(path))
+    assert converted_durations(converted) == {}
+
+    # known durations are not probed, files may not exist
+    items = [(name, str(tmp_path / f"{name}.wav")) for name in durations]
+    batches = duration_batches(items, 4, 20.0, durations=durations)
+    assert sorted(name for batch in batches for name, _ in batch) == sorted(durations)
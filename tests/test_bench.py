@@ -0,0 +1,64 @@
+"""
+Copyright 2025 Balacoon
+
+Test benchmark on synthetic corpus
+"""
+
+import json
+
+import pytest
+import soundfile as sf
+
+from speech_gen_eval import audio_dir
+from speech_gen_eval.bench import generate_corpus, main, run_benchmark
+from speech_gen_eval.ids import read_txt_and_mapping
+
+
+def test_generate_corpus(tmp_path):
+    paths = generate_corpus(
+        str(tmp_path), num_files=5, min_dur=0.5, max_dur=2.0, sample_rate=16000
+    )
+    ids, mapping = read_txt_and_mapping(
+        paths["txt"],
+        paths["generated_audio"],
+        mapping_path=paths["mapping"],
+        original_audio=paths["original_audio"],
+        ignore_missing=False,
+    )
+    assert len(ids) == 5
+    assert len(mapping) == 5
+    info = sf.info(str(tmp_path / "generated" / (ids[0][0] + ".wav")))
+    assert info.samplerate == 16000
+    assert 0.5 <= info.duration <= 2.0
+
+
+def test_run_benchmark(tmp_path):
+    report = run_benchmark(
+        str(tmp_path), evaluators=["f0stats"], num_files=3, max_dur=2.0
+    )
+    # report is machine-readable
+    report = json.loads(json.dumps(report))
+    assert report["corpus"]["files"] == 3
+    # shared features are a stage of their own, as in the evaluation
+    for stage in ["read_txt_and_mapping", "convert_audio_dir", "features", "f0stats"]:
+        assert stage in report["stages"]
+        assert report["stages"][stage]["wall_time"] >= 0
+        assert "real_time_factor" in report["stages"][stage]
+    assert report["peak_rss_mb"]["self"] > 0
+    assert report["failed"] is None
+
+
+def test_failed_stage(tmp_path, monkeypatch):
+    def _convert_audio_dir(*args, **kwargs):
+        raise RuntimeError("conversion failed")
+
+    monkeypatch.setattr(audio_dir, "convert_audio_dir", _convert_audio_dir)
+    report = run_benchmark(
+        str(tmp_path), evaluators=["jitter"], num_files=2, max_dur=2.0
+    )
+    # evaluators don't run on audio which is not converted
+    assert report["failed"] == "convert_audio_dir"
+    assert report["stages"]["convert_audio_dir"]["error"] == "conversion failed"
+    assert "jitter" not in report["stages"]
+    with pytest.raises(SystemExit):
+        main(["--num-files", "2", "--max-dur", "2", "--evaluators", "jitter"])
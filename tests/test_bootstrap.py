@@ -0,0 +1,93 @@
+"""
+Copyright 2025 Balacoon
+
+Test bootstrap confidence intervals and paired comparison of runs
+"""
+
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from speech_gen_eval.bootstrap import (
+    bootstrap_intervals,
+    paired_comparison,
+    read_utterance_stats,
+)
+from speech_gen_eval.evaluation import speech_gen_eval
+
+
+def test_bootstrap_intervals(jitter_stats):
+    rng = np.random.default_rng(1)
+    jitter = rng.normal(0.02, 0.01, size=2000)
+    shimmer = rng.normal(0.1, 0.05, size=2000)
+    intervals = bootstrap_intervals(
+        jitter_stats(jitter, shimmer), num_resamples=2000, confidence=0.95
+    )
+    assert set(intervals) == {"jitter", "shimmer"}
+    for metric, values in [("jitter", jitter), ("shimmer", shimmer)]:
+        low, high = intervals[metric]
+        assert low < values.mean() < high
+        # close to the normal approximation of the interval of the mean
+        half_width = 1.96 * values.std() / np.sqrt(len(values))
+        assert (high - low) / 2 == pytest.approx(half_width, rel=0.15)
+    # same seed, same intervals
+    assert intervals == bootstrap_intervals(
+        jitter_stats(jitter, shimmer), num_resamples=2000, confidence=0.95
+    )
+
+
+def test_paired_comparison(jitter_stats):
+    rng = np.random.default_rng(2)
+    # large per-utterance variation, small but consistent improvement
+    jitter = rng.normal(0.02, 0.01, size=500)
+    shimmer = rng.normal(0.1, 0.05, size=500)
+    baseline = jitter_stats(jitter, shimmer)
+    run = jitter_stats(
+        jitter - 0.001 + rng.normal(0, 0.0005, size=500),
+        shimmer + rng.normal(0, 0.0005, size=500),
+    )
+    comparison = paired_comparison(run, baseline, num_resamples=1000)
+    assert comparison["jitter"]["delta"] == pytest.approx(-0.001, abs=1e-4)
+    assert comparison["jitter"]["high"] < 0
+    assert comparison["jitter"]["p_value"] < 0.01
+    assert comparison["shimmer"]["low"] < 0 < comparison["shimmer"]["high"]
+    assert comparison["shimmer"]["p_value"] > 0.05
+    assert comparison["jitter"]["utterances"] == 500
+
+    # only the utterances both runs have evaluated are paired
+    del run["jitter"]["utt0"]
+    assert paired_comparison(run, baseline)["jitter"]["utterances"] == 499
+
+
+def test_evaluate_with_bootstrap(tmp_path):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    args = [
+        os.path.join(test_dir, "assets", "txt"),
+        os.path.join(test_dir, "assets", "wav"),
+        "custom",
+    ]
+    out_path = str(tmp_path / "run.yaml")
+    metrics = speech_gen_eval(
+        *args, evaluators=["jitter"], out_path=out_path, bootstrap=500
+    )
+    with open(out_path) as f:
+        output = yaml.safe_load(f)
+    for name, value in metrics:
+        low, high = output["confidence_intervals"][name]
+        assert low <= value <= high
+    assert len(read_utterance_stats(out_path)["jitter"]) == 10
+
+    # compared with itself, there is no difference
+    speech_gen_eval(
+        *args,
+        evaluators=["jitter"],
+        out_path=str(tmp_path / "compared.yaml"),
+        bootstrap=500,
+        baseline_path=out_path,
+    )
+    with open(tmp_path / "compared.yaml") as f:
+        comparison = yaml.safe_load(f)["comparison"]
+    assert comparison["jitter"]["delta"] == 0
+    assert comparison["jitter"]["p_value"] == 1
@@ -0,0 +1,109 @@
+"""
+Copyright 2025 Balacoon
+
+Test deduplication of identical audio by content hash
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from speech_gen_eval.audio_dir import audio_hash, convert_audio_dir
+from speech_gen_eval.dedup import fan_out, hash_audio, unique_ids
+from speech_gen_eval.evaluation import speech_gen_eval
+from speech_gen_eval.opensmile import OpenSmileEvaluator
+
+
+@pytest.fixture
+def wav_dir(tmp_path):
+    """
+    Test wavs with two copies of the first one
+    """
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    wav_dir = str(tmp_path / "wav")
+    shutil.copytree(os.path.join(test_dir, "assets", "wav"), wav_dir)
+    name = sorted(os.listdir(wav_dir))[0]
+    for copy in ("copy_a.wav", "copy_b.wav"):
+        shutil.copyfile(os.path.join(wav_dir, name), os.path.join(wav_dir, copy))
+    return wav_dir
+
+
+def test_content_hash(wav_dir, tmp_path):
+    names = sorted(os.path.splitext(x)[0] for x in os.listdir(wav_dir))
+    hashes = hash_audio(wav_dir, names + ["missing"])
+    assert sorted(hashes) == names
+    assert hashes["copy_a"] == hashes["copy_b"] == hashes[names[0]]
+    assert len(set(hashes.values())) == len(names) - 2
+    with open(os.path.join(wav_dir, "copy_a.wav"), "rb") as f:
+        assert audio_hash(f.read()) == hashes["copy_a"]
+
+    waveform = np.linspace(-1, 1, 16000)
+    assert audio_hash(waveform) == audio_hash(waveform.astype(np.float32))
+    assert audio_hash(waveform) != audio_hash(waveform[:-1])
+    empty = str(tmp_path / "empty.wav")
+    open(empty, "wb").close()
+    assert audio_hash(empty) == audio_hash(b"")
+
+
+def test_unique_ids():
+    ids = [("a", ""), ("b", ""), ("c", ""), ("d", "")]
+    unique, duplicates = unique_ids(ids, {"a": "1", "b": "2", "c": "1"})
+    # utterances without a key are kept
+    assert unique == [("a", ""), ("b", ""), ("d", "")]
+    assert duplicates == {"c": "a"}
+    stats = fan_out({"a": {"count": 1.0}, "b": {"count": 2.0}}, duplicates)
+    assert stats["c"] == {"count": 1.0}
+    assert len(stats) == 3
+
+
+def test_conversion(wav_dir):
+    names = sorted(os.path.splitext(x)[0] for x in os.listdir(wav_dir))
+    ids = [(x, "") for x in names]
+    hashes = hash_audio(wav_dir, names)
+    converted = {}
+    with convert_audio_dir(
+        wav_dir, ids, hashes=hashes, converted=converted
+    ) as generated:
+        # the other directory only has audio which is already converted
+        with convert_audio_dir(
+            wav_dir, ids[:1], hashes=hashes, converted=converted
+        ) as original:
+            assert len(converted) == len(names) - 2
+            first = os.path.join(generated, f"{names[0]}.wav")
+            for path in (
+                os.path.join(generated, "copy_a.wav"),
+                os.path.join(generated, "copy_b.wav"),
+                os.path.join(original, f"{names[0]}.wav"),
+            ):
+                with open(path, "rb") as f, open(first, "rb") as f_first:
+                    assert f.read() == f_first.read()
+
+
+def test_evaluation(wav_dir, tmp_path, monkeypatch):
+    names = sorted(os.path.splitext(x)[0] for x in os.listdir(wav_dir))
+    txt_path = str(tmp_path / "txt")
+    with open(txt_path, "w") as f:
+        f.writelines(f"{x}\ttext\n" for x in names)
+    evaluated = []
+    get_utterance_stats = OpenSmileEvaluator.get_utterance_stats
+
+    def _recording(self):
+        evaluated.extend(name for name, _ in self._ids)
+        return get_utterance_stats(self)
+
+    monkeypatch.setattr(OpenSmileEvaluator, "get_utterance_stats", _recording)
+
+    def _evaluate(dedup):
+        return speech_gen_eval(
+            txt_path, wav_dir, "custom", evaluators=["jitter"], dedup=dedup
+        )
+
+    expected = _evaluate(dedup=False)
+    assert len(evaluated) == len(names)
+    evaluated.clear()
+    # copies are evaluated once, with the same metrics
+    assert _evaluate(dedup=True) == pytest.approx(expected)
+    # the first of the identical utterances is evaluated
+    assert sorted(evaluated) == [x for x in names if x not in ("copy_b", "p230_393")]
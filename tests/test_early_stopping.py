@@ -0,0 +1,81 @@
+"""
+Copyright 2025 Balacoon
+
+Test early-stopping evaluation on a growing random subset
+"""
+
+import os
+
+import pytest
+import yaml
+
+from speech_gen_eval import evaluation
+from speech_gen_eval.evaluation import speech_gen_eval
+
+
+def _evaluate(out_path=None, **kwargs):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    return speech_gen_eval(
+        os.path.join(test_dir, "assets", "txt"),
+        os.path.join(test_dir, "assets", "wav"),
+        "custom",
+        evaluators=["jitter"],
+        out_path=out_path,
+        **kwargs,
+    )
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # test set has 10 utterances only
+    monkeypatch.setattr(evaluation, "_early_stop_min_chunk", 3)
+
+
+def _early_stopping(tmp_path, **kwargs) -> dict:
+    out_path = str(tmp_path / "out.yaml")
+    _evaluate(out_path, bootstrap=200, **kwargs)
+    with open(out_path) as f:
+        return yaml.safe_load(f)
+
+
+def test_converged(tmp_path):
+    output = _early_stopping(tmp_path, early_stop=1.0)
+    assert output["early_stopping"] == {"jitter": {"utterances": 3, "converged": True}}
+    assert set(output["confidence_intervals"]) == {"jitter", "shimmer"}
+
+
+def test_not_converged(tmp_path):
+    # metrics are not known within the tolerance, so all the utterances are evaluated
+    output = _early_stopping(
+        tmp_path, early_stop=1.0, metric_tolerances={"shimmer": 1e-6}
+    )
+    assert output["early_stopping"] == {
+        "jitter": {"utterances": 10, "converged": False}
+    }
+    assert output["metrics"] == pytest.approx(dict(_evaluate()))
+
+
+def test_time_budget(tmp_path):
+    output = _early_stopping(tmp_path, early_stop=1e-6, time_budget=0)
+    assert output["early_stopping"]["jitter"]["utterances"] == 3
+
+
+def test_conflicting_modes(tmp_path):
+    # modes which can't be combined raise instead of overriding each other
+    for kwargs in [
+        dict(stats_cache=str(tmp_path / "stats.sqlite")),
+        dict(secs_modes=["centroid"]),
+        dict(dedup=True),
+    ]:
+        with pytest.raises(ValueError):
+            _evaluate(early_stop=0.1, **kwargs)
+    assert evaluation._select_mode(0.1, None, False, None, None) == "early_stop"
+    assert evaluation._select_mode(None, "stats.sqlite", True, None, None) == (
+        "incremental_dedup"
+    )
+    assert evaluation._select_mode(None, "stats.sqlite", False, None, None) == (
+        "incremental"
+    )
+    # deduplication is opt-in, plain runs don't hash the audio
+    assert evaluation._select_mode(None, None, True, None, None) == "dedup"
+    assert evaluation._select_mode(None, None, False, None, None) == "plain"
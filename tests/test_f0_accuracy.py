@@ -6,7 +6,13 @@ Test f0 accuracy evaluator
 
 import os
 
-from speech_gen_eval.f0_accuracy import F0AccuracyEvaluator
+import librosa
+import numpy as np
+import pytest
+import soundfile as sf
+from scipy.stats import pearsonr
+
+from speech_gen_eval.f0_accuracy import F0AccuracyEvaluator, accuracy_stats
 from speech_gen_eval.ids import read_txt_and_mapping
 
 
@@ -31,3 +37,74 @@ def test_f0_accuracy():
             assert val == 0
         else:
             assert val == 1.0
+
+
+def test_accuracy_stats():
+    rng = np.random.default_rng(0)
+    pairs = []
+    for length in [50, 80, 1, 30]:
+        f0 = rng.uniform(80, 300, length)
+        f0_ref = f0 * rng.uniform(0.7, 1.3, length)
+        f0[rng.random(length) < 0.2] = np.nan
+        pairs.append((f0, f0_ref))
+    stats = accuracy_stats(pairs)
+    for i, (f0, f0_ref) in enumerate(pairs):
+        voiced = ~np.isnan(f0) & ~np.isnan(f0_ref)
+        log_f0, log_f0_ref = np.log(f0[voiced]), np.log(f0_ref[voiced])
+        diff = np.abs(log_f0 - log_f0_ref)
+        assert stats["count"][i] == voiced.sum()
+        assert stats["fine_errors_sum"][i] == np.sum((diff > 0.05) & (diff < 0.2))
+        assert stats["gross_errors_sum"][i] == np.sum(diff >= 0.2)
+        if voiced.sum() < 2:
+            # correlation of a single frame is undefined, it is not counted
+            assert stats["correlation_count"][i] == 0
+            assert stats["correlation_sum"][i] == 0
+        else:
+            correlation = pearsonr(log_f0, log_f0_ref)[0]
+            assert stats["correlation_count"][i] == voiced.sum()
+            assert stats["correlation_sum"][i] == pytest.approx(
+                correlation * voiced.sum()
+            )
+
+
+def test_alignment(tmp_path):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    wav_path = os.path.join(test_dir, "assets", "wav")
+    name = "p230_393"
+    y, sr = sf.read(os.path.join(wav_path, f"{name}.wav"), dtype="float32")
+    generated = tmp_path / "generated"
+    generated.mkdir()
+    # vocoder output which is a few frames shorter, and sped-up resynthesis
+    sf.write(generated / f"{name}.wav", y[: -3 * 512], sr)
+    sf.write(generated / "fast.wav", librosa.effects.time_stretch(y, rate=1.2), sr)
+    original = tmp_path / "original"
+    original.mkdir()
+    for x in [name, "fast"]:
+        sf.write(original / f"{x}.wav", y, sr)
+
+    stats = {}
+    for alignment in ["time", "dtw"]:
+        evaluator = F0AccuracyEvaluator(
+            [(name, ""), ("fast", "")],
+            generated_audio=str(generated),
+            original_audio=str(original),
+            ignore_errors=False,
+            f0_alignment=alignment,
+        )
+        stats[alignment] = evaluator.get_utterance_stats()
+    # truncated output is aligned in time, DTW isn't used for a few frames
+    assert stats["time"][name] == stats["dtw"][name]
+    metrics = dict(F0AccuracyEvaluator.metrics_from_stats(stats["time"][name]))
+    assert metrics["f0_correlation"] > 0.99
+    # frames of the sped-up speech at the same time don't match, DTW pairs
+    # more voiced frames with less errors
+    time_stats, dtw_stats = stats["time"]["fast"], stats["dtw"]["fast"]
+    assert dtw_stats["count"] > time_stats["count"]
+
+    def error_rate(x):
+        return (x["fine_errors_sum"] + x["gross_errors_sum"]) / x["count"]
+
+    assert error_rate(dtw_stats) < error_rate(time_stats)
+
+    with pytest.raises(ValueError):
+        F0AccuracyEvaluator([], str(generated), str(original), f0_alignment="linear")
@@ -0,0 +1,101 @@
+"""
+Copyright 2025 Balacoon
+
+Test manifests with precomputed durations and paths
+"""
+
+import os
+
+import pytest
+
+from speech_gen_eval.evaluation import speech_gen_eval
+from speech_gen_eval.ids import read_manifest_ids, read_txt_and_mapping
+from speech_gen_eval.manifest import (
+    Manifest,
+    build_manifest,
+    main,
+    read_manifest,
+    write_manifest,
+)
+
+
+@pytest.mark.parametrize("ext", [".jsonl", ".parquet"])
+def test_manifest(tmp_path, ext, assets):
+    txt_path, wav_path, mapping_path = assets["txt"], assets["wav"], assets["mapping"]
+    if ext == ".parquet":
+        pytest.importorskip("pyarrow")
+    path = str(tmp_path / f"manifest{ext}")
+    main(
+        [
+            "--txt",
+            txt_path,
+            "--generated-audio",
+            wav_path,
+            "--original-audio",
+            wav_path,
+            "--mapping",
+            mapping_path,
+            "--out",
+            path,
+        ]
+    )
+    manifest = read_manifest(path)
+    assert manifest.has_mapping
+
+    # same ids, texts and mapping as from the text files and audio directories
+    expected = read_txt_and_mapping(
+        txt_path,
+        wav_path,
+        mapping_path=mapping_path,
+        original_audio=wav_path,
+        ignore_missing=False,
+    )
+    assert read_manifest_ids(manifest, ignore_missing=False) == expected
+    for name, _ in expected[0]:
+        assert manifest.generated.duration(name) == pytest.approx(
+            manifest.generated.info(name).duration
+        )
+        assert (
+            manifest.generated.sample_rate(name)
+            == manifest.generated.info(name).samplerate
+        )
+
+
+def test_manifest_filters_by_duration(tmp_path, assets):
+    txt_path, wav_path = assets["txt"], assets["wav"]
+    rows = build_manifest(txt_path, wav_path)
+    rows[0]["duration"] = 0.1
+    # relative paths are resolved against the manifest directory
+    rows[1]["path"] = os.path.relpath(rows[1]["path"], tmp_path)
+    path = str(tmp_path / "manifest.jsonl")
+    write_manifest(rows, path)
+    manifest = read_manifest(path)
+    txt, mapping = read_manifest_ids(manifest)
+    assert mapping is None and manifest.original is None
+    assert [name for name, _ in txt] == [row["id"] for row in rows[1:]]
+    assert os.path.exists(manifest.generated.find(rows[1]["id"]))
+    with pytest.raises(ValueError):
+        read_manifest_ids(manifest, ignore_missing=False)
+
+
+def test_manifest_mixed_references(assets):
+    txt_path, wav_path, mapping_path = assets["txt"], assets["wav"], assets["mapping"]
+    rows = build_manifest(
+        txt_path, wav_path, original_audio=wav_path, mapping_path=mapping_path
+    )
+    # rows without a reference are compared to audio of the same id
+    rows[0].pop("reference")
+    txt, mapping = read_manifest_ids(Manifest(rows))
+    assert mapping[rows[0]["id"]] == rows[0]["id"]
+    assert mapping[rows[1]["id"]] == rows[1]["reference"]
+
+
+def test_evaluate_manifest(tmp_path, assets):
+    txt_path, wav_path = assets["txt"], assets["wav"]
+    path = str(tmp_path / "manifest.jsonl")
+    write_manifest(build_manifest(txt_path, wav_path), path)
+    expected = speech_gen_eval(txt_path, wav_path, "custom", evaluators=["jitter"])
+    metrics = speech_gen_eval(
+        None, None, "custom", evaluators=["jitter"], manifest_path=path
+    )
+    assert metrics == pytest.approx(expected)
@@ -0,0 +1,75 @@
+"""
+Copyright 2025 Balacoon
+
+Test sharded evaluation and merging of shards
+"""
+
+import os
+
+import pytest
+import yaml
+
+from speech_gen_eval.evaluation import speech_gen_eval
+from speech_gen_eval.ids import in_shard, parse_shard, read_txt_and_mapping
+from speech_gen_eval.merge import merge_shards
+from speech_gen_eval.opensmile import OpenSmileEvaluator
+
+
+def test_shards():
+    assert parse_shard("1/4") == (1, 4)
+    for shard in ["4/4", "1", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+    names = [f"utt_{i}" for i in range(100)]
+    # each id belongs to exactly one shard
+    for name in names:
+        assert sum(in_shard(name, (i, 3)) for i in range(3)) == 1
+
+
+def test_merge(tmp_path):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    txt_path = os.path.join(test_dir, "assets", "txt")
+    wav_path = os.path.join(test_dir, "assets", "wav")
+
+    ids, _ = read_txt_and_mapping(txt_path, wav_path, ignore_missing=False)
+    evaluator = OpenSmileEvaluator(ids, wav_path, ignore_errors=False)
+    expected = dict(evaluator.get_metric())
+
+    num_shards = 3
+    shard_paths = []
+    for i in range(num_shards):
+        shard_ids, _ = read_txt_and_mapping(
+            txt_path, wav_path, ignore_missing=False, shard=(i, num_shards)
+        )
+        evaluator = OpenSmileEvaluator(shard_ids, wav_path, ignore_errors=False)
+        shard_path = str(tmp_path / f"shard_{i}.yaml")
+        with open(shard_path, "w") as f:
+            yaml.dump(
+                {
+                    "shard": f"{i}/{num_shards}",
+                    "stats": {"jitter": evaluator.get_stats()},
+                    "model_name": "test",
+                },
+                f,
+            )
+        shard_paths.append(shard_path)
+
+    merged = merge_shards(shard_paths)
+    assert merged["model_name"] == "test"
+    assert merged["stats"]["jitter"]["count"] == len(ids)
+    for name, value in expected.items():
+        assert merged["metrics"][name] == pytest.approx(value, rel=1e-9)
+
+
+def test_secs_modes_are_not_sharded():
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    with pytest.raises(ValueError):
+        speech_gen_eval(
+            os.path.join(test_dir, "assets", "txt"),
+            os.path.join(test_dir, "assets", "wav"),
+            "custom",
+            original_audio=os.path.join(test_dir, "assets", "wav"),
+            evaluators=["ecapa2_secs"],
+            secs_modes=["centroid"],
+            shard="0/2",
+        )
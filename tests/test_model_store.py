@@ -0,0 +1,92 @@
+"""
+Copyright 2025 Balacoon
+
+Test model store
+"""
+
+import importlib
+import os
+import sys
+
+import pytest
+import torch
+
+from speech_gen_eval import model_store
+
+
+@pytest.fixture
+def fake_model(tmp_path, monkeypatch):
+    monkeypatch.setenv("SPEECH_GEN_EVAL_MODELS", str(tmp_path))
+    calls = []
+
+    def _fetch(spec, path):
+        calls.append(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"weights")
+
+    monkeypatch.setitem(model_store._fetchers, "fake", _fetch)
+    monkeypatch.setitem(
+        model_store._artifacts, "fake", {"kind": "fake", "path": "fake/model.bin"}
+    )
+    monkeypatch.setattr(model_store, "_offline", False)
+    return calls
+
+
+def test_model_store(fake_model):
+    # fetched on first use, then served from the store
+    path = model_store.get_model_path("fake")
+    assert os.path.isfile(path)
+    assert model_store.get_model_path("fake") == path
+    assert len(fake_model) == 1
+    assert model_store.verify_model("fake", checksum=True) == []
+
+    # corruption is detected
+    with open(path, "wb") as f:
+        f.write(b"wEights")
+    assert model_store.verify_model("fake") == []
+    assert len(model_store.verify_model("fake", checksum=True)) == 1
+
+
+def test_offline(fake_model, monkeypatch):
+    monkeypatch.setattr(model_store, "_offline", True)
+    with pytest.raises(FileNotFoundError):
+        model_store.get_model_path("fake")
+    assert len(fake_model) == 0
+
+
+def test_empty_model(fake_model, monkeypatch):
+    # a fetch which stores nothing doesn't pass verification
+    monkeypatch.setitem(
+        model_store._fetchers, "fake", lambda spec, path: os.makedirs(path)
+    )
+    model_store.fetch_model("fake")
+    assert len(model_store.verify_model("fake")) == 1
+
+
+def test_torch_hub_checkout(tmp_path, monkeypatch):
+    # checkout of the repo is named after its default branch, which is not always master
+    hub_dir = tmp_path / "hub"
+    repo_dir = hub_dir / "owner_repo_main"
+    repo_dir.mkdir(parents=True)
+    (repo_dir / "hub_model.py").write_text(
+        "import torch\n\n\nclass Model(torch.nn.Module):\n    pass\n"
+    )
+    monkeypatch.syspath_prepend(str(repo_dir))
+    monkeypatch.setattr(torch.hub, "get_dir", lambda: str(hub_dir))
+
+    def _load(repo, model, trust_repo=False, **kwargs):
+        assert trust_repo
+        return importlib.import_module("hub_model").Model()
+
+    def _script(model):
+        raise RuntimeError("can't be scripted")
+
+    monkeypatch.setattr(torch.hub, "load", _load)
+    monkeypatch.setattr(torch.jit, "script", _script)
+    path = str(tmp_path / "store" / "model")
+    spec = {"repo": "owner/repo", "model": "Model", "kwargs": {}}
+    model_store._fetch_torch_hub(spec, path)
+    assert os.path.isfile(os.path.join(path, "code", "hub_model.py"))
+    assert os.path.isfile(os.path.join(path, "model.pt"))
+    sys.modules.pop("hub_model", None)
@@ -0,0 +1,133 @@
+"""
+Copyright 2025 Balacoon
+
+Test live counters and progress of a run
+"""
+
+import os
+import urllib.request
+
+import pytest
+
+from speech_gen_eval import monitoring
+from speech_gen_eval.audio_dir import convert_audio_dir
+
+
+def _samples(exposition: str) -> dict[str, float]:
+    return {
+        name: float(value)
+        for name, value in (
+            line.rsplit(" ", 1)
+            for line in exposition.splitlines()
+            if line and not line.startswith("#")
+        )
+    }
+
+
+def test_inactive():
+    # no-op when monitoring is not active
+    with monitoring.task("utmos", 3) as info:
+        info["evaluated"] = 3
+        monitoring.advance(2, failed=1)
+    assert list(monitoring.progress([1, 2, 3])) == [1, 2, 3]
+
+
+def test_counters():
+    monitor = monitoring.Monitor()
+    with monitor.task("cer", 4) as info:
+        monitor.advance(2, seconds=3.0)
+        monitor.set_queue_depth("cer", 2)
+        state = monitor.snapshot()
+        assert state["current"] == "cer"
+        assert state["tasks"]["cer"]["done"] == 2
+        assert state["queues"] == {"cer": 2}
+        assert state["progress"] == pytest.approx(0.5)
+        assert state["eta"] is not None
+        info["evaluated"] = 3
+    state = monitor.snapshot()
+    record = state["tasks"]["cer"]
+    # task is over, the utterance without statistics is failed
+    assert record["done"] == 4
+    assert record["failed"] == 1
+    assert record["audio_seconds"] == 3.0
+    assert record["rtf"] is not None
+    assert state["queues"] == {}
+
+    # next chunk of the same task
+    with monitor.task("cer", 2):
+        monitor.expect(2)
+        monitor.advance(3, failed=1)
+        assert monitor.snapshot()["tasks"]["cer"]["done"] == 7
+    record = monitor.snapshot()["tasks"]["cer"]
+    assert record["total"] == 8
+    assert record["failed"] == 2
+
+
+def test_failed_task():
+    monitor = monitoring.Monitor()
+    with pytest.raises(RuntimeError):
+        with monitor.task("utmos", 4):
+            monitor.advance(1)
+            assert monitor.current_task == "utmos"
+            raise RuntimeError("model crashed")
+    assert monitor.current_task == "main"
+    # a crashed task is not complete, the rest of its items failed
+    state = monitor.snapshot()
+    record = state["tasks"]["utmos"]
+    assert record["done"] == 1
+    assert record["failed"] == 3
+    assert state["progress"] == pytest.approx(0.25)
+
+
+def test_weights():
+    monitor = monitoring.Monitor()
+    monitor.set_weights({"convert_audio_dir": 1.0, "cer": 3.0})
+    with monitor.task("convert_audio_dir", 10):
+        monitor.advance(10)
+    # evaluator is not started yet
+    assert monitor.snapshot()["progress"] == pytest.approx(0.25)
+    with monitor.task("cer", 10):
+        monitor.advance(5)
+        assert monitor.snapshot()["progress"] == pytest.approx(0.625)
+    assert monitor.snapshot()["progress"] == pytest.approx(1.0)
+
+
+def test_monitor_run(tmp_path):
+    textfile = str(tmp_path / "run.prom")
+    with monitoring.monitor_run(
+        textfile=textfile, port=0, display=True, interval=0.05
+    ) as monitor:
+        with monitoring.task("utmos", 6) as info:
+            for batch in monitoring.progress([[1, 2], [3, 4], [5, 6]], items=len):
+                pass
+            info["evaluated"] = 5
+        url = f"http://127.0.0.1:{monitor.port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            samples = _samples(response.read().decode())
+        assert samples['speech_gen_eval_items_done_total{task="utmos"}'] == 6
+        assert samples['speech_gen_eval_items_failed_total{task="utmos"}'] == 1
+        assert samples["speech_gen_eval_progress_ratio"] == 1.0
+        assert samples["speech_gen_eval_resident_memory_bytes"] > 0
+        line = monitor.progress_line()
+        assert "total 100.0%" in line
+    # final counters are written on exit
+    with open(textfile) as f:
+        samples = _samples(f.read())
+    assert samples['speech_gen_eval_items{task="utmos"}'] == 6
+    assert not [x for x in os.listdir(tmp_path) if x.endswith(".tmp")]
+    assert monitoring._active is None
+
+
+def test_conversion(tmp_path):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    wav_dir = os.path.join(test_dir, "assets", "wav")
+    names = sorted(os.path.splitext(x)[0] for x in os.listdir(wav_dir))
+    ids = [(x, "") for x in names] + [("missing", "")]
+    with monitoring.monitor_run(display=False) as monitor:
+        with convert_audio_dir(wav_dir, ids, njobs=2):
+            pass
+    record = monitor.snapshot()["tasks"]["convert_audio_dir"]
+    assert record["done"] == len(ids)
+    assert record["failed"] == 1
+    assert record["audio_seconds"] > 0
@@ -0,0 +1,89 @@
+"""
+Copyright 2025 Balacoon
+
+Test onnx backend: parity of exported models with the torch ones
+"""
+
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from speech_gen_eval import model_store, onnx_backend
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+
+def _require_model(name: str):
+    """
+    Skip the test if the model is neither in the store nor can be fetched, i.e. offline
+    """
+    try:
+        model_store.get_model_path(name)
+    except Exception as e:
+        pytest.skip(f"{name} model is not available: {e}")
+
+
+class _TinyEmbedder(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv1d(1, 8, kernel_size=400, stride=160)
+
+    def forward(self, wav: torch.Tensor) -> torch.Tensor:
+        return torch.relu(self.conv(wav.unsqueeze(1))).mean(dim=2)
+
+
+@pytest.fixture
+def tiny_model(tmp_path, monkeypatch):
+    monkeypatch.setenv("SPEECH_GEN_EVAL_MODELS", str(tmp_path))
+    monkeypatch.setitem(
+        onnx_backend._export_specs,
+        "tiny",
+        {
+            "inputs": {"wav": ("float32", (1, 16000))},
+            "outputs": ["embedding"],
+            "dynamic_axes": {"wav": {1: "time"}},
+        },
+    )
+    torch.manual_seed(0)
+    model = torch.jit.script(_TinyEmbedder().eval())
+    monkeypatch.setattr(onnx_backend, "load_torch_model", lambda name, device: model)
+    return model
+
+
+def _check_parity(torch_model, onnx_model, inputs):
+    with torch.no_grad():
+        expected = torch_model(*inputs).float().cpu().numpy()
+    actual = onnx_model(*inputs).float().numpy()
+    np.testing.assert_allclose(actual, expected, rtol=1e-3, atol=1e-4)
+
+
+def test_export_dynamic_axes(tiny_model):
+    # export is an explicit step
+    with pytest.raises(FileNotFoundError, match="fetch-models --onnx"):
+        onnx_backend.load_onnx_model("tiny")
+    onnx_backend.export_model("tiny")
+    onnx_model = onnx_backend.load_onnx_model("tiny")
+    # exported with 1s example, runs on other lengths
+    for length in [8000, 16000, 48000]:
+        inputs = onnx_backend.example_inputs("tiny", length=length)
+        _check_parity(tiny_model, onnx_model, inputs)
+    # against the outputs saved with the export, without the torch model
+    onnx_backend.check_parity("tiny")
+
+
+@pytest.mark.parametrize("name", onnx_backend.model_names)
+def test_model_parity(name):
+    """
+    Parity with the outputs of the torch model saved with the export, runs on CPU.
+    Models traced on GPU are exported only on a GPU machine
+    """
+    exported = os.path.isfile(onnx_backend.reference_path(name))
+    if not exported:
+        if name in ["utmos", "ecapa"] and not torch.cuda.is_available():
+            pytest.skip(f"{name} is not exported, it has to be exported on GPU")
+        _require_model(name)
+        onnx_backend.export_model(name)
+    onnx_backend.check_parity(name)
@@ -4,10 +4,15 @@ Copyright 2025 Balacoon
 Test opensmile evaluator
 """
 
+import glob
 import os
 
+import numpy as np
+import opensmile
+
+from speech_gen_eval.combined_evaluator import metrics_from_stats
 from speech_gen_eval.ids import read_txt_and_mapping
-from speech_gen_eval.opensmile import OpenSmileEvaluator
+from speech_gen_eval.opensmile import OpenSmileEvaluator, _config_path
 
 
 def test_opensmile():
@@ -27,3 +32,26 @@ def test_opensmile():
     for name, val in metrics:
         assert val > 0
         assert name in ["jitter", "shimmer"]
+
+
+def test_no_results():
+    # metrics are kept in the output even if no utterance yields them
+    evaluator = OpenSmileEvaluator([], "", ignore_errors=True)
+    assert evaluator.get_metric() == [("jitter", 0.0), ("shimmer", 0.0)]
+    assert metrics_from_stats({"jitter": {}}) == [("jitter", 0.0), ("shimmer", 0.0)]
+
+
+def test_reduced_config_matches_egemaps():
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    wav_paths = sorted(glob.glob(os.path.join(test_dir, "assets", "wav", "*.wav")))
+    egemaps = opensmile.Smile(
+        feature_set=opensmile.FeatureSet.eGeMAPSv02,
+        feature_level=opensmile.FeatureLevel.Functionals,
+    )
+    reduced = opensmile.Smile(feature_set=_config_path, feature_level="func")
+    names = ["jitterLocal_sma3nz_amean", "shimmerLocaldB_sma3nz_amean"]
+    for path in wav_paths:
+        expected = egemaps.process_file(path)[names].to_numpy()
+        features = reduced.process_file(path)
+        assert list(features.columns) == names
+        np.testing.assert_allclose(features.to_numpy(), expected, rtol=1e-6)
@@ -0,0 +1,56 @@
+"""
+Copyright 2025 Balacoon
+
+Test evaluation plan
+"""
+
+import os
+
+import numpy as np
+
+from speech_gen_eval.features import f0_cache_path
+from speech_gen_eval.ids import read_txt_and_mapping
+from speech_gen_eval.plan import EvaluationPlan
+
+
+def test_plan_inputs(assets):
+    txt_path, wav_path, mapping_path = assets["txt"], assets["wav"], assets["mapping"]
+    ids, mapping = read_txt_and_mapping(
+        txt_path, wav_path, mapping_path=mapping_path, original_audio=wav_path
+    )
+    names = sorted(name for name, _ in ids)
+
+    # evaluators reading only generated audio don't need original audio converted
+    plan = EvaluationPlan(["utmos", "jitter"], ids, mapping)
+    assert sorted(plan.generated) == names
+    assert plan.original == []
+    assert plan.features == {}
+
+    # speaker similarity reads only mapping targets
+    plan = EvaluationPlan(["ecapa2_secs"], ids, mapping)
+    assert plan.original == sorted(set(mapping.values()))
+
+    # F0 is computed once for both F0 evaluators, on generated and same-id original audio
+    plan = EvaluationPlan(["f0stats", "f0accuracy"], ids, mapping)
+    assert plan.original == names
+    assert plan.features == {"f0": {"generated": names, "original": names}}
+
+
+def test_plan_estimate_and_features(tmp_path, assets):
+    txt_path, wav_path = assets["txt"], assets["wav"]
+    ids, _ = read_txt_and_mapping(txt_path, wav_path)
+    plan = EvaluationPlan(["f0stats"], ids[:2])
+    estimate = plan.estimate(wav_path)
+    assert estimate["f0"] > 0
+    assert estimate["f0stats"] > 0
+    assert "shared_features" in plan.describe(wav_path)
+
+    # shared features are cached next to the audio
+    for name, _ in ids[:2]:
+        os.symlink(
+            os.path.join(wav_path, name + ".wav"), os.path.join(tmp_path, name + ".wav")
+        )
+    plan.compute_shared_features(str(tmp_path), None, ignore_errors=False)
+    for name, _ in ids[:2]:
+        f0 = np.load(f0_cache_path(os.path.join(tmp_path, name + ".wav")))
+        assert np.sum(~np.isnan(f0)) > 0
@@ -0,0 +1,64 @@
+"""
+Copyright 2025 Balacoon
+
+Test CPU low-precision modes and the drift check
+"""
+
+import os
+
+import pytest
+import torch
+
+from speech_gen_eval import model_store, precision
+from speech_gen_eval.combined_evaluator import CombinedEvaluator
+
+
+def _require_model(name: str):
+    """
+    Skip the test if the model is neither in the store nor can be fetched, i.e. offline
+    """
+    try:
+        model_store.get_model_path(name)
+    except Exception as e:
+        pytest.skip(f"{name} model is not available: {e}")
+
+
+def test_quantize_int8():
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.ReLU()).eval()
+    x = torch.randn(4, 64)
+    quantized = precision.quantize_int8(model)
+    assert not isinstance(quantized[0], torch.nn.Linear)
+    assert torch.allclose(quantized(x), model(x), atol=0.05)
+
+
+def test_autocast():
+    model = torch.nn.Linear(16, 16)
+    x = torch.randn(2, 16)
+    with precision.autocast("bf16"):
+        assert model(x).dtype == torch.bfloat16
+    with precision.autocast("fp32"):
+        assert model(x).dtype == torch.float32
+
+
+def test_unsupported_precision():
+    with pytest.raises(ValueError):
+        CombinedEvaluator(
+            ["jitter"], ids=[], generated_audio="", precisions={"jitter": "int8"}
+        )
+
+
+@pytest.mark.parametrize("mode", ["bf16", "int8"])
+def test_drift(mode):
+    for name in ["whisper", "aesthetics"]:
+        _require_model(name)
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    txt_path = os.path.join(test_dir, "assets", "txt")
+    wav_path = os.path.join(test_dir, "assets", "wav")
+    report = precision.check_drift(
+        txt_path, wav_path, ["cer", "aesthetics"], mode, num_utterances=4
+    )
+    assert report["utterances"] == 4
+    assert abs(report["metrics"]["whisperv3_cer"]["delta"]) < 0.05
+    for axis in ["enjoyment", "usefullness", "complexity", "quality"]:
+        assert abs(report["metrics"][f"aesthetics_{axis}"]["delta"]) < 0.5
@@ -0,0 +1,87 @@
+"""
+Copyright 2025 Balacoon
+
+Test profiling instrumentation
+"""
+
+import json
+import threading
+import time
+
+from speech_gen_eval import profiling
+
+
+def test_profiling(tmp_path):
+    # no-op when profiling is not active
+    with profiling.stage("inference", items=2) as span:
+        assert span["items"] == 2
+
+    with profiling.profile_run() as profiler:
+        with profiling.evaluator("utmos"):
+            with profiling.stage("model_load"):
+                pass
+            for _ in range(3):
+                with profiling.stage("inference", items=2, queue_wait=0.5):
+                    sum(range(10000))
+        with profiling.evaluator("cer"):
+            with profiling.stage("inference") as span:
+                span["items"] = 5
+    summary = profiler.summary()
+    assert set(summary.keys()) == {"utmos", "cer"}
+    assert summary["utmos"]["inference"]["calls"] == 3
+    assert summary["utmos"]["inference"]["items"] == 6
+    assert summary["utmos"]["inference"]["queue_wait"] == 1.5
+    assert summary["cer"]["inference"]["items"] == 5
+    assert summary["utmos"]["total"]["wall_time"] >= (
+        summary["utmos"]["inference"]["wall_time"]
+    )
+
+    chrome_path = str(tmp_path / "trace.json")
+    profiler.save_trace(chrome_path)
+    with open(chrome_path) as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == 7
+    assert all(x["ph"] == "X" for x in events)
+
+    otel_path = str(tmp_path / "trace.jsonl")
+    profiler.save_trace(otel_path)
+    with open(otel_path) as f:
+        spans = [json.loads(line) for line in f]
+    by_name = {x["name"]: x for x in spans}
+    # stages are children of the evaluator span
+    assert by_name["utmos.model_load"]["parent_span_id"] == (
+        by_name["utmos.total"]["span_id"]
+    )
+    assert by_name["utmos.total"]["parent_span_id"] is None
+
+
+def test_threads():
+    with profiling.profile_run() as profiler:
+        with profiling.evaluator("convert_audio_dir"):
+
+            def _decode():
+                with profiling.stage("decode", items=1):
+                    end = time.thread_time() + 0.05
+                    while time.thread_time() < end:
+                        pass
+
+            workers = [
+                threading.Thread(target=profiling.propagate(_decode)) for _ in range(4)
+            ]
+            for x in workers:
+                x.start()
+            # the evaluator of another thread doesn't leak into the workers
+            with profiling.evaluator("utmos"):
+                for x in workers:
+                    x.join()
+        # threads without a propagated context record to "main"
+        worker = threading.Thread(target=_decode)
+        worker.start()
+        worker.join()
+    summary = profiler.summary()
+    decode = summary["convert_audio_dir"]["decode"]
+    assert decode["calls"] == 4
+    # each span counts CPU time of its own thread only
+    assert decode["cpu_time"] < 4 * 0.05 * 1.5
+    assert summary["main"]["decode"]["calls"] == 1
+    assert "decode" not in summary["utmos"]
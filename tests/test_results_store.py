@@ -0,0 +1,65 @@
+"""
+Copyright 2025 Balacoon
+
+Test the SQLite results store and queries across runs
+"""
+
+import os
+
+import pytest
+import yaml
+
+from speech_gen_eval.evaluation import speech_gen_eval
+from speech_gen_eval.results_store import ResultsStore, compare_main, worst_main
+
+
+def test_compare_and_worst(tmp_path, jitter_stats):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    baseline = [0.01, 0.02, 0.03, 0.04]
+    new = [0.01, 0.05, 0.01, 0.04]
+    run_a = store.add_run(
+        "ckpt_a", [("jitter", 0.025), ("shimmer", 0.1)], jitter_stats(baseline)
+    )
+    run_b = store.add_run(
+        "ckpt_b", [("jitter", 0.0275), ("shimmer", 0.1)], jitter_stats(new)
+    )
+    assert store.resolve_run("ckpt_b") == run_b
+    assert store.resolve_run(str(run_a)) == run_a
+    with pytest.raises(ValueError):
+        store.resolve_run("ckpt_c")
+
+    comparison = store.compare(run_a, run_b)
+    assert comparison["jitter"]["delta"] == pytest.approx(0.0025)
+    # jitter is better when lower, only the utterance which got higher regressed
+    assert [x["utterance"] for x in comparison["jitter"]["regressed"]] == ["utt1"]
+    assert comparison["jitter"]["regressed"][0]["delta"] == pytest.approx(0.03)
+    assert comparison["shimmer"]["regressed"] == []
+
+    worst = store.worst(run_b, metric="jitter", top=2)
+    assert [x["utterance"] for x in worst["jitter"]] == ["utt1", "utt3"]
+    store.close()
+
+
+def test_evaluate_to_results_store(tmp_path, capsys):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    db = str(tmp_path / "results.sqlite")
+    for system in ["ckpt_a", "ckpt_b"]:
+        speech_gen_eval(
+            os.path.join(test_dir, "assets", "txt"),
+            os.path.join(test_dir, "assets", "wav"),
+            "custom",
+            evaluators=["jitter"],
+            results_db=db,
+            system=system,
+        )
+    out_path = str(tmp_path / "compare.yaml")
+    compare_main(["--db", db, "ckpt_a", "ckpt_b", "--out", out_path])
+    with open(out_path) as f:
+        comparison = yaml.safe_load(f)
+    # same audio, nothing regressed
+    assert comparison["jitter"]["delta"] == 0
+    assert comparison["jitter"]["regressed"] == []
+
+    worst_main(["--db", db, "ckpt_b", "--metric", "shimmer", "--top", "3"])
+    worst = yaml.safe_load(capsys.readouterr().out)
+    assert len(worst["shimmer"]) == 3
@@ -8,12 +8,18 @@ import os
 
 import numpy as np
 import pytest
+import torch
 
+from speech_gen_eval import secs
 from speech_gen_eval.ids import read_txt_and_mapping
 from speech_gen_eval.secs import (
     ECAPA2SECSEvaluator,
     ECAPASECSEvaluator,
     ReDimNetSECSEvaluator,
+    eer_from_histograms,
+    pair_similarity,
+    similarity_matrix_stats,
+    speaker_centroids,
 )
 
 
@@ -60,3 +66,89 @@ def test_quality(evaluator_cls):
         name, val = metrics[0]
         assert name == "ecapa_secs" or name == "ecapa2_secs" or name == "redimnet_secs"
         check_secs(val)
+
+
+def _normalize(x):
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _speaker_embeddings(num_speakers=20, per_speaker=5, noise=0.3, seed=0):
+    # same speakers for every seed, only the utterance noise differs
+    speakers = _normalize(np.random.default_rng(0).normal(size=(num_speakers, 64)))
+    rng = np.random.default_rng(seed + 1)
+    labels = np.repeat(np.arange(num_speakers), per_speaker)
+    emb = speakers[labels] + noise * rng.normal(size=(len(labels), 64)) / 8
+    return _normalize(emb), labels
+
+
+def test_pair_similarity():
+    gen, _ = _speaker_embeddings(seed=0)
+    ref, _ = _speaker_embeddings(seed=1)
+    gen_ref = np.arange(len(gen))[::-1]
+    expected = [np.dot(gen[i], ref[j]) for i, j in enumerate(gen_ref)]
+    assert np.allclose(pair_similarity(gen, ref, gen_ref), expected)
+
+
+def test_speaker_centroids():
+    ref, labels = _speaker_embeddings()
+    centroids = speaker_centroids(ref, labels, 20)
+    assert centroids.shape == (20, 64)
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0)
+    # centroid is closer to the speaker's references than any single reference
+    gen, gen_labels = _speaker_embeddings(seed=1)
+    to_centroid = pair_similarity(gen, centroids, gen_labels)
+    to_reference = pair_similarity(gen, ref, np.arange(len(gen)))
+    assert to_centroid.mean() > to_reference.mean()
+
+
+def test_similarity_matrix_stats():
+    ref, ref_labels = _speaker_embeddings(seed=0)
+    gen, gen_labels = _speaker_embeddings(seed=1)
+    nearest, target_hist, nontarget_hist = similarity_matrix_stats(
+        gen, ref, gen_labels, ref_labels
+    )
+    assert np.all(nearest == 1)
+    assert target_hist.sum() == 100 * 5
+    assert nontarget_hist.sum() == 100 * 95
+    assert eer_from_histograms(target_hist, nontarget_hist) < 0.01
+
+    # computing in blocks gives the same result
+    blocked = similarity_matrix_stats(
+        gen, ref, gen_labels, ref_labels, block_elements=7 * len(ref)
+    )
+    for x, y in zip(blocked, [nearest, target_hist, nontarget_hist]):
+        assert np.array_equal(x, y)
+
+    # unrelated embeddings can't be told apart
+    noise, _ = _speaker_embeddings(noise=1e3, seed=2)
+    _, target_hist, nontarget_hist = similarity_matrix_stats(
+        noise, ref, gen_labels, ref_labels
+    )
+    assert abs(eer_from_histograms(target_hist, nontarget_hist) - 0.5) < 0.15
+
+
+@pytest.mark.parametrize("dedup", [True, False])
+def test_embedding_dedup(dedup, monkeypatch):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    wav_dir = os.path.join(test_dir, "assets", "wav")
+    names = sorted(os.path.splitext(x)[0] for x in os.listdir(wav_dir))[:2]
+    embedded, hashed = [], []
+
+    def _extract_embedding(self, model, audio):
+        embedded.append(audio)
+        return torch.ones(1, 4)
+
+    def _audio_hash(audio):
+        hashed.append(audio)
+        return "same"
+
+    monkeypatch.setattr(ECAPASECSEvaluator, "_extract_embedding", _extract_embedding)
+    monkeypatch.setattr(secs, "audio_hash", _audio_hash)
+    evaluator = ECAPASECSEvaluator(
+        [(x, "") for x in names], wav_dir, wav_dir, dedup=dedup
+    )
+    embeddings = evaluator._extract_embeddings(None, names, wav_dir, "generated")
+    assert sorted(embeddings) == names
+    # audio is hashed only to be deduplicated
+    assert len(hashed) == (len(names) if dedup else 0)
+    assert len(embedded) == (1 if dedup else len(names))
@@ -0,0 +1,52 @@
+"""
+Copyright 2025 Balacoon
+
+Test in-memory evaluation session
+"""
+
+import os
+
+import pytest
+import soundfile as sf
+
+from speech_gen_eval.ids import read_txt_and_mapping
+from speech_gen_eval.session import EvaluationSession
+
+
+def _read_assets(num: int = 3):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    txt_path = os.path.join(test_dir, "assets", "txt")
+    wav_path = os.path.join(test_dir, "assets", "wav")
+    ids, _ = read_txt_and_mapping(txt_path, wav_path, ignore_missing=False)
+    generated, texts = {}, {}
+    sample_rate = None
+    for name, text in ids[:num]:
+        wav, sample_rate = sf.read(os.path.join(wav_path, name + ".wav"))
+        generated[name] = wav
+        texts[name] = text
+    return generated, texts, sample_rate
+
+
+def test_session():
+    generated, texts, sample_rate = _read_assets()
+    session = EvaluationSession(["jitter", "f0stats"], ignore_errors=False)
+    metrics = dict(session.evaluate(generated, sample_rate, texts=texts))
+    assert set(metrics) == {
+        "jitter",
+        "shimmer",
+        "log_f0_std",
+        "log_f0_delta_std",
+        "loudness_std",
+    }
+    assert all(val > 0 for val in metrics.values())
+
+    # second evaluation reuses the session, results are deterministic
+    assert dict(session.evaluate(generated, sample_rate)) == metrics
+
+
+def test_session_errors():
+    with pytest.raises(ValueError):
+        EvaluationSession(["unknown"])
+    generated, _, sample_rate = _read_assets(1)
+    with pytest.raises(ValueError):
+        EvaluationSession(["cer"]).evaluate(generated, sample_rate)
@@ -0,0 +1,73 @@
+"""
+Copyright 2025 Balacoon
+
+Test that CLI starts fast and imports only what it runs
+"""
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+# slow to import, startup time is checked by what is imported rather than timed
+_heavy_modules = [
+    "torch",
+    "transformers",
+    "utmosv2",
+    "audiobox_aesthetics",
+    "opensmile",
+    "librosa",
+    "scipy",
+    "huggingface_hub",
+]
+_script = """
+import json, sys
+from speech_gen_eval.main import main
+sys.argv = ["speech-gen-eval"] + {argv}
+try:
+    main()
+except SystemExit:
+    pass
+print(json.dumps([x for x in {heavy} if x in sys.modules]), file=sys.stderr)
+"""
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["--help"],
+        # argparse error: --evaluators requires --type custom
+        ["--txt", "txt", "--generated-audio", "wav", "--evaluators", "jitter"],
+    ],
+)
+def test_startup(argv):
+    assert _imported(_script.format(argv=argv, heavy=_heavy_modules)) == []
+
+
+def test_import_evaluation():
+    # evaluators and shared features import their dependencies when they run
+    script = (
+        "import json, sys\n"
+        "import speech_gen_eval.evaluation\n"
+        f"print(json.dumps([x for x in {_heavy_modules} if x in sys.modules]), "
+        "file=sys.stderr)\n"
+    )
+    assert _imported(script) == []
+
+
+def _imported(script: str) -> list[str]:
+    """
+    Run the script in a fresh interpreter, it prints imported heavy modules last
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def test_lazy_registry():
+    from speech_gen_eval.combined_evaluator import evaluator_names, name2evaluator
+
+    assert "jitter" in evaluator_names
+    assert name2evaluator["f0stats"].__name__ == "F0StatsEvaluator"
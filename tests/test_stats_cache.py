@@ -0,0 +1,96 @@
+"""
+Copyright 2025 Balacoon
+
+Test incremental evaluation with cached per-utterance statistics
+"""
+
+import os
+import shutil
+
+import pytest
+import soundfile as sf
+
+from speech_gen_eval.evaluation import speech_gen_eval
+from speech_gen_eval.opensmile import OpenSmileEvaluator
+from speech_gen_eval.stats_cache import evaluator_settings, utterance_keys
+
+
+def _evaluate(wav_dir, stats_cache=None):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    return speech_gen_eval(
+        os.path.join(test_dir, "assets", "txt"),
+        wav_dir,
+        "custom",
+        evaluators=["jitter"],
+        stats_cache=stats_cache,
+    )
+
+
+@pytest.fixture
+def evaluated_ids(monkeypatch):
+    """
+    Records ids the jitter evaluator actually evaluates
+    """
+    evaluated = []
+    get_utterance_stats = OpenSmileEvaluator.get_utterance_stats
+
+    def _recording(self):
+        evaluated.extend(name for name, _ in self._ids)
+        return get_utterance_stats(self)
+
+    monkeypatch.setattr(OpenSmileEvaluator, "get_utterance_stats", _recording)
+    return evaluated
+
+
+def test_incremental(tmp_path, evaluated_ids):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    wav_dir = str(tmp_path / "wav")
+    shutil.copytree(os.path.join(test_dir, "assets", "wav"), wav_dir)
+    stats_cache = str(tmp_path / "stats.sqlite")
+
+    expected = _evaluate(wav_dir)
+    evaluated_ids.clear()
+    assert _evaluate(wav_dir, stats_cache) == pytest.approx(expected)
+    assert len(evaluated_ids) == 10
+
+    # nothing changed, nothing is evaluated
+    evaluated_ids.clear()
+    assert _evaluate(wav_dir, stats_cache) == pytest.approx(expected)
+    assert evaluated_ids == []
+
+    # only the changed utterance is evaluated
+    name = sorted(os.listdir(wav_dir))[0]
+    wav, sr = sf.read(os.path.join(wav_dir, name))
+    sf.write(os.path.join(wav_dir, name), wav[: len(wav) // 2], sr)
+    evaluated_ids.clear()
+    metrics = _evaluate(wav_dir, stats_cache)
+    assert evaluated_ids == [os.path.splitext(name)[0]]
+    evaluated_ids.clear()
+    assert metrics == pytest.approx(_evaluate(wav_dir))
+
+
+def test_utterance_keys():
+    ids = [("a", "hello"), ("b", "world")]
+    hashes = {"a": "1", "b": "2"}
+    settings = evaluator_settings("cer", "torch", "fp32")
+    keys = utterance_keys("cer", settings, ids, hashes, {})
+    # text is a part of the key of evaluators using it
+    changed = utterance_keys("cer", settings, [("a", "hi"), ("b", "world")], hashes, {})
+    assert keys["a"] != changed["a"] and keys["b"] == changed["b"]
+    # so are the evaluator settings
+    int8 = utterance_keys(
+        "cer", evaluator_settings("cer", "torch", "int8"), ids, hashes, {}
+    )
+    assert keys["a"] != int8["a"]
+
+    # reference audio is a part of the key of evaluators reading it
+    settings = evaluator_settings("ecapa2_secs", "torch", "fp32")
+    keys = utterance_keys(
+        "ecapa2_secs", settings, ids, hashes, {"r1": "3"}, {"a": "r1", "b": "r2"}
+    )
+    assert list(keys) == ["a"]
+    # centroid and matrix modes depend on all the utterances
+    assert (
+        evaluator_settings("ecapa2_secs", "torch", "fp32", secs_modes=["matrix"])
+        is None
+    )
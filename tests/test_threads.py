@@ -0,0 +1,53 @@
+"""
+Copyright 2025 Balacoon
+
+Test CPU budget
+"""
+
+import os
+from multiprocessing import Pool
+
+import pytest
+
+from speech_gen_eval import threads
+
+
+def _worker_threads(_):
+    import torch
+
+    return os.environ["OMP_NUM_THREADS"], torch.get_num_threads()
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    for var in threads._thread_env_vars:
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setattr(threads, "_cpus", None)
+    yield
+    threads.set_cpus(None)
+
+
+def test_available_cpus():
+    assert 1 <= threads.available_cpus() <= os.cpu_count()
+
+
+def test_cgroup_limit(monkeypatch):
+    monkeypatch.setattr(threads, "_cgroup_cpu_limit", lambda: 0.5)
+    assert threads.available_cpus() == 1
+
+
+def test_set_cpus(budget):
+    threads.set_cpus(3)
+    assert threads.get_cpus() == 3
+    assert os.environ["OMP_NUM_THREADS"] == "3"
+    assert threads.pool_size() == 3
+    assert threads.pool_size(num_items=2) == 2
+    assert threads.pool_size(num_items=0) == 1
+
+
+def test_workers_are_single_threaded(budget):
+    threads.set_cpus(2)
+    with Pool(threads.pool_size(), initializer=threads.init_worker) as pool:
+        for env_threads, torch_threads in pool.map(_worker_threads, range(2)):
+            assert env_threads == "1"
+            assert torch_threads == 1
@@ -0,0 +1,105 @@
+"""
+Copyright 2025 Balacoon
+
+Test persistent transcript cache
+"""
+
+import os
+
+import numpy as np
+
+from speech_gen_eval.audio_dir import audio_hash, get_audio_items
+from speech_gen_eval.ids import read_txt_and_mapping
+from speech_gen_eval.transcript_cache import TranscriptCache, config_key
+from speech_gen_eval.whisperv3_intelligibility import WhisperV3IntelligibilityEvaluator
+
+
+def test_cache(tmp_path):
+    path = str(tmp_path / "transcripts.sqlite")
+    config = config_key("model", precision="fp32")
+    cache = TranscriptCache(path)
+    cache.put({"a": "hello", "b": "world"}, config)
+    cache.close()
+
+    # persisted, and keyed by the decoding config
+    cache = TranscriptCache(path)
+    assert cache.get(["a", "b", "c"], config) == {"a": "hello", "b": "world"}
+    assert cache.get(["a"], config_key("model", precision="int8")) == {}
+    assert config_key("m", a=1, b=2) == config_key("m", b=2, a=1)
+    cache.close()
+
+
+def test_audio_hash(tmp_path):
+    wav = np.random.default_rng(0).standard_normal(16000).astype(np.float32)
+    assert audio_hash(wav) == audio_hash(wav.copy())
+    wav[0] += 1
+    assert audio_hash(wav) != audio_hash(wav.copy() * 2)
+
+    a, b = tmp_path / "a.wav", tmp_path / "b.wav"
+    a.write_bytes(b"RIFF1")
+    b.write_bytes(b"RIFF2")
+    assert audio_hash(str(a)) != audio_hash(str(b))
+
+
+def test_cached_transcripts_are_rescored(tmp_path):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    txt_path = os.path.join(test_dir, "assets", "txt")
+    wav_path = os.path.join(test_dir, "assets", "wav")
+    ids, _ = read_txt_and_mapping(txt_path, wav_path, ignore_missing=False)
+
+    # all the transcripts are cached, so the model is never loaded
+    path = str(tmp_path / "transcripts.sqlite")
+    evaluator = WhisperV3IntelligibilityEvaluator(
+        ids, wav_path, ignore_errors=False, transcript_cache=path
+    )
+    texts = dict(ids)
+    cache = TranscriptCache(path)
+    cache.put(
+        {
+            audio_hash(audio): texts[name]
+            for name, audio in get_audio_items(wav_path, ids)
+        },
+        evaluator._decoding_config(""),
+    )
+    cache.close()
+    assert evaluator.get_metric() == [("whisperv3_cer", 0.0)]
+
+
+def test_bounded_transcripts_are_reused(tmp_path, monkeypatch):
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    txt_path = os.path.join(test_dir, "assets", "txt")
+    wav_path = os.path.join(test_dir, "assets", "wav")
+    ids, _ = read_txt_and_mapping(txt_path, wav_path, ignore_missing=False)
+    texts = dict(ids)
+    calls = []
+
+    def _pipe(inputs, batch_size, generate_kwargs):
+        calls.append(generate_kwargs["max_new_tokens"])
+        return [{"text": "hypothesis"} for _ in inputs]
+
+    monkeypatch.setattr(
+        WhisperV3IntelligibilityEvaluator, "_load_pipeline", lambda self: _pipe
+    )
+    path = str(tmp_path / "transcripts.sqlite")
+
+    def _evaluate():
+        evaluator = WhisperV3IntelligibilityEvaluator(
+            ids,
+            wav_path,
+            ignore_errors=False,
+            transcript_cache=path,
+            asr_decoding={"bounded": True},
+        )
+        evaluator._batch_size = 4
+        return evaluator, evaluator.get_utterance_stats()
+
+    evaluator, stats = _evaluate()
+    assert len(stats) == len(ids)
+    # references of different length are in batches of their own token cap
+    assert len(calls) < len(ids)
+    assert len(calls) >= len({evaluator._max_new_tokens(x) for x in texts.values()})
+    # second pass reuses all the transcripts
+    calls.clear()
+    _, cached_stats = _evaluate()
+    assert calls == []
+    assert cached_stats == stats
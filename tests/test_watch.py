@@ -0,0 +1,128 @@
+"""
+Copyright 2025 Balacoon
+
+Test evaluation of utterances as they are written to the directory
+"""
+
+import os
+import shutil
+import sys
+import threading
+import time
+
+import pytest
+import yaml
+
+from speech_gen_eval.evaluation import speech_gen_eval
+from speech_gen_eval.watch import DirectoryWatcher, watch
+
+
+@pytest.fixture(params=["inotify", "polling"])
+def watch_mode(request, monkeypatch):
+    if request.param == "inotify":
+        pytest.importorskip("inotify_simple")
+    else:
+        # without inotify_simple, the directory is polled
+        monkeypatch.setitem(sys.modules, "inotify_simple", None)
+    return request.param
+
+
+def test_directory_watcher(tmp_path, watch_mode, assets):
+    wav_path = assets["wav"]
+    name = sorted(os.listdir(wav_path))[0]
+    watcher = DirectoryWatcher(str(tmp_path), poll_interval=0.1)
+    # a file being written is not reported
+    with open(tmp_path / name, "wb") as f:
+        f.write(b"RIFF")
+        f.flush()
+        assert watcher.wait() == []
+        time.sleep(0.01)
+        f.write(b"data")
+        f.flush()
+        os.utime(f.name)
+        assert watcher.wait() == []
+    assert watcher.wait() + watcher.wait() == [os.path.splitext(name)[0]]
+    # nor files of other types, i.e. temporary ones
+    (tmp_path / "x.wav.tmp").write_bytes(b"data")
+    assert watcher.wait() + watcher.wait() == []
+    watcher.close()
+
+
+def test_watch(tmp_path, watch_mode, assets):
+    txt_path, wav_path = assets["txt"], assets["wav"]
+    out_dir = tmp_path / "generated"
+    out_dir.mkdir()
+    names = sorted(os.listdir(wav_path))
+
+    def _synthesize():
+        # files appear over time, written to a temporary name and moved in
+        for name in names:
+            shutil.copy(os.path.join(wav_path, name), out_dir / (name + ".part"))
+            os.rename(out_dir / (name + ".part"), out_dir / name)
+            time.sleep(0.05)
+
+    writer = threading.Thread(target=_synthesize)
+    writer.start()
+    out_path = str(tmp_path / "metrics.yaml")
+    metrics = watch(
+        txt_path,
+        str(out_dir),
+        ["jitter"],
+        out_path,
+        poll_interval=0.1,
+        timeout=30,
+    )
+    writer.join()
+    expected = speech_gen_eval(txt_path, wav_path, "custom", evaluators=["jitter"])
+    assert metrics == pytest.approx(expected)
+    with open(out_path) as f:
+        output = yaml.safe_load(f)
+    assert output["evaluated"] == {"jitter": len(names)}
+
+
+def test_watch_timeout(tmp_path, assets):
+    txt_path, wav_path = assets["txt"], assets["wav"]
+    name = sorted(os.listdir(wav_path))[0]
+    shutil.copy(os.path.join(wav_path, name), tmp_path / name)
+    out_path = str(tmp_path / "metrics.yaml")
+    args = [txt_path, str(tmp_path), ["jitter"], out_path]
+    with pytest.raises(RuntimeError):
+        watch(*args, poll_interval=0.1, timeout=0.5)
+    # metrics of the evaluated ids are saved before raising
+    with open(out_path) as f:
+        assert yaml.safe_load(f)["evaluated"] == {"jitter": 1}
+    os.remove(out_path)
+    watch(*args, poll_interval=0.1, timeout=0.5, ignore_missing=True)
+    with open(out_path) as f:
+        output = yaml.safe_load(f)
+    assert output["evaluated"] == {"jitter": 1}
+    assert len(output["missing"]) == 9
+
+
+def test_watch_bad_file(tmp_path, assets):
+    txt_path, wav_path = assets["txt"], assets["wav"]
+    names = sorted(os.listdir(wav_path))
+    shutil.copy(os.path.join(wav_path, names[0]), tmp_path / names[0])
+    # corrupt file is skipped, the watch goes on
+    (tmp_path / names[1]).write_bytes(b"not audio")
+    out_path = str(tmp_path / "metrics.yaml")
+    with pytest.raises(RuntimeError):
+        watch(
+            txt_path,
+            str(tmp_path),
+            ["jitter"],
+            out_path,
+            poll_interval=0.1,
+            timeout=0.5,
+        )
+    with open(out_path) as f:
+        output = yaml.safe_load(f)
+    assert output["evaluated"] == {"jitter": 1}
+    assert output["failed"] == [os.path.splitext(names[1])[0]]
+
+
+def test_watch_requires_original_audio(tmp_path, assets):
+    txt_path = assets["txt"]
+    # checked before watching, not after the first batch
+    with pytest.raises(ValueError):
+        watch(txt_path, str(tmp_path), ["f0accuracy"], str(tmp_path / "out.yaml"))
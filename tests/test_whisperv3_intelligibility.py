@@ -27,3 +27,23 @@ def test_intelligibility():
     name, val = metrics[0]
     assert name == "whisperv3_cer"
     assert val < 0.02
+
+
+def test_bounded_decoding():
+    evaluator = WhisperV3IntelligibilityEvaluator(
+        [("a", "hello")], "", asr_decoding={"language": "en", "bounded": True}
+    )
+    kwargs = evaluator._generate_kwargs("hello")
+    assert kwargs["language"] == "en"
+    assert kwargs["num_beams"] == 1 and not kwargs["do_sample"]
+    # rounded up to the step
+    assert kwargs["max_new_tokens"] == evaluator._token_cap_step
+    assert kwargs["max_new_tokens"] >= 5 + evaluator._extra_tokens
+    # capped by the decoder length, and a part of the transcript cache key
+    long_kwargs = evaluator._generate_kwargs("a" * 10000)
+    assert long_kwargs["max_new_tokens"] == evaluator._max_target_tokens
+    assert evaluator._decoding_config("hello") == evaluator._decoding_config("hi")
+    assert evaluator._decoding_config("hello") != evaluator._decoding_config("a" * 100)
+
+    unbounded = WhisperV3IntelligibilityEvaluator([("a", "hello")], "")
+    assert unbounded._generate_kwargs("hello") == {}